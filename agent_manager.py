@@ -1,48 +1,125 @@
 import os
-import toml
+import re
+import json
+import time
+import hashlib
 import asyncio
-from openai import OpenAI
-from agents import Agent, FileSearchTool, enable_verbose_stdout_logging, Runner, ItemHelpers
+from typing import List, Optional
+from agents import Agent, FileSearchTool, enable_verbose_stdout_logging, Runner, ItemHelpers, function_tool, set_default_openai_client
+from agent_registry import load_secrets, registry as shared_registry
+from listings_index import load_listings_index
+from listing_facets import load_listing_facets
+from local_search import load_local_index
+from hybrid_search import load_hybrid_search, hosted_vector_search, local_vector_search
+from response_cache import get_response_cache, normalise_query
+from request_scheduler import SingleFlight
+from conversation_history import ConversationHistory
+from review_store import load_review_store, load_review_summaries, format_review_summary
+from latency_tracing import get_tracer
+from query_router import load_query_router, OFF_TOPIC_REPLY
+
+# Hosted chunks are at most 400 tokens (vector.HOSTED_CHUNKING), so file_search adds at most ~4k tokens per call
+FILE_SEARCH_MAX_RESULTS = 10
+
+# "reviews for listing 30719520", "what do guests say about 30719520?"
+_LISTING_IDS = re.compile(r"\b\d{5,}\b")
+# Review questions that need the agent: comparisons and searches ("places like 266445 but with better reviews")
+_NOT_A_REVIEW_LOOKUP = re.compile(
+    r"\b(compar\w*|versus|vs|better|worse|similar|than|instead|alternatives?|find|looking for|search|show me"
+    r"|book|places|listings|somewhere|others?)\b",
+    re.IGNORECASE,
+)
 
 class AgentManager:
-    def __init__(self, api_key=None, user=None):
-        """Initialize the agent manager"""
+    def __init__(self, api_key=None, user=None, response_cache=None, registry=None, tracer=None,
+                 secrets=None, runner=None):
+        """Initialize the per-session agent manager; clients and agents come from the shared registry"""
+        started = time.perf_counter()
+        self.registry = registry or shared_registry
+        # Runner.run_streamed by default; benchmarks pass a fake runner
+        self.runner = runner or Runner
         self.client = None
         self.triage_agent = None
         self.agents = {}
         self.user = user
-        self.conversation_history = [{"role": "system", "content": "You are a helpful assistant."}]
         # Initialize vector stores
         self.listings_vector_store = None
         self.reviews_vector_store = None
         
-        # Load secrets from chainlit/secrets.toml manually, like in main.py
-        secrets_path = os.path.join(os.path.dirname(__file__), ".chainlit", "secrets.toml")
-        try:
-            secrets = toml.load(secrets_path)
-        except Exception as e:
-            raise RuntimeError(f"Failed to load secrets.toml: {e}")
+        # Secrets from .chainlit/secrets.toml, read once per process
+        if secrets is None:
+            secrets = load_secrets()
 
         # Extract keys, fallback to passed api_key arg
         self.api_key = api_key or secrets.get("openai", {}).get("api_key")
         if not self.api_key or not self.api_key.startswith("sk-"):
             raise ValueError("Missing or invalid OpenAI API key.")
 
+        # Retrieval backend: "hosted" OpenAI vector stores or the "local" offline index
+        self.retrieval_backend = secrets.get("retrieval", {}).get("backend", "hosted")
+        if self.retrieval_backend not in ("hosted", "local"):
+            raise ValueError(f"Unknown retrieval backend: {self.retrieval_backend}")
+        # Listings search fuses BM25 with the vector search when [retrieval] hybrid = true; off by default
+        # until it beats the plain vector search on labels not built from exact phrases
+        self.hybrid_listings = secrets.get("retrieval", {}).get("hybrid", False)
+        self.hybrid_fusion = (secrets.get("retrieval", {}).get("rrf_k", 20),
+                              secrets.get("retrieval", {}).get("vector_weight", 0.5))
+
         # Vector store IDs
         vectorstore_section = secrets.get("vectorstore", {})
         self.listings_vector_store = vectorstore_section.get("listings_vector_store_id")
         self.reviews_vector_store = vectorstore_section.get("reviews_vector_store_id")
 
-        if not self.listings_vector_store or not self.reviews_vector_store:
+        if self.retrieval_backend == "hosted" and (not self.listings_vector_store or not self.reviews_vector_store):
             raise ValueError("Missing vector store IDs in secrets.toml")
 
-
+        # Last K turns verbatim, older turns summarised, configured by the optional [history] section
+        self.conversation_history = ConversationHistory(**secrets.get("history", {}))
+
+        # Response cache shared by all sessions, configured by the optional [cache] section
+        cache_settings = dict(secrets.get("cache", {}))
+        if response_cache is not None:
+            self.response_cache = response_cache
+        elif cache_settings.pop("enabled", True):
+            self.response_cache = get_response_cache(**cache_settings)
+        else:
+            self.response_cache = None
+
+        # Local fast-path router ahead of the triage agent, configured by the optional [router] section
+        router_settings = dict(secrets.get("router", {}))
+        self.router = load_query_router(**router_settings) if router_settings.pop("enabled", True) else None
+
+        # Shared rate-limited, deduplicating queue for API calls, configured by the optional [scheduler] section
+        self.scheduler_settings = dict(secrets.get("scheduler", {}))
+        self.scheduler = None
+        # Identical queries asked at once in the same conversation state share one model run
+        self.inflight_queries = None
+        if self.scheduler_settings.pop("enabled", True):
+            if self.scheduler_settings.pop("coalesce_queries", True):
+                self.inflight_queries = self.registry.get("inflight_queries", SingleFlight)
+            self.scheduler = self.registry.request_scheduler(**self.scheduler_settings)
+
+        # Per-request latency spans, configured by the optional [tracing] section
+        self.tracer = tracer or get_tracer(**secrets.get("tracing", {}))
+
+        self.setup_seconds = time.perf_counter() - started
+
+    @classmethod
+    async def create(cls, **kwargs):
+        """Build a manager and its agents in a worker thread, so the first session's index and
+        model loading never blocks the event loop"""
+        def build():
+            manager = cls(**kwargs)
+            manager.initialize_agents()
+            return manager
+        return await asyncio.to_thread(build)
 
     def _ensure_client(self):
         if not self.client:
             os.environ["OPENAI_API_KEY"] = self.api_key
-            self.client = OpenAI(api_key=self.api_key)
-            print(f"OpenAI client initialized with key starting: {self.api_key[:5]}...")
+            # One pooled AsyncOpenAI client serves every session and the runner's model calls
+            self.client = self.registry.async_openai_client(self.api_key, self.scheduler)
+            set_default_openai_client(self.client)
         return self.client
 
     def initialize_agents(self):
@@ -51,16 +128,24 @@ class AgentManager:
         if self.triage_agent:
             return self.triage_agent
 
-        self.agents["listings_agent"] = self._create_listings_agent()
-        self.agents["reviews_agent"] = self._create_reviews_agent()
+        # Agents hold no per-session state, so every session with the same settings shares them
+        agents_key = ("agents", self.api_key, self.retrieval_backend, self.hybrid_listings, self.hybrid_fusion,
+                      self.listings_vector_store, self.reviews_vector_store, self.scheduler is not None)
+        self.triage_agent, self.agents = self.registry.get(agents_key, self._build_agents)
+        return self.triage_agent
 
-        self.triage_agent = self._create_triage_agent([
-            self.agents["listings_agent"],
-            self.agents["reviews_agent"]
+    def _build_agents(self):
+        agents = {
+            "listings_agent": self._create_listings_agent(),
+            "reviews_agent": self._create_reviews_agent(),
+        }
+        triage_agent = self._create_triage_agent([
+            agents["listings_agent"],
+            agents["reviews_agent"]
         ])
 
         print("Agents initialized successfully")
-        return self.triage_agent
+        return triage_agent, agents
 
 
     def _create_listings_agent(self):
@@ -75,7 +160,14 @@ Your tasks are:
    - Number of guests
    - Specific preferences (e.g., price range, amenities, property type, etc.)
 
-2. Search through the vector store to identify listings that best match the extracted criteria.
+2. If the query has hard constraints (price range, number of guests, bedrooms, number of nights, area, room type or required amenities),
+   call `filter_listings` first. It returns the exact set of listings satisfying them.
+   Then search the listings to rank and describe those candidates against the softer preferences
+   (views, vibe, style). Never recommend a listing that `filter_listings` excluded.
+   Without hard constraints, search the listings to identify listings that best match the extracted criteria.
+   Keep exact names from the query (places, landmarks, amenities, breeds...) in the search query.
+   Answer aggregate questions (cheapest areas, how many listings have a pool, average price in an area)
+   with `listing_facets` instead of listing individual results, and quote its figures.
 
 3. Return a list of matching listings, each following this exact structure:
    - **Listing ID** (required)
@@ -97,10 +189,130 @@ Your tasks are:
 
             """,
             tools=[
-                FileSearchTool(vector_store_ids=[self.listings_vector_store])
+                self._create_filter_listings_tool(),
+                self._create_listing_facets_tool(),
+                self._create_hybrid_search_tool() if self.hybrid_listings else self._create_search_tool("listings")
             ]
         )
 
+    def _create_search_tool(self, data_type):
+        """Document search tool for the configured retrieval backend"""
+        if self.retrieval_backend == "hosted":
+            vector_store_id = self.listings_vector_store if data_type == "listings" else self.reviews_vector_store
+            return FileSearchTool(vector_store_ids=[vector_store_id], max_num_results=FILE_SEARCH_MAX_RESULTS)
+
+        index = load_local_index(data_type)
+
+        @function_tool(name_override=f"search_{data_type}")
+        async def search_documents(query: str) -> str:
+            """Search the vector store documents and return the best matches.
+
+            Args:
+                query: What to search for, e.g. "quiet apartment near the beach" or a listing ID.
+            """
+            # Embedding and scoring run in a worker thread so other chats keep streaming
+            return json.dumps(await asyncio.to_thread(index.search_documents, query, k=5))
+
+        return search_documents
+
+    def _create_hybrid_search_tool(self):
+        """Listings search tool fusing BM25 with the configured vector search backend"""
+        hybrid = load_hybrid_search(rrf_k=self.hybrid_fusion[0], vector_weight=self.hybrid_fusion[1])
+        if self.retrieval_backend == "hosted":
+            client = self._ensure_client()
+            vector_store_id = self.listings_vector_store
+
+            async def vector_ranking(query):
+                return await hosted_vector_search(client, vector_store_id, query, hybrid.depth)
+        else:
+            index = load_local_index("listings")
+
+            async def vector_ranking(query):
+                return await asyncio.to_thread(local_vector_search, index, query, hybrid.depth)
+
+        @function_tool(name_override="search_listings")
+        async def search_listings(query: str) -> str:
+            """Search the listings by meaning and by exact words and return the best matches.
+
+            Args:
+                query: What to search for, e.g. "walk to the Tramsheds" or "quiet apartment near the beach".
+            """
+            try:
+                vector = await vector_ranking(query)
+            except Exception as e:
+                # Exact-term matches are still worth returning when the vector store is unreachable
+                print(f"Vector search failed, using BM25 only: {e}")
+                vector = []
+            return json.dumps(await asyncio.to_thread(hybrid.search, query, vector, k=5))
+
+        return search_listings
+
+    def _create_filter_listings_tool(self):
+        """Function tool answering hard listing filters from the local listings index"""
+        index = load_listings_index()
+
+        @function_tool
+        async def filter_listings(
+            max_price: Optional[float] = None,
+            min_price: Optional[float] = None,
+            guests: Optional[int] = None,
+            min_bedrooms: Optional[float] = None,
+            nights: Optional[int] = None,
+            neighbourhood: Optional[str] = None,
+            room_type: Optional[str] = None,
+            amenities: Optional[List[str]] = None,
+        ) -> str:
+            """Find Sydney Airbnb listings matching hard constraints, cheapest first.
+
+            Args:
+                max_price: Maximum nightly price in AUD.
+                min_price: Minimum nightly price in AUD.
+                guests: Number of guests the listing must accommodate.
+                min_bedrooms: Minimum number of bedrooms.
+                nights: Length of stay; the listing's minimum/maximum nights must allow it.
+                neighbourhood: Council area (e.g. "Waverley", "Manly") or suburb (e.g. "Bondi").
+                room_type: "Entire home/apt", "Private room" or "Hotel room".
+                amenities: Amenities that must all be present (e.g. ["pool", "wifi"]).
+            """
+            result = await asyncio.to_thread(
+                index.filter, max_price=max_price, min_price=min_price, guests=guests, min_bedrooms=min_bedrooms,
+                nights=nights, neighbourhood=neighbourhood, room_type=room_type, amenities=amenities,
+            )
+            return json.dumps(result)
+
+        return filter_listings
+
+    def _create_listing_facets_tool(self):
+        """Function tool answering aggregate questions from the precomputed facet tables"""
+        facets = load_listing_facets()
+
+        @function_tool
+        async def listing_facets(
+            facet: str,
+            value: Optional[str] = None,
+            neighbourhood: Optional[str] = None,
+            sort_by: str = "listings",
+            limit: int = 10,
+        ) -> str:
+            """Counts, price percentiles (AUD per night) and availability of Sydney listings grouped by a facet.
+
+            Args:
+                facet: "neighbourhood", "room_type", "property_type", "accommodates" (bands "1-2" ... "9+"),
+                    "guests" (listings sleeping at least N) or "amenity".
+                value: One facet value to report, e.g. "Pool" for amenity or "4" for guests; omit for a ranking.
+                neighbourhood: Restrict to a council area (e.g. "Waverley") or suburb (e.g. "Bondi").
+                sort_by: "listings", "median_price", "mean_price" or "mean_availability_365". Prices sort cheapest first.
+                limit: Number of facet values to return when ranking.
+            """
+            try:
+                result = await asyncio.to_thread(facets.query, facet, value=value, neighbourhood=neighbourhood,
+                                                 sort_by=sort_by, limit=limit)
+            except ValueError as e:
+                return json.dumps({"error": str(e)})
+            return json.dumps(result)
+
+        return listing_facets
+
     def _create_reviews_agent(self):
         """Create the Review Agent for hotel reviews summarization"""
         return Agent(
@@ -115,7 +327,9 @@ Your tasks are:
    - Listing ID
    - Position in the previous listings (e.g., 'second one')
 
-2. Use the provided `listing_id` or property name to search the reviews vector store for the relevant reviews.
+2. If you know the `listing_id` (given by the user or resolved from the listings shown earlier), call `get_review_summary`
+   with it and base your answer on the precomputed summary it returns. Only when the property is identified by name,
+   or no summary is available, search the reviews vector store for the relevant reviews.
 
 3. Provide a structured summary of the reviews under these headings:
    - **Overall Satisfaction:** Provide a short summary of the general sentiment.
@@ -130,10 +344,60 @@ If no reviews are found or the property cannot be identified, respond politely w
 "Sorry, no reviews are available for this property."
             """,
             tools=[
-                FileSearchTool(vector_store_ids=[self.reviews_vector_store])
+                self._create_review_summary_tool(),
+                self._create_search_tool("reviews")
             ]
         )
 
+    def _create_review_summary_tool(self):
+        """Function tool returning the precomputed review summary of a listing by ID"""
+        store = load_review_store()
+        summaries = load_review_summaries()
+
+        def review_summary(listing_id):
+            summary = summaries.get(listing_id) if summaries else None
+            if summary and summary["servable"]:
+                return summary
+            if listing_id in store:
+                result = {"listing_id": listing_id, "comments": store.comments(listing_id)[:30]}
+                if summary:
+                    # Keyword summary: rough hints only, the comments are the source
+                    result["keyword_summary"] = {key: summary[key] for key in ("sentiment", "strengths", "weaknesses")}
+                return result
+            return {"listing_id": listing_id, "error": "No reviews found for this listing."}
+
+        @function_tool
+        async def get_review_summary(listing_id: str) -> str:
+            """Look up the reviews of a listing by its ID.
+
+            Returns the precomputed summary (strengths, weaknesses, score, sentiment) when available,
+            otherwise up to 30 raw review comments to summarise, with rough keyword hints when available.
+
+            Args:
+                listing_id: The Airbnb listing ID, e.g. "30719520".
+            """
+            # SQLite and the memory-mapped reviews are read in a worker thread
+            return json.dumps(await asyncio.to_thread(review_summary, listing_id))
+
+        return get_review_summary
+
+    def _direct_review_answer(self, user_query, route):
+        """Precomputed model-written review summary for "reviews for listing <id>" questions, answered
+        without a model call.
+
+        Only for queries routed to reviews that name exactly one listing and neither compare nor search;
+        everything else goes to the agents.
+        """
+        if not route or route["label"] != "reviews":
+            return None
+        listing_ids = set(_LISTING_IDS.findall(user_query))
+        if len(listing_ids) != 1 or _NOT_A_REVIEW_LOOKUP.search(user_query):
+            return None
+        summaries = load_review_summaries()
+        summary = summaries.get(listing_ids.pop()) if summaries is not None else None
+        # Keyword summaries are only context for the reviews agent
+        return format_review_summary(summary) if summary and summary["servable"] else None
+
     def _create_triage_agent(self, specialized_agents):
         """Create the main triage agent"""
         return Agent(
@@ -163,38 +427,110 @@ User Query: "What are the reviews for this property?"
             handoffs=specialized_agents,
         )
 
+    def _cache_context(self):
+        """Routing context of a cached answer: the retrieval backend plus the previous answer,
+        so follow-ups like "the second one" only reuse answers given after the same reply"""
+        last_answer = self.conversation_history.last_assistant_message()
+        digest = hashlib.blake2b(last_answer.encode("utf-8"), digest_size=8).hexdigest() if last_answer else ""
+        return f"{self.retrieval_backend}:{digest}"
+
+    def _local_answer(self, user_query, route, cache_context):
+        """(answer, source) for queries answered without a model call, or (None, "model")"""
+        answer = self._direct_review_answer(user_query, route)
+        if answer is not None:
+            return answer, "direct"
+        if route and route["label"] == "off_topic":
+            return OFF_TOPIC_REPLY, "router"
+        if self.response_cache:
+            answer = self.response_cache.get(user_query, cache_context)
+            if answer is not None:
+                return answer, "cache"
+        return None, "model"
+
     async def process_user_query(self, user_query):
+        span = self.tracer.start(user_query, session=self.user)
+        error = None
+        flight_key = None
+        full_response = None
         try:
-            if not self.client:
-                self._ensure_client()
-
             if not self.triage_agent:
-                if not self.initialize_agents():
+                # Managers not built by create() load their agents off the event loop here
+                if not await asyncio.to_thread(self.initialize_agents):
                     yield "Initialization failed."
                     return
 
+            cache_context = self._cache_context()
+            route = self.router.route(user_query) if self.router else None
+            span.route = route
+            # Review summaries are read from SQLite, so the lookups run off the event loop
+            local_answer, span.source = await asyncio.to_thread(self._local_answer, user_query, route, cache_context)
+
+            if local_answer is None and self.inflight_queries is not None:
+                key = (cache_context, normalise_query(user_query))
+                # When the leader fails, its followers try again: one leads, the rest follow it
+                while True:
+                    leader = self.inflight_queries.lead(key)
+                    if leader is None:
+                        flight_key = key
+                        break
+                    local_answer = await asyncio.shield(leader)
+                    if local_answer:
+                        span.source = "coalesced"
+                        break
+
             self.conversation_history.append({"role": "user", "content": user_query})
 
-            response = Runner.run_streamed(
-                starting_agent=self.triage_agent,
-                input=self.conversation_history
+            if local_answer is not None:
+                # Replay answers that need no model call through the same generator so the UI still streams them
+                for chunk in re.findall(r"\S+\s*|\s+", local_answer):
+                    span.mark_token()
+                    yield chunk
+                    await asyncio.sleep(0)
+                self.conversation_history.append({"role": "assistant", "content": local_answer})
+                return
+
+            # Confidently routed queries skip the triage agent's round trip
+            starting_agent = self.triage_agent
+            if route and route["label"] in ("listings", "reviews"):
+                starting_agent = self.agents[f"{route['label']}_agent"]
+
+            response = self.runner.run_streamed(
+                starting_agent=starting_agent,
+                input=self.conversation_history.messages()
             )
 
             full_response_parts = []
+            # Whether the current message item already arrived as text deltas
+            streamed_deltas = False
 
             async for event in response.stream_events():
-                if event.type == "run_item_stream_event":
-                    item = getattr(event, "item", None)
-                    if item and hasattr(item, "raw_item"):
-                        content_blocks = getattr(item.raw_item, "content", [])
-                        for block in content_blocks:
+                span.observe(event)
+                if event.type == "raw_response_event":
+                    # Text is yielded as the model produces it rather than once the message is complete
+                    if getattr(event.data, "type", None) == "response.output_text.delta" and event.data.delta:
+                        streamed_deltas = True
+                        span.mark_token()
+                        yield event.data.delta
+                        full_response_parts.append(event.data.delta)
+                elif event.type == "run_item_stream_event" and event.name == "message_output_created":
+                    if not streamed_deltas:
+                        for block in getattr(event.item.raw_item, "content", []):
                             if hasattr(block, "text"):
+                                span.mark_token()
                                 yield block.text
                                 full_response_parts.append(block.text)
+                    streamed_deltas = False
 
             full_response = "".join(full_response_parts)
             self.conversation_history.append({"role": "assistant", "content": full_response})
+            if self.response_cache and full_response:
+                self.response_cache.put(user_query, full_response, cache_context)
 
         except Exception as e:
+            error = e
             print(f"Error while processing user query: {e}")
             yield f"Error: {e}"
+        finally:
+            if flight_key is not None:
+                self.inflight_queries.finish(flight_key, full_response or None)
+            self.tracer.finish(span, error)
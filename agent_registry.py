@@ -0,0 +1,74 @@
+# agent_registry.py
+"""Process-wide registry of the objects every chat session can share: the parsed secrets,
+pooled OpenAI clients and the built agents. Sessions only keep their own history."""
+import os
+import time
+import threading
+from functools import lru_cache
+
+import toml
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from openai._constants import DEFAULT_CONNECTION_LIMITS
+
+from request_scheduler import RequestScheduler, ScheduledTransport
+
+SECRETS_PATH = os.path.join(os.path.dirname(__file__), ".chainlit", "secrets.toml")
+
+
+@lru_cache(maxsize=None)
+def load_secrets(secrets_path=SECRETS_PATH):
+    """Read secrets.toml once per process"""
+    try:
+        return toml.load(secrets_path)
+    except Exception as e:
+        raise RuntimeError(f"Failed to load secrets.toml: {e}")
+
+
+class AgentRegistry:
+    """Lazily built, thread-safe store of shared clients and agents with setup timings"""
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.RLock()
+        # Seconds spent building each shared object, e.g. {"agents": 0.004}
+        self.timings = {}
+
+    def get(self, key, factory):
+        """Return the object stored under `key`, building it with `factory()` on first use"""
+        with self._lock:
+            if key not in self._objects:
+                started = time.perf_counter()
+                self._objects[key] = factory()
+                self.timings[key[0] if isinstance(key, tuple) else key] = time.perf_counter() - started
+            return self._objects[key]
+
+    def async_openai_client(self, api_key, scheduler=None):
+        """Async client used by the agents runner, shared so model calls reuse one connection pool.
+        With a RequestScheduler every call is queued, rate limited and retried by it instead of the client."""
+        if scheduler is None:
+            return self.get(
+                ("async_openai_client", api_key),
+                lambda: AsyncOpenAI(api_key=api_key, http_client=DefaultAsyncHttpxClient()),
+            )
+
+        def build():
+            transport = ScheduledTransport(scheduler, httpx.AsyncHTTPTransport(limits=DEFAULT_CONNECTION_LIMITS))
+            return AsyncOpenAI(api_key=api_key, max_retries=0, http_client=DefaultAsyncHttpxClient(transport=transport))
+        return self.get(("async_openai_client", api_key, id(scheduler)), build)
+
+    def request_scheduler(self, **settings):
+        """Scheduler shared by every session's API calls; settings apply on first use"""
+        return self.get("request_scheduler", lambda: RequestScheduler(**settings))
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+            self.timings.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"objects": len(self._objects), "timings": dict(self.timings)}
+
+
+registry = AgentRegistry()
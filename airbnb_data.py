@@ -0,0 +1,78 @@
+# airbnb_data.py
+"""Lightweight helpers for reading the Inside Airbnb JSON lines dumps"""
+import ast
+import json
+import re
+import hashlib
+
+_PRICE_CHARS = re.compile(r"[^0-9.]")
+_REVIEW_LISTING_ID = re.compile(rb'"listing_id"\s*:\s*"?(\d+)')
+
+# Chunk IDs are "<listing_id>#<section>", e.g. "30719520#amenities" or "30719520#review-3"
+CHUNK_ID_SEPARATOR = "#"
+
+
+def parse_amenities(amenities_raw):
+    """Parse the stringified amenities list of a listing into a list of strings"""
+    if isinstance(amenities_raw, list):
+        return amenities_raw
+    if not amenities_raw:
+        return []
+    # The dumps store amenities as JSON arrays, so json.loads covers almost every row
+    try:
+        amenities = json.loads(amenities_raw)
+    except ValueError:
+        try:
+            amenities = ast.literal_eval(amenities_raw)
+        except Exception:
+            return [amenities_raw]
+    return amenities if isinstance(amenities, list) else [str(amenities)]
+
+
+def iter_json_lines(json_file):
+    """Stream the records of a JSON lines file one at a time"""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def split_comments(comments_raw):
+    """Individual review comments of a reviews row, whose `comments` field is newline-joined"""
+    return [line.strip() for line in (comments_raw or "").split("\n") if line.strip()]
+
+
+def chunk_listing_id(chunk_id):
+    """Listing ID a document chunk belongs to (documents indexed whole are their own listing ID)"""
+    return chunk_id.split(CHUNK_ID_SEPARATOR, 1)[0]
+
+
+def parse_price(price_raw):
+    """Parse a price such as "$1,250.00" into a float, or None when missing"""
+    if price_raw is None or price_raw == "":
+        return None
+    if isinstance(price_raw, (int, float)):
+        return float(price_raw)
+    try:
+        return float(_PRICE_CHARS.sub("", price_raw))
+    except ValueError:
+        return None
+
+
+def index_review_offsets(json_file):
+    """Map each listing ID of a reviews JSON lines file to the byte offsets of its rows, in first-seen order"""
+    offsets = {}
+    position = 0
+    with open(json_file, 'rb') as f:
+        for line in f:
+            if line.strip():
+                match = _REVIEW_LISTING_ID.search(line)
+                listing_id = match.group(1).decode() if match else str(json.loads(line).get("listing_id"))
+                offsets.setdefault(listing_id, []).append(position)
+            position += len(line)
+    return offsets
+
+
+def content_hash(text):
+    """Short, stable hash of a rendered document used to detect changed records"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
@@ -1,15 +1,13 @@
-import os
-import toml
 import chainlit as cl
 from agent_manager import AgentManager
+from agent_registry import load_secrets
+from stream_coalescer import StreamCoalescer
 import openai
 import asyncio
 
-# --- 🔐 Load OpenAI API key from chainlit/secrets.toml ---
-secrets_path = os.path.join(os.path.dirname(__file__), ".chainlit", "secrets.toml")
-
+# --- 🔐 Load OpenAI API key from chainlit/secrets.toml (parsed once, shared with AgentManager) ---
 try:
-    secrets = toml.load(secrets_path)
+    secrets = load_secrets()
     API_KEY = secrets.get("openai", {}).get("api_key")
     if not API_KEY or not API_KEY.startswith("sk-"):
         raise ValueError("Missing or invalid OpenAI API key.")
@@ -17,6 +15,11 @@ try:
 except Exception as e:
     raise RuntimeError(f"❌ Failed to load OpenAI API key: {e}")
 
+# --- 🔥 Warm the shared indexes, router and agents before the first chat, off the event loop ---
+@cl.on_app_startup
+async def warm_up():
+    await AgentManager.create(api_key=API_KEY, secrets=secrets, user="startup")
+
 # --- 🦘 On Chat Start ---
 @cl.on_chat_start
 async def start():
@@ -26,7 +29,7 @@ async def start():
             "content": "G'day mate! I'm WanderRoo, your local guide to the best stays in Sydney 🏖️. What kind of getaway are ya planning today?"
         }
     ])
-    cl.user_session.set("agent_manager", AgentManager(api_key=openai.api_key))
+    cl.user_session.set("agent_manager", await AgentManager.create(api_key=API_KEY, secrets=secrets))
 
     # Show a bold custom title using HTML
     await cl.Message(
@@ -52,9 +55,17 @@ async def handle_message(message: cl.Message):
     response_message = cl.Message(content="")
     await response_message.send()
 
-    async for part in agent_manager.process_user_query(message.content):
-        response_parts.append(part)
-        await response_message.stream_token(part)
+    # Deltas are batched into fewer websocket messages, configured by the optional [streaming] section
+    coalescer = StreamCoalescer(response_message.stream_token, **secrets.get("streaming", {}))
+    answer = agent_manager.process_user_query(message.content)
+    try:
+        async for part in answer:
+            response_parts.append(part)
+            await coalescer.add(part)
+    finally:
+        # Finish the query's trace span and shared run even when sending failed
+        await answer.aclose()
+        await coalescer.close()
 
     full_response = ''.join(response_parts)
     messages.append({"role": "assistant", "content": full_response})
@@ -0,0 +1,377 @@
+# benchmarks/fakes.py
+"""Offline stand-ins for the OpenAI client, its vector stores and the agents Runner.
+
+Every fake injects configurable latency so throughput and streaming behaviour can be
+measured without network access or API spend.
+"""
+import json
+import time
+import asyncio
+import itertools
+import threading
+import contextvars
+from types import SimpleNamespace
+
+import httpx
+
+
+class LatencyProfile:
+    """Seconds of simulated latency per kind of call"""
+
+    def __init__(self, file_upload=0.02, batch_poll=0.05, api_call=0.01, triage=0.4,
+                 tool_call=0.3, first_token=0.5, per_token=0.01):
+        self.file_upload = file_upload
+        self.batch_poll = batch_poll
+        self.api_call = api_call
+        self.triage = triage
+        self.tool_call = tool_call
+        self.first_token = first_token
+        self.per_token = per_token
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class FakePage(list):
+    """List of results that also looks like an OpenAI cursor page"""
+
+    @property
+    def data(self):
+        return list(self)
+
+    has_more = False
+
+
+class FakeOpenAI:
+    """Synchronous OpenAI client fake covering files, vector stores, embeddings and chat completions"""
+
+    def __init__(self, latency=None, embedding_dim=1536, sleep=True):
+        self.latency = latency or LatencyProfile()
+        self.embedding_dim = embedding_dim
+        # FakeAsyncOpenAI turns sleeping off and awaits `last_latency` itself
+        self.sleep = sleep
+        self.last_latency = 0.0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.uploaded_bytes = 0
+        self.stored_files = {}
+        self.vector_store_list = []
+        self.vector_store_files = {}
+
+        self.files = SimpleNamespace(create=self._create_file, delete=self._delete_file, retrieve=self._retrieve_file)
+        self.vector_stores = SimpleNamespace(
+            list=self._list_vector_stores,
+            create=self._create_vector_store,
+            files=SimpleNamespace(delete=self._delete_vector_store_file, list=self._list_vector_store_files),
+            file_batches=SimpleNamespace(create_and_poll=self._create_and_poll),
+        )
+        self.embeddings = SimpleNamespace(create=self._create_embeddings)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+
+    def reset_counters(self):
+        """Zero the call and byte counters but keep the stored files and vector stores"""
+        with self._lock:
+            self.calls = {}
+            self.uploaded_bytes = 0
+
+    def _count(self, name, seconds):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        self.last_latency = seconds
+        if seconds and self.sleep:
+            time.sleep(seconds)
+
+    def _new_id(self, prefix):
+        with self._lock:
+            return f"{prefix}_{next(self._ids)}"
+
+    def _create_file(self, file, purpose):
+        self._count("files.create", self.latency.file_upload)
+        file_id = self._new_id("file")
+        data = file.read()
+        with self._lock:
+            self.uploaded_bytes += len(data)
+        self.stored_files[file_id] = SimpleNamespace(id=file_id, filename=getattr(file, "name", file_id).split("/")[-1], bytes=len(data))
+        return self.stored_files[file_id]
+
+    def _delete_file(self, file_id):
+        self._count("files.delete", self.latency.api_call)
+        self.stored_files.pop(file_id, None)
+
+    def _retrieve_file(self, file_id):
+        self._count("files.retrieve", self.latency.api_call)
+        return self.stored_files[file_id]
+
+    def _list_vector_stores(self, **kwargs):
+        self._count("vector_stores.list", self.latency.api_call)
+        return FakePage(self.vector_store_list)
+
+    def _create_vector_store(self, name):
+        self._count("vector_stores.create", self.latency.api_call)
+        store = SimpleNamespace(id=self._new_id("vs"), name=name)
+        self.vector_store_list.append(store)
+        self.vector_store_files[store.id] = set()
+        return store
+
+    def _delete_vector_store_file(self, file_id, vector_store_id):
+        self._count("vector_stores.files.delete", self.latency.api_call)
+        self.vector_store_files.get(vector_store_id, set()).discard(file_id)
+
+    def _list_vector_store_files(self, vector_store_id, **kwargs):
+        self._count("vector_stores.files.list", self.latency.api_call)
+        return FakePage(SimpleNamespace(id=file_id) for file_id in self.vector_store_files.get(vector_store_id, ()))
+
+    def _create_and_poll(self, vector_store_id, file_ids, **kwargs):
+        self._count("vector_stores.file_batches.create_and_poll", self.latency.batch_poll)
+        with self._lock:
+            self.vector_store_files.setdefault(vector_store_id, set()).update(file_ids)
+        return SimpleNamespace(status="completed", file_counts=SimpleNamespace(completed=len(file_ids), failed=0))
+
+    def _create_embeddings(self, model, input):
+        self._count("embeddings.create", self.latency.api_call)
+        data = []
+        for text in input:
+            seed = abs(hash(text))
+            data.append(SimpleNamespace(embedding=[((seed >> (i % 48)) & 0xFF) / 255.0 for i in range(self.embedding_dim)]))
+        return SimpleNamespace(data=data)
+
+    def _create_completion(self, model, messages, **kwargs):
+        self._count("chat.completions.create", self.latency.first_token)
+        content = ('{"overall": "Guests enjoyed their stay.", "strengths": ["Location"], '
+                   '"weaknesses": [], "score": 8.5, "sentiment": "Positive"}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeAsyncPage:
+    """Async-iterable stand-in for an AsyncPaginator"""
+
+    def __init__(self, items, latency):
+        self.items = list(items)
+        self.latency = latency
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.latency)
+        for item in self.items:
+            yield item
+
+
+class FakeAsyncOpenAI:
+    """AsyncOpenAI-shaped wrapper over a FakeOpenAI whose latency is awaited instead of slept"""
+
+    def __init__(self, latency=None, embedding_dim=1536):
+        self.sync = FakeOpenAI(latency, embedding_dim, sleep=False)
+        sync, wrap, paged = self.sync, self._wrap, self._paged
+        self.files = SimpleNamespace(create=wrap(sync.files.create), delete=wrap(sync.files.delete),
+                                     retrieve=wrap(sync.files.retrieve))
+        self.vector_stores = SimpleNamespace(
+            list=paged(sync.vector_stores.list),
+            create=wrap(sync.vector_stores.create),
+            files=SimpleNamespace(delete=wrap(sync.vector_stores.files.delete), list=paged(sync.vector_stores.files.list)),
+            file_batches=SimpleNamespace(create_and_poll=wrap(sync.vector_stores.file_batches.create_and_poll)),
+        )
+        self.embeddings = SimpleNamespace(create=wrap(sync.embeddings.create))
+
+    @property
+    def calls(self):
+        return self.sync.calls
+
+    @property
+    def uploaded_bytes(self):
+        return self.sync.uploaded_bytes
+
+    def reset_counters(self):
+        self.sync.reset_counters()
+
+    def _wrap(self, method):
+        async def call(*args, **kwargs):
+            # The fake call itself never blocks, so its latency is read back before any other task runs
+            result = method(*args, **kwargs)
+            await asyncio.sleep(self.sync.last_latency)
+            return result
+        return call
+
+    def _paged(self, method):
+        def call(*args, **kwargs):
+            page = method(*args, **kwargs)
+            return FakeAsyncPage(page, self.sync.last_latency)
+        return call
+
+
+class FakeRateLimitedEndpoint(httpx.AsyncBaseTransport):
+    """Local OpenAI API endpoint (embeddings and vector store search) enforcing request and token
+    budgets per minute over `burst_seconds` windows; requests over budget get a 429 with retry-after-ms.
+    Replies carry the x-ratelimit-limit-* and x-ratelimit-remaining-* headers of the real API"""
+
+    def __init__(self, requests_per_minute=3000, tokens_per_minute=600000, burst_seconds=1.0, latency=0.05):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.request_rate = requests_per_minute / 60.0
+        self.token_rate = tokens_per_minute / 60.0
+        self.burst_seconds = burst_seconds
+        self.latency = latency
+        self.request_level = self.request_rate * burst_seconds
+        self.token_level = self.token_rate * burst_seconds
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.rate_limited = 0
+        self.bodies = {}
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self.updated = now - self.updated, now
+        self.request_level = min(self.request_rate * self.burst_seconds, self.request_level + elapsed * self.request_rate)
+        self.token_level = min(self.token_rate * self.burst_seconds, self.token_level + elapsed * self.token_rate)
+
+    def _headers(self):
+        return {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+            "x-ratelimit-remaining-requests": str(int(self.request_level)),
+            "x-ratelimit-remaining-tokens": str(int(self.token_level)),
+        }
+
+    async def handle_async_request(self, request):
+        body = await request.aread()
+        self.requests += 1
+        tokens = len(body) // 4
+        self._refill()
+        if self.request_level < 1 or self.token_level < tokens:
+            self.rate_limited += 1
+            wait = max((1 - self.request_level) / self.request_rate, (tokens - self.token_level) / self.token_rate)
+            return httpx.Response(429, headers=dict(self._headers(), **{"retry-after-ms": str(int(wait * 1000) + 1)}),
+                                  json={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}})
+        self.request_level -= 1
+        self.token_level -= tokens
+        self.bodies[body] = self.bodies.get(body, 0) + 1
+        headers = self._headers()
+        await asyncio.sleep(self.latency)
+
+        if request.url.path.endswith("/embeddings"):
+            return httpx.Response(200, headers=headers, json={
+                "object": "list", "model": "text-embedding-3-small",
+                "data": [{"object": "embedding", "index": 0, "embedding": [0.0] * 8}],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+        query = json.loads(body).get("query", "")
+        return httpx.Response(200, headers=headers, json={
+            "object": "vector_store.search_results.page", "search_query": [query], "has_more": False, "next_page": None,
+            "data": [{"file_id": "file_1", "filename": "listings_001.txt", "score": 0.9, "attributes": {},
+                      "content": [{"type": "text", "text": "Listing ID: 30719520"}]}],
+        })
+
+
+class FakeRunResult:
+    """Streams the same event shapes as RunResultStreaming.stream_events()"""
+
+    def __init__(self, starting_agent, input, latency, answer, target=None):
+        self.starting_agent = starting_agent
+        self.input = input
+        self.latency = latency
+        self.answer = answer
+        self.target = target
+
+    async def stream_events(self):
+        lat = self.latency
+        agent_name = getattr(self.starting_agent, "name", str(self.starting_agent))
+        yield SimpleNamespace(type="agent_updated_stream_event", new_agent=SimpleNamespace(name=agent_name))
+
+        if self.target is not None:
+            # Triage decides and hands off
+            await asyncio.sleep(lat.triage)
+            yield SimpleNamespace(type="run_item_stream_event", name="handoff_requested", item=SimpleNamespace(raw_item=None))
+            yield SimpleNamespace(type="agent_updated_stream_event", new_agent=SimpleNamespace(name=self.target))
+
+        call_id = f"call_{id(self)}"
+        yield SimpleNamespace(type="run_item_stream_event", name="tool_called",
+                         item=SimpleNamespace(raw_item=SimpleNamespace(call_id=call_id, name="file_search", type="function_call")))
+        await asyncio.sleep(lat.tool_call)
+        yield SimpleNamespace(type="run_item_stream_event", name="tool_output", item=SimpleNamespace(raw_item={"call_id": call_id}))
+
+        await asyncio.sleep(lat.first_token)
+        words = self.answer.split(" ")
+        for i, word in enumerate(words):
+            delta = word if i == len(words) - 1 else word + " "
+            yield SimpleNamespace(type="raw_response_event", data=SimpleNamespace(type="response.output_text.delta", delta=delta))
+            if lat.per_token:
+                await asyncio.sleep(lat.per_token)
+
+        input_tokens = sum(len(m.get("content", "")) for m in self.input) // 4
+        yield SimpleNamespace(type="raw_response_event", data=SimpleNamespace(
+            type="response.completed",
+            response=SimpleNamespace(usage=SimpleNamespace(input_tokens=input_tokens, output_tokens=len(words))),
+        ))
+        yield SimpleNamespace(type="run_item_stream_event", name="message_output_created",
+                         item=SimpleNamespace(raw_item=SimpleNamespace(content=[SimpleNamespace(text=self.answer)])))
+
+
+class FakeRunner:
+    """Drop-in for agents.Runner that never calls a model"""
+
+    def __init__(self, latency=None, answer_tokens=120):
+        self.latency = latency or LatencyProfile()
+        self.answer_tokens = answer_tokens
+        self.runs = 0
+
+    def run_streamed(self, starting_agent, input, **kwargs):
+        self.runs += 1
+        # Only the triage agent has handoffs
+        target = "Airbnb listings filtering" if getattr(starting_agent, "handoffs", None) else None
+        answer = " ".join(
+            ["G'day! Here are a few places:", "**Listing ID**: 30719520", "**Name**: Secluded sunny get away in Glebe,"]
+            + [f"word{i}" for i in range(max(0, self.answer_tokens - 12))]
+        )
+        return FakeRunResult(starting_agent, input, self.latency, answer, target)
+
+
+class FakeChainlitMessage:
+    """Records what app.handle_message streams, with optional per-send websocket latency"""
+
+    sent = []
+
+    def __init__(self, content="", send_latency=0.0):
+        self.content = content
+        self.tokens = 0
+        self.send_latency = send_latency
+        self.first_token_at = None
+
+    async def send(self):
+        FakeChainlitMessage.sent.append(self)
+        return self
+
+    async def stream_token(self, token):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += 1
+        self.content += token
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+
+    async def update(self):
+        return self
+
+
+class FakeUserSession:
+    """Stand-in for cl.user_session; every asyncio task started after new_session() sees its own data"""
+
+    def __init__(self):
+        self._data = contextvars.ContextVar("fake_user_session")
+
+    def new_session(self):
+        self._data.set({})
+
+    def get(self, key, default=None):
+        return self._data.get().get(key, default)
+
+    def set(self, key, value):
+        self._data.get()[key] = value
+
+
+def fake_secrets(backend="hosted"):
+    """Settings equivalent to a filled-in .chainlit/secrets.toml"""
+    return {
+        "openai": {"api_key": "sk-benchmark"},
+        "vectorstore": {"listings_vector_store_id": "vs_listings", "reviews_vector_store_id": "vs_reviews"},
+        "retrieval": {"backend": backend},
+        "cache": {"enabled": False},
+    }
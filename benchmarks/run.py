@@ -0,0 +1,568 @@
+# benchmarks/run.py
+"""Offline performance benchmarks: ingestion, concurrent query handling and Chainlit streaming.
+
+The OpenAI client, vector stores and agents Runner are replaced by the latency-injecting
+fakes in benchmarks/fakes.py, so runs cost nothing and need no network.
+
+    python -m benchmarks.run                                   # writes benchmarks/results/<timestamp>.json
+    python -m benchmarks.run --sessions 50 --first-token 0.8   # heavier load, slower model
+    python -m benchmarks.run --compare benchmarks/results/baseline.json
+"""
+import gc
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+import subprocess
+from functools import partial
+from types import SimpleNamespace
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import agent_registry
+from agent_manager import AgentManager
+from agent_registry import AgentRegistry
+from latency_tracing import Tracer
+from query_router import load_examples, ROUTER_BENCHMARK
+from request_scheduler import RequestScheduler, ScheduledTransport, request_priority
+from benchmarks.fakes import (
+    LatencyProfile, FakeOpenAI, FakeAsyncOpenAI, FakeRateLimitedEndpoint, FakeRunner, FakeChainlitMessage,
+    FakeUserSession, fake_secrets,
+)
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# Metric name fragments where a larger value is an improvement; everything else numeric is a cost
+HIGHER_IS_BETTER = ("per_second", "coverage", "speedup")
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return None
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": int(len(values)), "mean": float(values.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+@contextlib.contextmanager
+def quiet(verbose=False):
+    """Silence the modules' progress prints unless --verbose"""
+    if verbose:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+@contextlib.contextmanager
+def working_copy_of_data():
+    """Run ingestion in a scratch directory holding a copy of the source JSON files"""
+    previous = os.getcwd()
+    scratch = tempfile.mkdtemp(prefix="wanderroo-bench-")
+    try:
+        os.makedirs(os.path.join(scratch, "data"))
+        for name in ("sydney_listings.json", "sydney_reviews.json"):
+            shutil.copy(os.path.join(ROOT, "data", name), os.path.join(scratch, "data", name))
+        os.chdir(scratch)
+        yield scratch
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def bench_ingestion(latency, batch_size=20, max_concurrent_batches=4, records_per_shard=50, verbose=False):
+    """Conversion and upload throughput of a cold ingestion, then the cost of an unchanged re-run"""
+    import streamlit as st
+    from streamlit import logger as streamlit_logger
+    import vector
+    from vector import VectorStoreManager
+
+    # Bare-mode session_state warnings are expected outside `streamlit run`
+    streamlit_logger.set_log_level("error")
+
+    results = {}
+    with working_copy_of_data():
+        manager = VectorStoreManager(FakeOpenAI(latency), batch_size, max_concurrent_batches, records_per_shard)
+
+        conversion = {}
+        for data_type in ("listings", "reviews"):
+            started = time.perf_counter()
+            with quiet(verbose):
+                written = manager._convert_json_to_text_airbnb(data_type)
+            seconds = time.perf_counter() - started
+            conversion[data_type] = {
+                "records": len(written),
+                "shards": len(set(written.values())),
+                "bytes": _directory_bytes(f"data/{data_type}_files"),
+                "seconds": seconds,
+                "records_per_second": len(written) / seconds if seconds else 0.0,
+            }
+            shutil.rmtree(f"data/{data_type}_files")
+        results["conversion"] = conversion
+
+        client = FakeOpenAI(latency)
+        manager.client = client
+        for run in ("cold", "unchanged"):
+            client.reset_counters()
+            # Each run starts like a fresh Streamlit session
+            for key in ("airbnb_listing_vector_store", "airbnb_review_vector_store"):
+                st.session_state.pop(key, None)
+
+            started = time.perf_counter()
+            with quiet(verbose):
+                manager.set_airbnb_vector_stores()
+            seconds = time.perf_counter() - started
+
+            uploaded = client.calls.get("files.create", 0)
+            results[run] = {
+                "seconds": seconds,
+                "files_uploaded": uploaded,
+                "bytes_uploaded": client.uploaded_bytes,
+                "files_per_second": uploaded / seconds if seconds else 0.0,
+                "megabytes_per_second": client.uploaded_bytes / seconds / 1e6 if seconds else 0.0,
+                "api_calls": dict(sorted(client.calls.items())),
+            }
+
+    # The same cold ingestion through the asyncio path, on a fresh copy of the data
+    with working_copy_of_data():
+        vector._vector_store_cache.clear()
+        client = FakeAsyncOpenAI(latency)
+        manager = VectorStoreManager(client, batch_size, max_concurrent_batches, records_per_shard)
+
+        async def ingest_all():
+            stores = await vector.find_vector_stores_async(client, [vector.vector_store_name(vector.DEFAULT_CITY, t) for t in vector.DATA_TYPES])
+            return await asyncio.gather(*(
+                manager.ingest_async(stores[vector.vector_store_name(vector.DEFAULT_CITY, t)], t) for t in vector.DATA_TYPES
+            ))
+
+        started = time.perf_counter()
+        with quiet(verbose):
+            asyncio.run(ingest_all())
+        seconds = time.perf_counter() - started
+        uploaded = client.calls.get("files.create", 0)
+        results["async_cold"] = {
+            "seconds": seconds,
+            "files_uploaded": uploaded,
+            "bytes_uploaded": client.uploaded_bytes,
+            "files_per_second": uploaded / seconds if seconds else 0.0,
+            "api_calls": dict(sorted(client.calls.items())),
+        }
+    return results
+
+
+def _queries(count):
+    examples = load_examples(ROUTER_BENCHMARK)
+    return [examples[i % len(examples)]["query"] for i in range(count)]
+
+
+def _session_factory(latency, answer_tokens, router_enabled=True):
+    """AgentManager constructor sharing one fresh registry, tracer and fake runner"""
+    registry = AgentRegistry()
+    tracer = Tracer(buffer_size=100000)
+    runner = FakeRunner(latency, answer_tokens)
+    secrets = fake_secrets()
+    secrets["router"] = {"enabled": router_enabled}
+    factory = partial(AgentManager, secrets=secrets, registry=registry, tracer=tracer, runner=runner)
+    return factory, tracer, registry, runner
+
+
+async def _run_session(manager, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        first = None
+        async for _ in manager.process_user_query(query):
+            if first is None:
+                first = time.perf_counter() - started
+        timings.append({"ttft": first, "total": time.perf_counter() - started})
+    return timings
+
+
+def bench_queries(latency, sessions=20, queries_per_session=5, answer_tokens=120, router_enabled=True, verbose=False):
+    """process_user_query under N concurrent sessions, plus per-session setup cost and memory"""
+    factory, tracer, registry, runner = _session_factory(latency, answer_tokens, router_enabled)
+    with quiet(verbose):
+        # Warm the shared registry so session setup is measured on its steady state
+        factory(user="warmup").initialize_agents()
+
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        managers = [factory(user=f"session-{i}") for i in range(sessions)]
+        for manager in managers:
+            manager.initialize_agents()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        session_bytes = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+        queries = _queries(sessions * queries_per_session)
+
+        async def main():
+            return await asyncio.gather(*(
+                _run_session(manager, queries[i::sessions]) for i, manager in enumerate(managers)
+            ))
+
+        started = time.perf_counter()
+        per_session = asyncio.run(main())
+        wall = time.perf_counter() - started
+
+    timings = [t for session in per_session for t in session]
+    spans = tracer.buffer.snapshot()
+    sources = {}
+    for span in spans:
+        sources[span["source"]] = sources.get(span["source"], 0) + 1
+    return {
+        "sessions": sessions,
+        "queries": len(timings),
+        "router_enabled": router_enabled,
+        "wall_seconds": wall,
+        "queries_per_second": len(timings) / wall if wall else 0.0,
+        "ttft": percentiles([t["ttft"] for t in timings if t["ttft"] is not None]),
+        "total": percentiles([t["total"] for t in timings]),
+        "model_runs": runner.runs,
+        "answer_sources": sources,
+        "errors": sum(1 for span in spans if span["error"]),
+        "session_setup_seconds": percentiles([m.setup_seconds for m in managers]),
+        "bytes_per_session": session_bytes / sessions if sessions else 0,
+        "trace": tracer.summary(),
+    }
+
+
+def _cold_start():
+    """Forget the process-wide indexes and router so the next session pays the first-session cost again"""
+    import bm25_index, columnar_store, hybrid_search, listings_index, local_search, query_router, review_store
+    for loader in (bm25_index.load_bm25_index, columnar_store.load_listings_store, columnar_store.load_reviews_store,
+                   hybrid_search.load_hybrid_search, listings_index.load_listings_index, local_search.load_local_index,
+                   query_router.load_query_router, review_store.load_review_store, review_store.load_review_summaries):
+        loader.cache_clear()
+
+
+async def _probe_event_loop(lags, stop, interval=0.005):
+    """Record how late every `interval` sleep wakes up; the lateness is time the loop was blocked"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+def bench_event_loop(latency, sessions=100, queries_per_session=2, answer_tokens=120, verbose=False):
+    """Event-loop lag while N sessions start at once in a fresh process and send queries: sessions
+    built on the loop (the old on_chat_start) vs. a startup warm-up plus AgentManager.create()"""
+    results = {}
+    for mode in ("blocking", "async"):
+        _cold_start()
+        # Leftovers of the previous mode would otherwise be collected mid-run
+        gc.collect()
+        factory, tracer, registry, runner = _session_factory(latency, answer_tokens)
+
+        async def start_session(i):
+            if mode == "async":
+                return await AgentManager.create(**factory.keywords, user=f"loop-{i}")
+            manager = factory(user=f"loop-{i}")
+            manager.initialize_agents()
+            return manager
+
+        queries = _queries(sessions * queries_per_session)
+
+        async def main():
+            startup_lags, lags, stop = [], [], asyncio.Event()
+            probe = asyncio.create_task(_probe_event_loop(startup_lags, stop))
+            await asyncio.sleep(0.02)
+            if mode == "async":
+                # app.py's on_app_startup warm-up
+                await AgentManager.create(**factory.keywords, user="startup")
+            stop.set()
+            await probe
+
+            stop = asyncio.Event()
+            probe = asyncio.create_task(_probe_event_loop(lags, stop))
+
+            async def session(i):
+                manager = await start_session(i)
+                return await _run_session(manager, queries[i::sessions])
+
+            per_session = await asyncio.gather(*(session(i) for i in range(sessions)))
+            stop.set()
+            await probe
+            return per_session, startup_lags, lags
+
+        with quiet(verbose):
+            started = time.perf_counter()
+            per_session, startup_lags, lags = asyncio.run(main())
+            wall = time.perf_counter() - started
+
+        timings = [t for session in per_session for t in session]
+        results[mode] = {
+            "sessions": sessions,
+            "wall_seconds": wall,
+            "startup_max_loop_lag_seconds": max(startup_lags),
+            "loop_lag_seconds": percentiles(lags),
+            "max_loop_lag_seconds": max(lags),
+            "ttft": percentiles([t["ttft"] for t in timings if t["ttft"] is not None]),
+        }
+    return results
+
+
+def bench_scheduler(calls=600, requests_per_minute=3000, tokens_per_minute=600000, duplicate_every=5,
+                    background_every=3, verbose=False):
+    """A burst of API calls against a local endpoint that answers 429 over its budgets: the OpenAI
+    client's own retries vs. the shared RequestScheduler (budgets, priorities, single-flight) with the
+    budgets it learns from the endpoint's headers, and with budgets configured twice as high as the
+    endpoint's so its 429 retries are exercised"""
+    import httpx
+    from openai import AsyncOpenAI
+
+    texts = [f"quiet apartment near the beach for {i % 7 + 1} guests, listing {i} " * 8 for i in range(calls)]
+    for i in range(duplicate_every - 1, calls, duplicate_every):
+        texts[i] = texts[i - 1]
+
+    results = {}
+    for mode in ("client_retries", "scheduler", "scheduler_over_budget"):
+        endpoint = FakeRateLimitedEndpoint(requests_per_minute, tokens_per_minute, burst_seconds=1.0)
+        scheduler = None
+        if mode == "scheduler":
+            scheduler = RequestScheduler(burst_seconds=1.0, base_delay=0.1)
+        elif mode == "scheduler_over_budget":
+            scheduler = RequestScheduler(requests_per_minute * 2, tokens_per_minute * 2, burst_seconds=1.0,
+                                         base_delay=0.1)
+        if scheduler is not None:
+            http_client = httpx.AsyncClient(transport=ScheduledTransport(scheduler, endpoint))
+            client = AsyncOpenAI(api_key="sk-benchmark", base_url="http://fake-openai.local/v1", max_retries=0,
+                                 http_client=http_client)
+        else:
+            client = AsyncOpenAI(api_key="sk-benchmark", base_url="http://fake-openai.local/v1",
+                                 http_client=httpx.AsyncClient(transport=endpoint))
+
+        async def call(i):
+            priority = "background" if i % background_every == 0 else "interactive"
+            started = time.perf_counter()
+            try:
+                with request_priority(priority):
+                    await client.embeddings.create(model="text-embedding-3-small", input=texts[i])
+                ok = True
+            except Exception:
+                ok = False
+            return priority, ok, time.perf_counter() - started
+
+        async def main():
+            return await asyncio.gather(*(call(i) for i in range(calls)))
+
+        with quiet(verbose):
+            started = time.perf_counter()
+            outcomes = asyncio.run(main())
+            wall = time.perf_counter() - started
+
+        results[mode] = {
+            "calls": calls,
+            "wall_seconds": wall,
+            "failed_calls": sum(1 for _, ok, _ in outcomes if not ok),
+            "endpoint_requests": endpoint.requests,
+            "endpoint_429s": endpoint.rate_limited,
+            "duplicate_requests_sent": sum(count - 1 for count in endpoint.bodies.values()),
+            "latency": {
+                priority: percentiles([seconds for p, ok, seconds in outcomes if p == priority and ok])
+                for priority in ("interactive", "background")
+            },
+        }
+        if scheduler is not None:
+            results[mode]["scheduler"] = scheduler.stats()
+    return results
+
+
+def _import_app():
+    """Import app.py without a secrets.toml; AgentManagers are created by the benchmark instead"""
+    if "app" in sys.modules:
+        return sys.modules["app"]
+    real_load_secrets = agent_registry.load_secrets
+    agent_registry.load_secrets = lambda *args, **kwargs: fake_secrets()
+    try:
+        import app
+    finally:
+        agent_registry.load_secrets = real_load_secrets
+    return app
+
+
+def bench_chainlit(latency, sessions=20, queries_per_session=3, answer_tokens=120, send_latency=0.0, verbose=False):
+    """Streaming through app.handle_message as the Chainlit UI would see it"""
+    app = _import_app()
+    factory, tracer, registry, runner = _session_factory(latency, answer_tokens)
+    user_session = FakeUserSession()
+    real_cl = app.cl
+    app.cl = SimpleNamespace(user_session=user_session, Message=partial(FakeChainlitMessage, send_latency=send_latency))
+    FakeChainlitMessage.sent = []
+
+    async def run_session(i, queries):
+        user_session.new_session()
+        user_session.set("messages", [])
+        user_session.set("agent_manager", factory(user=f"chainlit-{i}"))
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            sent_before = len(FakeChainlitMessage.sent)
+            await app.handle_message(SimpleNamespace(content=query))
+            message = FakeChainlitMessage.sent[sent_before]
+            timings.append({
+                "ttft": message.first_token_at - started if message.first_token_at else None,
+                "total": time.perf_counter() - started,
+                "stream_token_calls": message.tokens,
+                "chars": len(message.content),
+            })
+        return timings
+
+    queries = _queries(sessions * queries_per_session)
+
+    async def main():
+        return await asyncio.gather(*(run_session(i, queries[i::sessions]) for i in range(sessions)))
+
+    try:
+        with quiet(verbose):
+            started = time.perf_counter()
+            per_session = asyncio.run(main())
+            wall = time.perf_counter() - started
+    finally:
+        app.cl = real_cl
+
+    timings = [t for session in per_session for t in session]
+    return {
+        "sessions": sessions,
+        "messages": len(timings),
+        "send_latency": send_latency,
+        "wall_seconds": wall,
+        "ttft": percentiles([t["ttft"] for t in timings if t["ttft"] is not None]),
+        "total": percentiles([t["total"] for t in timings]),
+        "stream_token_calls": percentiles([t["stream_token_calls"] for t in timings]),
+        "chars_per_stream_token_call": sum(t["chars"] for t in timings) / max(1, sum(t["stream_token_calls"] for t in timings)),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def flatten(data, prefix=""):
+    """{"a": {"b": 1}} -> {"a.b": 1} over numeric leaves"""
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_results(baseline, current, tolerance=0.1, min_seconds=0.005, min_bytes=4096):
+    """Metrics that got worse than the baseline by more than `tolerance` (relative).
+
+    Time and memory metrics must also move by at least `min_seconds` / `min_bytes`,
+    so microsecond-scale jitter is not reported.
+    """
+    old, new = flatten(baseline["scenarios"]), flatten(current["scenarios"])
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        before, after = old[name], new[name]
+        if not before or name.endswith(".count"):
+            continue
+        change = (after - before) / abs(before)
+        higher_is_better = any(fragment in name for fragment in HIGHER_IS_BETTER)
+        worse = -change if higher_is_better else change
+        if worse <= tolerance:
+            continue
+        if "bytes" in name and abs(after - before) < min_bytes:
+            continue
+        if any(part in name for part in ("seconds", "ttft", "total", "triage")) and not higher_is_better \
+                and abs(after - before) < min_seconds:
+            continue
+        if higher_is_better or any(part in name for part in ("seconds", "ttft", "total", "triage", "bytes")):
+            regressions.append({"metric": name, "baseline": before, "current": after, "change": change})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline WanderRoo benchmarks with fake OpenAI backends")
+    parser.add_argument("--scenarios", default="ingestion,queries,chainlit,event_loop,scheduler", help="Comma-separated scenarios to run")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent chat sessions")
+    parser.add_argument("--loop-sessions", type=int, default=100, help="Sessions started at once by the event_loop scenario")
+    parser.add_argument("--queries-per-session", type=int, default=5, help="Queries each session sends")
+    parser.add_argument("--answer-tokens", type=int, default=120, help="Tokens in every fake model answer")
+    parser.add_argument("--triage", type=float, default=0.4, help="Seconds the triage agent takes to hand off")
+    parser.add_argument("--tool-call", type=float, default=0.3, help="Seconds per tool call")
+    parser.add_argument("--first-token", type=float, default=0.5, help="Seconds from the tool output to the first token")
+    parser.add_argument("--per-token", type=float, default=0.01, help="Seconds between streamed tokens")
+    parser.add_argument("--file-upload", type=float, default=0.02, help="Seconds per files.create call")
+    parser.add_argument("--batch-poll", type=float, default=0.05, help="Seconds per file batch create_and_poll")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="Seconds per Chainlit stream_token call")
+    parser.add_argument("--output", help="Results JSON path (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    parser.add_argument("--verbose", action="store_true", help="Show the modules' own progress output")
+    args = parser.parse_args()
+
+    latency = LatencyProfile(
+        file_upload=args.file_upload, batch_poll=args.batch_poll, triage=args.triage,
+        tool_call=args.tool_call, first_token=args.first_token, per_token=args.per_token,
+    )
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "latency": latency.to_dict(),
+        "scenarios": {},
+    }
+
+    for scenario in scenarios:
+        print(f"Running {scenario} benchmark...")
+        if scenario == "ingestion":
+            results["scenarios"]["ingestion"] = bench_ingestion(latency, verbose=args.verbose)
+        elif scenario == "queries":
+            results["scenarios"]["queries"] = bench_queries(
+                latency, args.sessions, args.queries_per_session, args.answer_tokens, verbose=args.verbose)
+            results["scenarios"]["queries_without_router"] = bench_queries(
+                latency, args.sessions, args.queries_per_session, args.answer_tokens, router_enabled=False,
+                verbose=args.verbose)
+        elif scenario == "event_loop":
+            results["scenarios"]["event_loop"] = bench_event_loop(
+                latency, args.loop_sessions, answer_tokens=args.answer_tokens, verbose=args.verbose)
+        elif scenario == "scheduler":
+            results["scenarios"]["scheduler"] = bench_scheduler(verbose=args.verbose)
+        elif scenario == "chainlit":
+            results["scenarios"]["chainlit"] = bench_chainlit(
+                latency, args.sessions, args.queries_per_session, args.answer_tokens, args.send_latency, args.verbose)
+        else:
+            raise SystemExit(f"Unknown scenario: {scenario}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["scenarios"], indent=2))
+    print(f"✅ Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), results, args.tolerance)
+        for r in regressions:
+            print(f"❌ {r['metric']}: {r['baseline']:.4g} -> {r['current']:.4g} ({r['change']:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
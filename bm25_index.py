@@ -0,0 +1,250 @@
+# bm25_index.py
+"""Persisted BM25 index over the listing name, description, neighbourhood overview and amenities.
+
+Per-posting BM25 weights are precomputed at build time, so a query is a handful of array
+slices and one np.bincount. Updates only re-tokenise listings whose fields changed.
+
+    python bm25_index.py                    # build or update data/local_index/listings_bm25
+    python bm25_index.py --scale 100000     # query latency on a synthetic 100k-document corpus
+"""
+import os
+import re
+import json
+import time
+import argparse
+from functools import lru_cache
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from airbnb_data import content_hash
+from columnar_store import LISTINGS_JSON, open_listings_store
+from local_search import LOCAL_INDEX_DIR
+
+BM25_VERSION = 1
+BM25_DIR = os.path.join(LOCAL_INDEX_DIR, "listings_bm25")
+
+# Term frequencies are weighted per field before BM25 saturation (a simple BM25F)
+FIELD_WEIGHTS = {"name": 3.0, "amenities": 1.5, "description": 1.0, "neighborhood_overview": 1.0}
+
+_TAGS = re.compile(r"<[^>]+>")
+_TOKENS = re.compile(r"[a-z0-9]+")
+
+
+def _stem(word):
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def tokenize(text):
+    """Lower-cased, de-pluralised word tokens without stop words or HTML tags"""
+    if not text:
+        return []
+    return [_stem(t) for t in _TOKENS.findall(_TAGS.sub(" ", text).lower()) if t not in ENGLISH_STOP_WORDS]
+
+
+def listing_fields(store):
+    """(listing_id, {field: text}) for every listing of a compiled listings store"""
+    columns = {field: store[field] for field in FIELD_WEIGHTS}
+    ids = store["id"]
+    for row in range(len(store)):
+        fields = {
+            field: ", ".join(column[row]) if field == "amenities" else (column[row] or "")
+            for field, column in columns.items()
+        }
+        yield str(ids[row]), fields
+
+
+def _field_hash(fields):
+    return content_hash("\x1f".join(fields[field] for field in FIELD_WEIGHTS))
+
+
+class BM25Index:
+    """Postings (term -> documents and precomputed BM25 weights) plus the per-document term
+    frequencies they were derived from, which make incremental updates cheap"""
+
+    def __init__(self, ids, hashes, terms, doc_offsets, doc_terms, doc_tfs, k1=1.2, b=0.75, source=None):
+        self.ids = list(ids)
+        self.hashes = list(hashes)
+        self.terms = list(terms)
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.doc_offsets = doc_offsets
+        self.doc_terms = doc_terms
+        self.doc_tfs = doc_tfs
+        self.k1 = k1
+        self.b = b
+        self.source = source
+        self._build_postings()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, documents, previous=None, k1=1.2, b=0.75, source=None):
+        """Index (listing_id, fields) documents, reusing the term frequencies of unchanged documents in `previous`.
+
+        Returns (index, re-tokenised document count).
+        """
+        reuse = {}
+        if previous is not None:
+            reuse = {doc_id: row for row, doc_id in enumerate(previous.ids)}
+
+        ids, hashes, rows = [], [], []
+        term_ids, terms = {}, []
+        tokenized = 0
+        for doc_id, fields in documents:
+            digest = _field_hash(fields)
+            old_row = reuse.get(doc_id)
+            if old_row is not None and previous.hashes[old_row] == digest:
+                start, end = previous.doc_offsets[old_row], previous.doc_offsets[old_row + 1]
+                counts = {previous.terms[t]: float(tf) for t, tf in zip(previous.doc_terms[start:end], previous.doc_tfs[start:end])}
+            else:
+                counts = {}
+                for field, weight in FIELD_WEIGHTS.items():
+                    for token in tokenize(fields[field]):
+                        counts[token] = counts.get(token, 0.0) + weight
+                tokenized += 1
+            row = {}
+            for term, tf in counts.items():
+                term_id = term_ids.get(term)
+                if term_id is None:
+                    term_id = term_ids[term] = len(terms)
+                    terms.append(term)
+                row[term_id] = tf
+            ids.append(doc_id)
+            hashes.append(digest)
+            rows.append(row)
+
+        doc_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=doc_offsets[1:])
+        doc_terms = np.fromiter((t for row in rows for t in row), dtype=np.int32, count=int(doc_offsets[-1]))
+        doc_tfs = np.fromiter((tf for row in rows for tf in row.values()), dtype=np.float32, count=int(doc_offsets[-1]))
+        return cls(ids, hashes, terms, doc_offsets, doc_terms, doc_tfs, k1, b, source), tokenized
+
+    def _build_postings(self):
+        """Transpose the document rows into postings and precompute each posting's BM25 weight"""
+        n_docs = len(self.ids)
+        doc_of_entry = np.repeat(np.arange(n_docs, dtype=np.int32), np.diff(self.doc_offsets))
+        doc_len = np.bincount(doc_of_entry, weights=self.doc_tfs, minlength=n_docs).astype(np.float32)
+        avgdl = float(doc_len.mean()) if n_docs else 0.0
+
+        order = np.argsort(self.doc_terms, kind="stable")
+        self.post_docs = doc_of_entry[order]
+        tf = self.doc_tfs[order]
+        df = np.bincount(self.doc_terms, minlength=len(self.terms))
+        self.post_offsets = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(df, out=self.post_offsets[1:])
+
+        idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = self.k1 * (1 - self.b + self.b * doc_len[self.post_docs] / (avgdl or 1.0))
+        self.post_weights = (idf[self.doc_terms[order]] * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32)
+
+    def search(self, query, k=10):
+        """Top-k (listing_id, score) pairs, best first"""
+        slices = []
+        for token in set(tokenize(query)):
+            term_id = self.term_ids.get(token)
+            if term_id is not None:
+                slices.append((self.post_offsets[term_id], self.post_offsets[term_id + 1]))
+        if not slices:
+            return []
+        docs = np.concatenate([self.post_docs[start:end] for start, end in slices])
+        weights = np.concatenate([self.post_weights[start:end] for start, end in slices])
+        scores = np.bincount(docs, weights=weights, minlength=len(self.ids))
+        top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[row], float(scores[row])) for row in top if scores[row] > 0]
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in ("doc_offsets", "doc_terms", "doc_tfs", "post_offsets", "post_docs", "post_weights"):
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "terms.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(self.terms))
+        meta = {
+            "version": BM25_VERSION, "k1": self.k1, "b": self.b, "field_weights": FIELD_WEIGHTS,
+            "source": self.source, "ids": self.ids, "hashes": self.hashes,
+        }
+        tmp_path = os.path.join(path, "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        # meta.json is written last, so a half-written index is never loaded
+        os.replace(tmp_path, os.path.join(path, "meta.json"))
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta.get("version") != BM25_VERSION or meta.get("field_weights") != FIELD_WEIGHTS:
+            raise ValueError(f"{path} was built by an incompatible version")
+        with open(os.path.join(path, "terms.txt"), "r", encoding="utf-8") as f:
+            terms = f.read().split("\n") if meta["ids"] else []
+        index = cls.__new__(cls)
+        index.ids, index.hashes, index.terms = meta["ids"], meta["hashes"], terms
+        index.term_ids = {term: i for i, term in enumerate(terms)}
+        index.k1, index.b, index.source = meta["k1"], meta["b"], meta["source"]
+        for name in ("doc_offsets", "doc_terms", "doc_tfs", "post_offsets", "post_docs", "post_weights"):
+            setattr(index, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        return index
+
+
+def build_listings_bm25(json_file=LISTINGS_JSON, path=BM25_DIR):
+    """Load the persisted index, updating it first when the listings changed since it was built"""
+    store = open_listings_store(json_file)
+    previous = None
+    if os.path.exists(os.path.join(path, "meta.json")):
+        try:
+            previous = BM25Index.load(path)
+        except (ValueError, OSError) as e:
+            print(f"Rebuilding BM25 index: {e}")
+        if previous is not None and previous.source == store.footer["source"]:
+            return previous
+
+    started = time.perf_counter()
+    index, tokenized = BM25Index.build(listing_fields(store), previous, source=store.footer["source"])
+    index.save(path)
+    print(f"BM25 index: {len(index)} listings, {tokenized} re-tokenised, {len(index.terms)} terms "
+          f"in {time.perf_counter() - started:.2f}s")
+    return index
+
+
+@lru_cache(maxsize=None)
+def load_bm25_index(json_file=LISTINGS_JSON, path=BM25_DIR):
+    """Open (building or updating if needed) the listings BM25 index once per process"""
+    return build_listings_bm25(json_file, path)
+
+
+def benchmark_scale(n_docs, queries=("walk to tramsheds", "border collie", "harbour view pool", "quiet studio near beach"),
+                    repeats=200):
+    """Query latency on a synthetic corpus made of the real listings repeated up to `n_docs` documents"""
+    store = open_listings_store(LISTINGS_JSON)
+    base = list(listing_fields(store))
+    documents = ((f"{i}", base[i % len(base)][1]) for i in range(n_docs))
+    started = time.perf_counter()
+    index, _ = BM25Index.build(documents)
+    build_seconds = time.perf_counter() - started
+
+    timings = []
+    for _ in range(repeats):
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, k=50)
+            timings.append(time.perf_counter() - started)
+    p50, p95 = np.percentile(timings, [50, 95]) * 1000
+    return {"documents": n_docs, "build_seconds": build_seconds, "query_ms_p50": float(p50), "query_ms_p95": float(p95)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the listings BM25 index or measure its query latency")
+    parser.add_argument("--listings", default=LISTINGS_JSON, help="Listings JSON lines file")
+    parser.add_argument("--scale", type=int, help="Measure query latency on a synthetic corpus of this many documents")
+    args = parser.parse_args()
+
+    if args.scale:
+        print(json.dumps(benchmark_scale(args.scale), indent=2))
+        return
+    index = build_listings_bm25(args.listings)
+    print(f"✅ BM25 index ready in {BM25_DIR} ({len(index)} listings)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+# columnar_store.py
+"""Compact, memory-mapped columnar files compiled from the listings and reviews JSON dumps.
+
+File layout: the column blobs (each 8-byte aligned), then a JSON footer describing them,
+the footer length (little-endian uint64) and MAGIC. Columns are read straight out of the
+memory map with np.frombuffer, so opening a file only parses the footer.
+
+    python columnar_store.py          # compile both dumps and report sizes and open times
+"""
+import os
+import json
+import time
+import argparse
+from functools import lru_cache
+
+import numpy as np
+
+from airbnb_data import iter_json_lines, parse_amenities, parse_price, split_comments
+
+# Bump when the layout or the compiled columns change; older files are rebuilt on open
+FORMAT_VERSION = 1
+MAGIC = b"WRCOL\x00\x00\x01"
+ALIGNMENT = 8
+
+LISTINGS_JSON = os.path.join(os.path.dirname(__file__), "data", "sydney_listings.json")
+REVIEWS_JSON = os.path.join(os.path.dirname(__file__), "data", "sydney_reviews.json")
+
+INT32_MAX = np.iinfo(np.int32).max
+
+
+def store_path(json_file):
+    """data/sydney_listings.json -> data/sydney_listings.columns"""
+    return os.path.splitext(json_file)[0] + ".columns"
+
+
+def source_fingerprint(json_file):
+    stat = os.stat(json_file)
+    return {"path": os.path.basename(json_file), "bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class StringColumn:
+    """Variable-length UTF-8 strings: an offsets array into one byte blob, plus an optional null mask"""
+
+    def __init__(self, offsets, blob, nulls=None):
+        self.offsets = offsets
+        self.blob = blob
+        self.nulls = nulls
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        if self.nulls is not None and self.nulls[row]:
+            return None
+        return bytes(self.blob[self.offsets[row]:self.offsets[row + 1]]).decode("utf-8")
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+
+class CategoryColumn:
+    """Low-cardinality strings stored as integer codes into an interned vocabulary"""
+
+    def __init__(self, codes, vocabulary):
+        self.codes = codes
+        self.vocabulary = vocabulary
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row):
+        return self.vocabulary[self.codes[row]]
+
+    def mask(self, term_ids):
+        """Rows whose value is one of the vocabulary entries `term_ids`"""
+        return np.isin(self.codes, np.asarray(list(term_ids), dtype=self.codes.dtype))
+
+
+class BitsetColumn:
+    """Per-row sets of interned terms (e.g. amenities) as a packed rows x vocabulary bit matrix"""
+
+    def __init__(self, bits, vocabulary):
+        self.bits = bits
+        self.vocabulary = vocabulary
+
+    def __len__(self):
+        return len(self.bits)
+
+    def __getitem__(self, row):
+        return [self.vocabulary[j] for j in np.flatnonzero(np.unpackbits(self.bits[row], count=len(self.vocabulary)))]
+
+    def mask(self, term_ids):
+        """Rows holding any of the terms `term_ids`"""
+        mask = np.zeros(len(self), dtype=bool)
+        for term_id in term_ids:
+            mask |= (self.bits[:, term_id >> 3] >> (7 - (term_id & 7))) & 1 == 1
+        return mask
+
+
+class ColumnarWriter:
+    """Appends aligned column blobs to a temporary file and publishes it atomically on finish()"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.f = open(self.tmp_path, "wb")
+        self.columns = {}
+
+    def _write(self, array):
+        array = np.ascontiguousarray(array)
+        padding = -self.f.tell() % ALIGNMENT
+        self.f.write(b"\0" * padding)
+        spec = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": self.f.tell()}
+        self.f.write(array.tobytes())
+        return spec
+
+    def add_array(self, name, array):
+        self.columns[name] = {"kind": "array", "data": self._write(array)}
+
+    def _strings(self, values):
+        encoded = [b"" if v is None else str(v).encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        spec = {"offsets": self._write(offsets), "blob": self._write(np.frombuffer(b"".join(encoded), dtype=np.uint8))}
+        if any(v is None for v in values):
+            spec["nulls"] = self._write(np.array([v is None for v in values], dtype=bool))
+        return spec
+
+    def add_strings(self, name, values):
+        self.columns[name] = dict(kind="strings", **self._strings(values))
+
+    def add_category(self, name, values):
+        vocabulary = sorted(set(values))
+        lookup = {value: i for i, value in enumerate(vocabulary)}
+        codes = np.array([lookup[v] for v in values], dtype=np.uint16 if len(vocabulary) < 2 ** 16 else np.uint32)
+        self.columns[name] = {"kind": "category", "codes": self._write(codes), "vocabulary": self._strings(vocabulary)}
+
+    def add_bitset(self, name, term_sets):
+        vocabulary = sorted(set().union(*term_sets)) if term_sets else []
+        lookup = {term: i for i, term in enumerate(vocabulary)}
+        bits = np.zeros((len(term_sets), max(1, (len(vocabulary) + 7) // 8)), dtype=np.uint8)
+        for row, terms in enumerate(term_sets):
+            for term_id in (lookup[t] for t in terms):
+                bits[row, term_id >> 3] |= 0x80 >> (term_id & 7)
+        self.columns[name] = {"kind": "bitset", "bits": self._write(bits), "vocabulary": self._strings(vocabulary)}
+
+    def finish(self, **footer):
+        footer = dict(footer, format_version=FORMAT_VERSION, columns=self.columns)
+        encoded = json.dumps(footer).encode("utf-8")
+        self.f.write(encoded)
+        self.f.write(len(encoded).to_bytes(8, "little"))
+        self.f.write(MAGIC)
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class ColumnarFile:
+    """Read-only view of a compiled file; columns are zero-copy slices of one memory map"""
+
+    def __init__(self, path):
+        self.path = path
+        self.buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        if len(self.buffer) < 16 or bytes(self.buffer[-8:]) != MAGIC:
+            raise ValueError(f"{path} is not a columnar store")
+        footer_length = int.from_bytes(bytes(self.buffer[-16:-8]), "little")
+        self.footer = json.loads(bytes(self.buffer[-16 - footer_length:-16]))
+        self.rows = self.footer["rows"]
+        self._columns = {}
+
+    @property
+    def format_version(self):
+        return self.footer.get("format_version")
+
+    def _array(self, spec):
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        return np.frombuffer(self.buffer, dtype=dtype, count=count, offset=spec["offset"]).reshape(spec["shape"])
+
+    def _strings(self, spec):
+        nulls = self._array(spec["nulls"]) if "nulls" in spec else None
+        return StringColumn(self._array(spec["offsets"]), self._array(spec["blob"]), nulls)
+
+    def has_column(self, name):
+        return name in self.footer["columns"]
+
+    def column(self, name):
+        """Array, StringColumn, CategoryColumn or BitsetColumn of a column, built once"""
+        if name not in self._columns:
+            spec = self.footer["columns"][name]
+            if spec["kind"] == "array":
+                column = self._array(spec["data"])
+            elif spec["kind"] == "strings":
+                column = self._strings(spec)
+            elif spec["kind"] == "category":
+                column = CategoryColumn(self._array(spec["codes"]), list(self._strings(spec["vocabulary"])))
+            elif spec["kind"] == "bitset":
+                column = BitsetColumn(self._array(spec["bits"]), list(self._strings(spec["vocabulary"])))
+            else:
+                raise ValueError(f"Unknown column kind: {spec['kind']}")
+            self._columns[name] = column
+        return self._columns[name]
+
+    __getitem__ = column
+
+
+class ListingsStore(ColumnarFile):
+    """Compiled listings: one row per listing with a sorted listing ID -> row footer index"""
+
+    def row(self, listing_id):
+        """Row of a listing, or None"""
+        try:
+            listing_id = int(listing_id)
+        except (TypeError, ValueError):
+            return None
+        sorted_ids, rows = self.column("index_ids"), self.column("index_rows")
+        position = np.searchsorted(sorted_ids, listing_id)
+        if position < len(sorted_ids) and sorted_ids[position] == listing_id:
+            return int(rows[position])
+        return None
+
+    def __contains__(self, listing_id):
+        return self.row(listing_id) is not None
+
+    def __len__(self):
+        return self.rows
+
+
+class ReviewsStore(ColumnarFile):
+    """Compiled reviews: one row per comment, grouped by listing, with a footer index of each listing's row range"""
+
+    def comments(self, listing_id):
+        try:
+            listing_id = int(listing_id)
+        except (TypeError, ValueError):
+            return []
+        listing_ids, starts = self.column("index_ids"), self.column("index_starts")
+        position = np.searchsorted(listing_ids, listing_id)
+        if position == len(listing_ids) or listing_ids[position] != listing_id:
+            return []
+        text = self.column("comments")
+        return [text[row] for row in range(starts[position], starts[position + 1])]
+
+    def listing_ids(self):
+        return [str(i) for i in self.column("index_ids")]
+
+    def __contains__(self, listing_id):
+        try:
+            listing_id = int(listing_id)
+        except (TypeError, ValueError):
+            return False
+        listing_ids = self.column("index_ids")
+        position = np.searchsorted(listing_ids, listing_id)
+        return position < len(listing_ids) and listing_ids[position] == listing_id
+
+    def __len__(self):
+        return len(self.column("index_ids"))
+
+
+def compile_listings(json_file=LISTINGS_JSON, path=None):
+    """Compile a listings JSON lines dump into a columnar store file"""
+    path = path or store_path(json_file)
+    fingerprint = source_fingerprint(json_file)
+    records = list(iter_json_lines(json_file))
+
+    def values(key):
+        return [entry.get(key) for entry in records]
+
+    def numbers(key, dtype, missing):
+        return np.array([missing if v is None else v for v in values(key)], dtype=dtype)
+
+    writer = ColumnarWriter(path)
+    try:
+        ids = np.array([int(entry["id"]) for entry in records], dtype=np.int64)
+        writer.add_array("id", ids)
+        for key in ("name", "description", "neighborhood_overview", "bathrooms_text", "listing_url"):
+            writer.add_strings(key, values(key))
+        for key in ("neighbourhood_cleansed", "property_type", "room_type"):
+            writer.add_category(key, [v or "" for v in values(key)])
+        prices = [parse_price(v) for v in values("price")]
+        writer.add_array("price", np.array([np.nan if p is None else p for p in prices], dtype=np.float32))
+        writer.add_array("accommodates", numbers("accommodates", np.int16, 0))
+        writer.add_array("bedrooms", numbers("bedrooms", np.float32, np.nan))
+        writer.add_array("beds", numbers("beds", np.float32, np.nan))
+        writer.add_array("minimum_nights", np.minimum(numbers("minimum_nights", np.int64, 1), INT32_MAX).astype(np.int32))
+        writer.add_array("maximum_nights", np.minimum(numbers("maximum_nights", np.int64, INT32_MAX), INT32_MAX).astype(np.int32))
+        writer.add_array("availability_365", numbers("availability_365", np.int16, 0))
+        writer.add_array("number_of_reviews", numbers("number_of_reviews", np.int32, 0))
+        writer.add_bitset("amenities", [set(str(a) for a in parse_amenities(v)) for v in values("amenities")])
+
+        order = np.argsort(ids, kind="stable")
+        writer.add_array("index_ids", ids[order])
+        writer.add_array("index_rows", order.astype(np.int32))
+        writer.finish(kind="listings", rows=len(records), source=fingerprint)
+    except BaseException:
+        writer.abort()
+        raise
+    return path
+
+
+def compile_reviews(json_file=REVIEWS_JSON, path=None):
+    """Compile a reviews JSON lines dump into a columnar store file, one row per comment"""
+    path = path or store_path(json_file)
+    fingerprint = source_fingerprint(json_file)
+    listing_ids, comments = [], []
+    for entry in iter_json_lines(json_file):
+        listing_id = int(entry.get("listing_id"))
+        for comment in split_comments(entry.get("comments")):
+            listing_ids.append(listing_id)
+            comments.append(comment)
+
+    listing_ids = np.array(listing_ids, dtype=np.int64)
+    # Stable sort keeps every listing's comments in file order
+    order = np.argsort(listing_ids, kind="stable")
+    sorted_ids = listing_ids[order]
+    unique_ids, starts = np.unique(sorted_ids, return_index=True)
+
+    writer = ColumnarWriter(path)
+    try:
+        writer.add_array("listing_id", sorted_ids)
+        writer.add_strings("comments", [comments[i] for i in order])
+        writer.add_array("index_ids", unique_ids)
+        writer.add_array("index_starts", np.append(starts, len(sorted_ids)).astype(np.int64))
+        writer.finish(kind="reviews", rows=len(sorted_ids), source=fingerprint)
+    except BaseException:
+        writer.abort()
+        raise
+    return path
+
+
+def _is_current(path, json_file):
+    """Whether a compiled file exists, has the current format version and matches its source JSON"""
+    if not os.path.exists(path):
+        return False
+    try:
+        store = ColumnarFile(path)
+    except (ValueError, OSError):
+        return False
+    return store.format_version == FORMAT_VERSION and store.footer.get("source") == source_fingerprint(json_file)
+
+
+def open_listings_store(json_file=LISTINGS_JSON, path=None):
+    """Open the compiled listings, compiling them first when missing or stale"""
+    path = path or store_path(json_file)
+    if not _is_current(path, json_file):
+        print(f"Compiling {json_file} into {path}")
+        compile_listings(json_file, path)
+    return ListingsStore(path)
+
+
+def open_reviews_store(json_file=REVIEWS_JSON, path=None):
+    """Open the compiled reviews, compiling them first when missing or stale"""
+    path = path or store_path(json_file)
+    if not _is_current(path, json_file):
+        print(f"Compiling {json_file} into {path}")
+        compile_reviews(json_file, path)
+    return ReviewsStore(path)
+
+
+@lru_cache(maxsize=None)
+def load_listings_store(json_file=LISTINGS_JSON):
+    """Open the compiled listings once per process"""
+    return open_listings_store(json_file)
+
+
+@lru_cache(maxsize=None)
+def load_reviews_store(json_file=REVIEWS_JSON):
+    """Open the compiled reviews once per process"""
+    return open_reviews_store(json_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the listings and reviews JSON into columnar stores")
+    parser.add_argument("--listings", default=LISTINGS_JSON, help="Listings JSON lines file")
+    parser.add_argument("--reviews", default=REVIEWS_JSON, help="Reviews JSON lines file")
+    args = parser.parse_args()
+
+    for json_file, compile_store, store_class in (
+        (args.listings, compile_listings, ListingsStore),
+        (args.reviews, compile_reviews, ReviewsStore),
+    ):
+        started = time.perf_counter()
+        path = compile_store(json_file)
+        compiled = time.perf_counter() - started
+        started = time.perf_counter()
+        store = store_class(path)
+        opened = time.perf_counter() - started
+        print(f"✅ {path}: {store.rows} rows, {os.path.getsize(path) / 1e6:.2f} MB "
+              f"(source {os.path.getsize(json_file) / 1e6:.2f} MB), compiled in {compiled:.2f}s, opens in {opened * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# conversation_history.py
+"""Bounded conversation history: the last K turns verbatim, older turns compacted into a
+rolling summary, plus a compact memory of the listings already shown to the user."""
+import re
+
+# Matches "Listing ID: 123", "**Listing ID**: 123" and airbnb.com/rooms/123 links
+_LISTING_ID = re.compile(r"(?:listing\s*id\W{0,6}|airbnb\.com(?:\.au)?/rooms/)(\d{5,})", re.IGNORECASE)
+_LISTING_NAME = re.compile(r"\bname\W{0,6}([^\n|*]+)", re.IGNORECASE)
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+
+def extractive_summary(user_text, assistant_text, max_chars=240):
+    """One-line summary of a turn: the question and the first line of the answer"""
+    answer = next((line.strip() for line in assistant_text.splitlines() if line.strip()), "")
+    line = f"User asked: {' '.join(user_text.split())} | Assistant: {answer}"
+    return line if len(line) <= max_chars else line[:max_chars - 3] + "..."
+
+
+def extract_listings(text):
+    """Ordered (listing_id, name) pairs mentioned in an answer, first mention wins"""
+    listings = []
+    seen = set()
+    for match in _LISTING_ID.finditer(text):
+        listing_id = match.group(1)
+        if listing_id in seen:
+            continue
+        seen.add(listing_id)
+        # The name is usually within the next few lines of the listing block
+        name_match = _LISTING_NAME.search(text, match.end(), match.end() + 300)
+        listings.append((listing_id, name_match.group(1).strip(" :") if name_match else ""))
+    return listings
+
+
+class ConversationHistory:
+    """Conversation state sent to the agents, with a bounded prompt size per turn"""
+
+    def __init__(self, system_prompt="You are a helpful assistant.", max_turns=6,
+                 max_summary_chars=2000, max_remembered_listings=50, summarizer=extractive_summary):
+        self.system_prompt = system_prompt
+        self.max_turns = max_turns
+        self.max_summary_chars = max_summary_chars
+        self.max_remembered_listings = max_remembered_listings
+        self.summarizer = summarizer
+        self.turns = []
+        self.summary_lines = []
+        # Listings of the most recent answer that showed any, in display order
+        self.last_shown_listings = []
+        # Every listing shown so far, most recent last
+        self.shown_listings = {}
+        # Estimated prompt tokens sent on each turn
+        self.turn_token_counts = []
+
+    def append(self, message):
+        """Record a user or assistant message"""
+        if message["role"] == "user":
+            self.turns.append({"user": message["content"], "assistant": None})
+            return
+        if message["role"] != "assistant":
+            raise ValueError(f"Unsupported message role: {message['role']}")
+        if not self.turns or self.turns[-1]["assistant"] is not None:
+            self.turns.append({"user": "", "assistant": message["content"]})
+        else:
+            self.turns[-1]["assistant"] = message["content"]
+        self._remember_listings(message["content"])
+        self._compact()
+
+    def _remember_listings(self, text):
+        listings = extract_listings(text)
+        if not listings:
+            return
+        self.last_shown_listings = listings
+        for listing_id, name in listings:
+            self.shown_listings.pop(listing_id, None)
+            self.shown_listings[listing_id] = name
+        while len(self.shown_listings) > self.max_remembered_listings:
+            del self.shown_listings[next(iter(self.shown_listings))]
+
+    def _compact(self):
+        """Fold turns beyond the window into the rolling summary"""
+        while len(self.turns) > self.max_turns:
+            turn = self.turns.pop(0)
+            self.summary_lines.append(self.summarizer(turn["user"], turn["assistant"] or ""))
+        # Oldest summary lines go first once the summary is over budget
+        while self.summary_lines and sum(len(line) + 1 for line in self.summary_lines) > self.max_summary_chars:
+            self.summary_lines.pop(0)
+
+    def last_assistant_message(self):
+        for turn in reversed(self.turns):
+            if turn["assistant"]:
+                return turn["assistant"]
+        return ""
+
+    def _memory_message(self):
+        parts = []
+        if self.summary_lines:
+            parts.append("Summary of the earlier conversation:\n" + "\n".join(self.summary_lines))
+        if self.last_shown_listings:
+            shown = "\n".join(
+                f"{position}. Listing ID {listing_id}" + (f" - {name}" if name else "")
+                for position, (listing_id, name) in enumerate(self.last_shown_listings, start=1)
+            )
+            parts.append(f"Listings in the most recent results, by position (\"the second one\" = 2):\n{shown}")
+        earlier = [listing_id for listing_id in self.shown_listings
+                   if listing_id not in dict(self.last_shown_listings)]
+        if earlier:
+            parts.append("Other listings shown earlier: " + ", ".join(earlier))
+        return "\n\n".join(parts)
+
+    def messages(self):
+        """Input for the next agent run; records its estimated token count"""
+        messages = [{"role": "system", "content": self.system_prompt}]
+        memory = self._memory_message()
+        if memory:
+            messages.append({"role": "system", "content": memory})
+        for turn in self.turns:
+            if turn["user"]:
+                messages.append({"role": "user", "content": turn["user"]})
+            if turn["assistant"]:
+                messages.append({"role": "assistant", "content": turn["assistant"]})
+        self.turn_token_counts.append(sum(estimate_tokens(m["content"]) for m in messages))
+        return messages
+
+    def stats(self):
+        return {
+            "turns_verbatim": len(self.turns),
+            "summary_lines": len(self.summary_lines),
+            "listings_remembered": len(self.shown_listings),
+            "last_prompt_tokens": self.turn_token_counts[-1] if self.turn_token_counts else 0,
+            "max_prompt_tokens": max(self.turn_token_counts, default=0),
+        }
@@ -0,0 +1,206 @@
+# hybrid_search.py
+"""Hybrid listings retrieval: BM25 (exact terms such as "Tramsheds" or "border collie") fused
+with the vector search ranking by reciprocal rank fusion.
+
+    python hybrid_search.py            # recall of vector-only, BM25-only and hybrid on data/retrieval_benchmark.jsonl
+    python hybrid_search.py --hosted   # same, with the hosted vector store (what file_search retrieves) as the vector side
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+from functools import lru_cache
+
+import numpy as np
+
+from bm25_index import load_bm25_index
+from columnar_store import LISTINGS_JSON, load_listings_store
+
+RETRIEVAL_BENCHMARK = os.path.join(os.path.dirname(__file__), "data", "retrieval_benchmark.jsonl")
+# Shard files uploaded to the hosted listings vector store (vector.dataset_paths(..., "listings")["text_dir"])
+LISTINGS_TEXT_DIR = os.path.join(os.path.dirname(__file__), "data", "listings_files")
+
+_LISTING_ID_LINE = re.compile(r"Listing ID:\s*(\d+)")
+_TAGS = re.compile(r"<[^>]+>")
+
+
+def reciprocal_rank_fusion(rankings, k=60, weights=None):
+    """Fuse ranked ID lists: score(id) = sum over rankings of weight / (k + rank)"""
+    scores = {}
+    for ranking, weight in zip(rankings, weights or [1.0] * len(rankings)):
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+@lru_cache(maxsize=256)
+def _shard_text(filename, text_dir=LISTINGS_TEXT_DIR):
+    """Text of an uploaded shard, or None when it is not on disk; rewritten shards get new names"""
+    try:
+        with open(os.path.join(text_dir, os.path.basename(filename)), "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def chunk_listing_ids(text, shard_text=None):
+    """Listing IDs a hosted chunk belongs to, in order.
+
+    Hosted chunks are 400-token windows over shards of many listings, so one can start in the
+    middle of a long description without a "Listing ID:" line of its own, or end in the next
+    listing. Found in its shard, the chunk starts in the listing of the last ID before it.
+    """
+    ids = []
+    if shard_text and not _LISTING_ID_LINE.match(text.lstrip()):
+        start = shard_text.find(text.strip()[:200])
+        if start > 0:
+            ids = _LISTING_ID_LINE.findall(shard_text, 0, start)[-1:]
+    for listing_id in _LISTING_ID_LINE.findall(text):
+        if listing_id not in ids:
+            ids.append(listing_id)
+    return ids
+
+
+async def hosted_vector_search(client, vector_store_id, query, k=20):
+    """Listing IDs ranked by the hosted vector store, in the order file_search would see them"""
+    page = await client.vector_stores.search(vector_store_id, query=query, max_num_results=min(k, 50))
+    ranking = []
+    for result in page.data:
+        filename = getattr(result, "filename", None)
+        shard_text = await asyncio.to_thread(_shard_text, filename) if filename else None
+        for block in result.content:
+            for listing_id in chunk_listing_ids(getattr(block, "text", ""), shard_text):
+                if listing_id not in ranking:
+                    ranking.append(listing_id)
+    return ranking[:k]
+
+
+def local_vector_search(index, query, k=20):
+    """Listing IDs ranked by their best chunk in the offline vector index"""
+    return [listing_id for listing_id, _ in index.search_listings(query, k=k, candidates=4 * k)]
+
+
+class HybridListingSearch:
+    """Fuses BM25 and vector rankings and describes the winning listings from the columnar store"""
+
+    def __init__(self, bm25, store, rrf_k=20, vector_weight=0.5, depth=50, description_chars=400):
+        self.bm25 = bm25
+        self.store = store
+        self.rrf_k = rrf_k
+        # Relative to BM25's weight of 1; see `python hybrid_search.py` for how it was chosen
+        self.vector_weight = vector_weight
+        # How many candidates each ranking contributes to the fusion
+        self.depth = depth
+        self.description_chars = description_chars
+
+    def rank(self, query, vector_ranking=(), k=5):
+        """Top-k fused (listing_id, score, lexical_rank, vector_rank) tuples"""
+        lexical = [doc_id for doc_id, _ in self.bm25.search(query, k=self.depth)]
+        vector = list(vector_ranking)[:self.depth]
+        fused = reciprocal_rank_fusion([lexical, vector], self.rrf_k, [1.0, self.vector_weight])[:k]
+        lexical_rank = {doc_id: rank for rank, doc_id in enumerate(lexical, start=1)}
+        vector_rank = {doc_id: rank for rank, doc_id in enumerate(vector, start=1)}
+        return [(doc_id, score, lexical_rank.get(doc_id), vector_rank.get(doc_id)) for doc_id, score in fused]
+
+    def search(self, query, vector_ranking=(), k=5):
+        """Top-k listings as dicts with the fields the listings agent reports"""
+        return [
+            dict(self.describe(doc_id), score=round(score, 5), lexical_rank=lexical, vector_rank=vector)
+            for doc_id, score, lexical, vector in self.rank(query, vector_ranking, k)
+        ]
+
+    def describe(self, listing_id):
+        row = self.store.row(listing_id)
+        if row is None:
+            return {"listing_id": listing_id}
+        store = self.store
+        price, bedrooms = store["price"][row], store["bedrooms"][row]
+        description = _TAGS.sub(" ", store["description"][row] or "")
+        return {
+            "listing_id": listing_id,
+            "name": store["name"][row],
+            "url": store["listing_url"][row] or f"https://www.airbnb.com/rooms/{listing_id}",
+            "location": store["neighbourhood_cleansed"][row],
+            "room_type": store["room_type"][row],
+            "property_type": store["property_type"][row],
+            "price": None if np.isnan(price) else round(float(price), 2),
+            "accommodates": int(store["accommodates"][row]),
+            "bedrooms": None if np.isnan(bedrooms) else float(bedrooms),
+            "bathrooms": store["bathrooms_text"][row],
+            "description": " ".join(description.split())[:self.description_chars],
+            "amenities": store["amenities"][row],
+        }
+
+
+@lru_cache(maxsize=None)
+def load_hybrid_search(json_file=LISTINGS_JSON, rrf_k=20, vector_weight=0.5):
+    """BM25 index and listings store opened once per process"""
+    return HybridListingSearch(load_bm25_index(json_file), load_listings_store(json_file), rrf_k, vector_weight)
+
+
+def recall_at(ranking, relevant, k):
+    return len(set(ranking[:k]) & set(relevant)) / len(relevant)
+
+
+def evaluate_recall(hybrid, vector_search, benchmark_path=RETRIEVAL_BENCHMARK, ks=(5, 10)):
+    """Mean recall@k of vector-only, BM25-only and hybrid rankings on a labelled query set"""
+    with open(benchmark_path, "r", encoding="utf-8") as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+
+    recalls = {method: {k: [] for k in ks} for method in ("vector", "bm25", "hybrid")}
+    timings = {"bm25": [], "hybrid": []}
+    for example in examples:
+        vector = vector_search(example["query"], hybrid.depth)
+        started = time.perf_counter()
+        lexical = [doc_id for doc_id, _ in hybrid.bm25.search(example["query"], k=max(ks))]
+        timings["bm25"].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        fused = [doc_id for doc_id, *_ in hybrid.rank(example["query"], vector, k=max(ks))]
+        timings["hybrid"].append(time.perf_counter() - started)
+        for method, ranking in (("vector", vector), ("bm25", lexical), ("hybrid", fused)):
+            for k in ks:
+                recalls[method][k].append(recall_at(ranking, example["relevant"], k))
+
+    return {
+        "queries": len(examples),
+        "recall": {
+            method: {f"@{k}": round(float(np.mean(values)), 4) for k, values in by_k.items()}
+            for method, by_k in recalls.items()
+        },
+        "query_ms_p50": {method: round(float(np.median(values)) * 1000, 3) for method, values in timings.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall of vector-only vs hybrid BM25 + vector listings retrieval")
+    parser.add_argument("--benchmark", default=RETRIEVAL_BENCHMARK, help="Labelled JSON lines query set")
+    parser.add_argument("--hosted", action="store_true", help="Use the hosted listings vector store as the vector side")
+    parser.add_argument("--rrf-k", type=int, default=20, help="Reciprocal rank fusion constant")
+    parser.add_argument("--vector-weight", type=float, default=0.5, help="Weight of the vector ranking relative to BM25")
+    args = parser.parse_args()
+
+    hybrid = load_hybrid_search(rrf_k=args.rrf_k, vector_weight=args.vector_weight)
+    if args.hosted:
+        from openai import AsyncOpenAI
+        from agent_registry import load_secrets
+        secrets = load_secrets()
+        client = AsyncOpenAI(api_key=secrets["openai"]["api_key"])
+        vector_store_id = secrets["vectorstore"]["listings_vector_store_id"]
+        loop = asyncio.new_event_loop()
+
+        def vector_search(query, k):
+            return loop.run_until_complete(hosted_vector_search(client, vector_store_id, query, k))
+    else:
+        from local_search import load_local_index
+        index = load_local_index("listings")
+
+        def vector_search(query, k):
+            return local_vector_search(index, query, k)
+
+    print(json.dumps(evaluate_recall(hybrid, vector_search, args.benchmark), indent=2))
+
+
+if __name__ == "__main__":
+    main()
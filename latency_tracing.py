@@ -0,0 +1,216 @@
+# latency_tracing.py
+"""Per-request latency spans for the chat pipeline, built from the agents stream events
+and written to pluggable sinks (in-memory ring buffer, JSONL file)."""
+import json
+import time
+import uuid
+import queue
+import atexit
+import threading
+from collections import deque
+
+import numpy as np
+
+SUMMARY_METRICS = ("ttft", "triage", "total", "tool_seconds", "input_tokens", "output_tokens")
+
+
+class RequestSpan:
+    """Timings of one user query, from process_user_query entry to the last streamed token"""
+
+    def __init__(self, query, session=None):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.session = session
+        self.query = query
+        self.source = "model"
+        self.route = None
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.ttft = None
+        self.triage = None
+        self.total = None
+        self.starting_agent = None
+        self.handoff_target = None
+        self.tools = []
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.error = None
+        self._open_tools = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def mark_token(self):
+        """Call for every streamed chunk; only the first one sets time-to-first-token"""
+        if self.ttft is None:
+            self.ttft = self.elapsed()
+
+    def observe(self, event):
+        """Update the span from one Runner.run_streamed stream event"""
+        if event.type == "agent_updated_stream_event":
+            name = event.new_agent.name
+            if self.starting_agent is None:
+                self.starting_agent = name
+            elif self.handoff_target is None:
+                self.handoff_target = name
+                if self.triage is None:
+                    self.triage = self.elapsed()
+        elif event.type == "run_item_stream_event":
+            self._observe_item(event.name, event.item)
+        elif event.type == "raw_response_event":
+            self._observe_raw(event.data)
+
+    def _observe_item(self, name, item):
+        raw = getattr(item, "raw_item", None)
+        if name == "handoff_requested" and self.triage is None:
+            self.triage = self.elapsed()
+        elif name == "tool_called":
+            call_id = getattr(raw, "call_id", None) or getattr(raw, "id", None)
+            tool = getattr(raw, "name", None) or getattr(raw, "type", "tool")
+            # Hosted file search reports its own timing through raw events
+            if call_id and tool != "file_search_call":
+                self._open_tools[call_id] = (tool, self.elapsed())
+        elif name == "tool_output":
+            call_id = raw.get("call_id") if isinstance(raw, dict) else getattr(raw, "call_id", None)
+            self._close_tool(call_id)
+
+    def _observe_raw(self, data):
+        kind = getattr(data, "type", "")
+        if kind == "response.file_search_call.in_progress":
+            self._open_tools[data.item_id] = ("file_search", self.elapsed())
+        elif kind == "response.file_search_call.completed":
+            self._close_tool(data.item_id)
+        elif kind == "response.completed":
+            usage = getattr(data.response, "usage", None)
+            if usage is not None:
+                self.input_tokens += getattr(usage, "input_tokens", 0) or 0
+                self.output_tokens += getattr(usage, "output_tokens", 0) or 0
+
+    def _close_tool(self, call_id):
+        if call_id in self._open_tools:
+            tool, started = self._open_tools.pop(call_id)
+            self.tools.append({"name": tool, "seconds": round(self.elapsed() - started, 6)})
+
+    def finish(self, error=None):
+        self.total = self.elapsed()
+        self.error = str(error) if error else None
+
+    def to_dict(self):
+        return {
+            "request_id": self.request_id,
+            "session": self.session,
+            "timestamp": self.wall_started,
+            "source": self.source,
+            "route": self.route,
+            "starting_agent": self.starting_agent,
+            "ttft": self.ttft,
+            "triage": self.triage,
+            "handoff_target": self.handoff_target,
+            "tools": self.tools,
+            "tool_seconds": sum(tool["seconds"] for tool in self.tools),
+            "total": self.total,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "error": self.error,
+        }
+
+
+class RingBufferSink:
+    """Keeps the most recent spans in memory"""
+
+    def __init__(self, maxlen=1000):
+        self.spans = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def write(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.spans)
+
+
+class JsonlFileSink:
+    """Appends one JSON line per span from a background writer thread, so finishing a span on the
+    event loop never waits for the disk"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lines = queue.Queue()
+        self._writer = threading.Thread(target=self._write_lines, name="jsonl-span-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def write(self, span):
+        self._lines.put(json.dumps(span) + "\n")
+
+    def flush(self):
+        """Wait until every span written so far is on disk"""
+        self._lines.join()
+
+    def _write_lines(self):
+        while True:
+            lines = [self._lines.get()]
+            # Append whatever else queued up meanwhile with the same open()
+            while True:
+                try:
+                    lines.append(self._lines.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+            except Exception as e:
+                print(f"Error writing {len(lines)} spans to {self.path}: {e}")
+            finally:
+                for _ in lines:
+                    self._lines.task_done()
+
+
+def summarise_spans(spans, metrics=SUMMARY_METRICS):
+    """p50/p95/p99 (and count) of each metric over a list of span dicts"""
+    summary = {"requests": len(spans)}
+    for metric in metrics:
+        values = np.array([s[metric] for s in spans if s.get(metric) is not None], dtype=np.float64)
+        if len(values):
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            summary[metric] = {"count": int(len(values)), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+    return summary
+
+
+class Tracer:
+    """Creates request spans and fans finished spans out to every sink"""
+
+    def __init__(self, sinks=None, buffer_size=1000):
+        self.buffer = RingBufferSink(buffer_size)
+        self.sinks = [self.buffer] + list(sinks or [])
+
+    def start(self, query, session=None):
+        return RequestSpan(query, session)
+
+    def finish(self, span, error=None):
+        span.finish(error)
+        record = span.to_dict()
+        for sink in self.sinks:
+            try:
+                sink.write(record)
+            except Exception as e:
+                print(f"Error writing span to {type(sink).__name__}: {e}")
+        return record
+
+    def summary(self):
+        """Latency percentiles over the spans in the ring buffer"""
+        return summarise_spans(self.buffer.snapshot())
+
+
+_shared_tracer = None
+_shared_tracer_lock = threading.Lock()
+
+
+def get_tracer(jsonl_path=None, buffer_size=1000):
+    """Process-wide tracer; settings apply on first use"""
+    global _shared_tracer
+    with _shared_tracer_lock:
+        if _shared_tracer is None:
+            _shared_tracer = Tracer([JsonlFileSink(jsonl_path)] if jsonl_path else [], buffer_size)
+        return _shared_tracer
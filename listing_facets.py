@@ -0,0 +1,257 @@
+# listing_facets.py
+"""Precomputed facet tables over the listings: counts, price percentiles and availability by
+neighbourhood, room type, property type, accommodates band, minimum guests and amenity, overall
+and within each neighbourhood.
+
+The tables answer aggregate questions ("cheapest areas for a family of 4", "how many listings
+have a pool in Waverley") exactly with dictionary lookups. Suburbs that are not neighbourhoods
+(e.g. "Bondi", "Surry Hills") are aggregated on the fly from the listings index instead.
+
+    python listing_facets.py          # build data/sydney_listings.facets.json
+"""
+import os
+import json
+import time
+import argparse
+from functools import lru_cache
+
+import numpy as np
+
+from columnar_store import LISTINGS_JSON, open_listings_store
+from listings_index import load_listings_index
+
+FACETS_VERSION = 1
+
+FACETS = ("neighbourhood", "room_type", "property_type", "accommodates", "guests", "amenity")
+# Facets also tabulated within every neighbourhood
+NEIGHBOURHOOD_FACETS = ("room_type", "property_type", "accommodates", "guests", "amenity")
+
+# Accommodates bands, (label, low, high) inclusive
+ACCOMMODATES_BANDS = (("1-2", 1, 2), ("3-4", 3, 4), ("5-6", 5, 6), ("7-8", 7, 8), ("9+", 9, None))
+# "guests" rows are the listings accommodating at least that many guests
+MAX_GUESTS = 16
+# Facets over category/bitset columns, whose values are matched like the listings filters
+FACET_COLUMNS = {"neighbourhood": "neighbourhood_cleansed", "room_type": "room_type",
+                 "property_type": "property_type", "amenity": "amenities"}
+
+SORT_KEYS = ("listings", "median_price", "mean_price", "mean_availability_365")
+
+
+def facets_path(json_file):
+    """data/sydney_listings.json -> data/sydney_listings.facets.json"""
+    return os.path.splitext(json_file)[0] + ".facets.json"
+
+
+def _normalise(value):
+    return " ".join(str(value).lower().split())
+
+
+def facet_stats(price, availability, rows):
+    """Count, price percentiles and availability of the listings at `rows`"""
+    prices = price[rows]
+    prices = prices[~np.isnan(prices)]
+    availability = availability[rows]
+    stats = {"listings": int(len(rows)), "priced_listings": int(len(prices))}
+    if len(prices):
+        p10, p25, p50, p75, p90 = np.percentile(prices, [10, 25, 50, 75, 90])
+        stats.update({
+            "min_price": round(float(prices.min()), 2),
+            "p10_price": round(float(p10), 2),
+            "p25_price": round(float(p25), 2),
+            "median_price": round(float(p50), 2),
+            "p75_price": round(float(p75), 2),
+            "p90_price": round(float(p90), 2),
+            "max_price": round(float(prices.max()), 2),
+            "mean_price": round(float(prices.mean()), 2),
+        })
+    if len(rows):
+        stats["mean_availability_365"] = round(float(availability.mean()), 1)
+        stats["available_share"] = round(float((availability > 0).mean()), 3)
+    return stats
+
+
+def _groups(store, facet, rows):
+    """(value, subset of `rows`) for every value of `facet` among `rows`"""
+    if facet in ("neighbourhood", "room_type", "property_type"):
+        column = store[FACET_COLUMNS[facet]]
+        codes = column.codes[rows]
+        for code in np.unique(codes):
+            yield column.vocabulary[code] or "Unknown", rows[codes == code]
+    elif facet == "accommodates":
+        accommodates = store["accommodates"][rows]
+        for label, low, high in ACCOMMODATES_BANDS:
+            in_band = (accommodates >= low) & (accommodates <= (high if high is not None else np.iinfo(np.int16).max))
+            if in_band.any():
+                yield label, rows[in_band]
+    elif facet == "guests":
+        accommodates = store["accommodates"][rows]
+        for guests in range(1, MAX_GUESTS + 1):
+            fits = accommodates >= guests
+            if fits.any():
+                yield str(guests), rows[fits]
+    elif facet == "amenity":
+        amenities = store["amenities"]
+        bits = amenities.bits[rows]
+        for term_id, amenity in enumerate(amenities.vocabulary):
+            has = (bits[:, term_id >> 3] >> (7 - (term_id & 7))) & 1 == 1
+            if has.any():
+                yield amenity, rows[has]
+    else:
+        raise ValueError(f"Unknown facet: {facet}")
+
+
+def aggregate(store, facet, rows):
+    """{value: stats} of one facet over the listings at `rows`"""
+    price, availability = store["price"], store["availability_365"]
+    return {value: facet_stats(price, availability, subset) for value, subset in _groups(store, facet, rows)}
+
+
+def build_facets(store):
+    """Every facet table, overall and within each neighbourhood"""
+    price, availability = store["price"], store["availability_365"]
+    rows = np.arange(len(store))
+    tables = {"all": facet_stats(price, availability, rows)}
+    tables.update({facet: aggregate(store, facet, rows) for facet in FACETS})
+    tables["by_neighbourhood"] = {
+        neighbourhood: {facet: aggregate(store, facet, subset) for facet in NEIGHBOURHOOD_FACETS}
+        for neighbourhood, subset in _groups(store, "neighbourhood", rows)
+    }
+    return tables
+
+
+def write_facets(json_file=LISTINGS_JSON, path=None):
+    """Offline aggregation job: build the facet tables of a listings dump and save them as JSON"""
+    path = path or facets_path(json_file)
+    store = open_listings_store(json_file)
+    started = time.perf_counter()
+    facets = {"version": FACETS_VERSION, "source": store.footer["source"], "tables": build_facets(store)}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(facets, f)
+    os.replace(tmp_path, path)
+    print(f"Built listing facets for {len(store)} listings in {time.perf_counter() - started:.2f}s")
+    return facets
+
+
+class ListingFacets:
+    """In-memory facet tables plus on-the-fly aggregation for areas that are not neighbourhoods"""
+
+    def __init__(self, tables, index=None):
+        self.tables = tables
+        # Lazily loaded ListingsIndex, needed for suburbs and single-value questions
+        self._index = index
+
+    @classmethod
+    def load(cls, json_file=LISTINGS_JSON, path=None):
+        """Read the saved tables, rebuilding them when missing, outdated or built from other listings"""
+        path = path or facets_path(json_file)
+        store = open_listings_store(json_file)
+        facets = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                facets = json.load(f)
+        if not facets or facets.get("version") != FACETS_VERSION or facets.get("source") != store.footer["source"]:
+            facets = write_facets(json_file, path)
+        return cls(facets["tables"])
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = load_listings_index()
+        return self._index
+
+    def query(self, facet, value=None, neighbourhood=None, sort_by="listings", descending=None, limit=10):
+        """Facet rows as {"facet", "scope", "rows": [{"value", ...stats}], ...}.
+
+        `value` selects one row; for neighbourhoods, room and property types and amenities it covers
+        every value filter_listings would match (amenity "pool" is "Pool", "Outdoor pool", ... together)
+        and is aggregated on demand. Otherwise the rows are sorted by `sort_by`
+        (prices ascending, counts and availability descending unless `descending` says otherwise).
+        `neighbourhood` restricts the table to the council areas filter_listings would match, or to a
+        suburb matched in the listing names and overviews.
+        """
+        if facet not in FACETS:
+            raise ValueError(f"Unknown facet {facet!r}; expected one of {', '.join(FACETS)}")
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"Unknown sort {sort_by!r}; expected one of {', '.join(SORT_KEYS)}")
+
+        result = {"facet": facet, "scope": "all listings", "source": "precomputed"}
+        table = self.tables[facet]
+        # Rows of the listings in scope, None for all of them
+        scope = None
+        if neighbourhood:
+            # The same council areas as filter_listings(neighbourhood=...): "Sydney" is only Sydney
+            neighbourhoods = self.index.neighbourhoods
+            area_ids = self.index.neighbourhood_ids(neighbourhood)
+            areas = [neighbourhoods.vocabulary[i] or "Unknown" for i in area_ids]
+            if area_ids:
+                scope = np.flatnonzero(neighbourhoods.mask(area_ids))
+                result["scope"] = "neighbourhood " + ", ".join(areas)
+            if len(areas) == 1:
+                table = {areas[0]: table[areas[0]]} if facet == "neighbourhood" else self.tables["by_neighbourhood"][areas[0]][facet]
+            elif areas:
+                # Several council areas named alike: their precomputed tables cannot be merged
+                table = aggregate(self.index.store, facet, scope)
+                result["source"] = "aggregated on demand"
+            else:
+                scope = np.flatnonzero(self.index.filter_mask(neighbourhood=neighbourhood))
+                table = aggregate(self.index.store, facet, scope)
+                result.update(scope=f"listings mentioning {neighbourhood!r}", source="aggregated on demand",
+                              area=facet_stats(self.index.price, self.index.store["availability_365"], scope))
+
+        if value is not None and facet in FACET_COLUMNS:
+            # "pool" covers "Pool", "Outdoor pool", "Private outdoor pool - ..." together, matched
+            # exactly as filter_listings matches them, so the row is their union
+            column = self.index.store[FACET_COLUMNS[facet]]
+            if facet == "neighbourhood":
+                term_ids = self.index.neighbourhood_ids(value)
+            else:
+                term_ids = self.index.term_ids(column, value)
+            mask = column.mask(term_ids) if term_ids else np.zeros(len(self.index), dtype=bool)
+            rows = np.flatnonzero(mask) if scope is None else scope[mask[scope]]
+            result["source"] = "aggregated on demand"
+            if not len(rows):
+                result.update(rows=[], note=f"No listings with {facet} {value!r} in this scope")
+                return result
+            stats = facet_stats(self.index.price, self.index.store["availability_365"], rows)
+            result["rows"] = [dict(value=value, matched_values=[column.vocabulary[i] for i in term_ids], **stats)]
+            return result
+
+        if value is not None:
+            key = {_normalise(key): key for key in table}.get(_normalise(value))
+            result["rows"] = [dict(value=key, **table[key])] if key is not None else []
+            if key is None:
+                result["note"] = f"No listings with {facet} {value!r} in this scope"
+            return result
+
+        if descending is None:
+            descending = not sort_by.endswith("_price")
+        missing = float("-inf") if descending else float("inf")
+        ordered = sorted(table.items(), key=lambda item: item[1].get(sort_by, missing), reverse=descending)
+        result["total_values"] = len(table)
+        result["sorted_by"] = f"{sort_by} {'descending' if descending else 'ascending'}"
+        result["rows"] = [dict(value=value, **stats) for value, stats in ordered[:limit]]
+        return result
+
+
+@lru_cache(maxsize=None)
+def load_listing_facets(json_file=LISTINGS_JSON):
+    """Facet tables of a listings dump, loaded once per process"""
+    return ListingFacets.load(json_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the listing facet tables")
+    parser.add_argument("--listings", default=LISTINGS_JSON, help="Listings JSON lines file")
+    args = parser.parse_args()
+
+    path = facets_path(args.listings)
+    write_facets(args.listings, path)
+    started = time.perf_counter()
+    facets = ListingFacets.load(args.listings, path)
+    print(f"✅ {path}: {os.path.getsize(path) / 1e6:.2f} MB, loads in {(time.perf_counter() - started) * 1000:.1f} ms, "
+          f"{len(facets.tables['neighbourhood'])} neighbourhoods, {len(facets.tables['amenity'])} amenities")
+
+
+if __name__ == "__main__":
+    main()
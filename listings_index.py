@@ -0,0 +1,179 @@
+# listings_index.py
+"""In-process columnar index over the listings for hard filters (price, guests, bedrooms, area...)
+
+    python listings_index.py    # check the filter counts in data/filter_checks.jsonl
+"""
+import os
+import re
+import json
+import argparse
+from functools import lru_cache
+
+import numpy as np
+
+from columnar_store import LISTINGS_JSON, open_listings_store
+
+FILTER_CHECKS = os.path.join(os.path.dirname(__file__), "data", "filter_checks.jsonl")
+
+# Words after a term that name something other than the term itself ("Pool table", "Gym nearby")
+_OTHER_THAN = ("table", "view", "nearby")
+
+
+def _normalise(value):
+    return " ".join(str(value).lower().split())
+
+
+def matching_term_ids(vocabulary, term):
+    """Indices of the normalised vocabulary values naming `term` as a whole word: "pool" matches
+    "Pool", "Outdoor pool" and "Shared outdoor pool", but not "Whirlpool" or "Pool table"."""
+    pattern = re.compile(rf"\b{re.escape(_normalise(term))}\b(?! (?:{'|'.join(_OTHER_THAN)})\b)")
+    return [i for i, value in enumerate(vocabulary) if pattern.search(value)]
+
+
+class ListingsIndex:
+    """Filters over the compiled columnar listings store (columnar_store.py): numeric fields are
+    memory-mapped NumPy arrays and neighbourhood, room type and amenities are matched against
+    their interned vocabularies. Filters are evaluated as boolean masks."""
+
+    def __init__(self, store):
+        self.store = store
+        self.ids = store["id"]
+        self.names = store["name"]
+        self.neighbourhoods = store["neighbourhood_cleansed"]
+        self.room_types = store["room_type"]
+        self.property_types = store["property_type"]
+        self.urls = store["listing_url"]
+        self.price = store["price"]
+        self.accommodates = store["accommodates"]
+        self.bedrooms = store["bedrooms"]
+        self.min_nights = store["minimum_nights"]
+        self.max_nights = store["maximum_nights"]
+        self.amenities = store["amenities"]
+
+        # Vocabularies are small, so their normalised forms are kept in memory
+        self._vocabularies = {
+            id(column): [_normalise(term) for term in column.vocabulary]
+            for column in (self.neighbourhoods, self.room_types, self.property_types, self.amenities)
+        }
+        self._location_text = None
+
+    @classmethod
+    def from_json(cls, json_file=LISTINGS_JSON):
+        """Open the compiled store of a listings JSON lines file, compiling it when missing or stale"""
+        return cls(open_listings_store(json_file))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def term_ids(self, column, term):
+        """Vocabulary IDs of a category or bitset column's values matching `term` (see matching_term_ids)"""
+        return matching_term_ids(self._vocabularies[id(column)], term)
+
+    def _terms_mask(self, column, term):
+        """Rows with any value matching `term` (e.g. "pool" matches "Pool" and "Shared outdoor pool")"""
+        term_ids = self.term_ids(column, term)
+        if not term_ids:
+            return np.zeros(len(self), dtype=bool)
+        return column.mask(term_ids)
+
+    def neighbourhood_ids(self, location):
+        """Vocabulary IDs of the council areas `location` names: the exact area when there is one
+        ("Sydney" is not "North Sydney", a separate council), else every area naming it as a whole word"""
+        vocabulary = self._vocabularies[id(self.neighbourhoods)]
+        term = _normalise(location)
+        if term in vocabulary:
+            return [vocabulary.index(term)]
+        return self.term_ids(self.neighbourhoods, location)
+
+    def _location_mask(self, location):
+        term_ids = self.neighbourhood_ids(location)
+        if term_ids:
+            return self.neighbourhoods.mask(term_ids)
+        # Suburbs such as "Bondi" are not neighbourhoods (councils) in the dumps, so fall back
+        # to the name and overview, decoded on first use
+        if self._location_text is None:
+            overviews = self.store["neighborhood_overview"]
+            self._location_text = [
+                _normalise(f"{self.names[row] or ''} {overviews[row] or ''}") for row in range(len(self))
+            ]
+        term = _normalise(location)
+        return np.fromiter((term in text for text in self._location_text), dtype=bool, count=len(self))
+
+    def filter_mask(self, min_price=None, max_price=None, guests=None, min_bedrooms=None,
+                    nights=None, neighbourhood=None, room_type=None, amenities=None):
+        """Boolean mask of the listings matching every given constraint"""
+        mask = np.ones(len(self), dtype=bool)
+        if min_price is not None:
+            mask &= self.price >= min_price
+        if max_price is not None:
+            mask &= self.price <= max_price
+        if guests is not None:
+            mask &= self.accommodates >= guests
+        if min_bedrooms is not None:
+            mask &= self.bedrooms >= min_bedrooms
+        if nights is not None:
+            mask &= (self.min_nights <= nights) & (self.max_nights >= nights)
+        if neighbourhood:
+            mask &= self._location_mask(neighbourhood)
+        if room_type:
+            mask &= self._terms_mask(self.room_types, room_type)
+        for amenity in amenities or []:
+            mask &= self._terms_mask(self.amenities, amenity)
+        return mask
+
+    def filter(self, limit=20, **constraints):
+        """Listings matching the constraints, cheapest first, as {"total": n, "listings": [...]}"""
+        rows = np.flatnonzero(self.filter_mask(**constraints))
+        # NaN prices sort last
+        rows = rows[np.argsort(self.price[rows], kind="stable")]
+        return {
+            "total": int(len(rows)),
+            "listings": [self.describe(row) for row in rows[:limit]],
+        }
+
+    def describe(self, row):
+        """Compact dict of the structured fields of one listing"""
+        price = self.price[row]
+        bedrooms = self.bedrooms[row]
+        listing_id = str(self.ids[row])
+        return {
+            "listing_id": listing_id,
+            "name": self.names[row] or "",
+            "url": self.urls[row] or f"https://www.airbnb.com/rooms/{listing_id}",
+            "neighbourhood": self.neighbourhoods[row],
+            "room_type": self.room_types[row],
+            "property_type": self.property_types[row],
+            "price": None if np.isnan(price) else round(float(price), 2),
+            "accommodates": int(self.accommodates[row]),
+            "bedrooms": None if np.isnan(bedrooms) else float(bedrooms),
+            "minimum_nights": int(self.min_nights[row]),
+            "maximum_nights": int(self.max_nights[row]),
+        }
+
+
+@lru_cache(maxsize=None)
+def load_listings_index(json_file=LISTINGS_JSON):
+    """Open the listings index once per process"""
+    return ListingsIndex.from_json(json_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check listing filter counts against known totals")
+    parser.add_argument("--checks", default=FILTER_CHECKS, help="JSON lines of {constraints, total}")
+    args = parser.parse_args()
+
+    index = load_listings_index()
+    with open(args.checks, "r", encoding="utf-8") as f:
+        checks = [json.loads(line) for line in f if line.strip()]
+    failed = 0
+    for check in checks:
+        total = int(index.filter_mask(**check["constraints"]).sum())
+        ok = total == check["total"]
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {json.dumps(check['constraints'])}: {total} (expected {check['total']})")
+    if failed:
+        raise SystemExit(f"{failed} of {len(checks)} filter checks failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# local_search.py
+"""Offline vector search over the listing and review documents.
+
+Embeddings are stored as a memory-mapped float32 matrix and searched with batched
+NumPy cosine similarity (brute force, or an optional IVF index for larger corpora).
+"""
+import os
+import json
+from functools import lru_cache
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from airbnb_data import chunk_listing_id
+
+LOCAL_INDEX_DIR = os.path.join(os.path.dirname(__file__), "data", "local_index")
+
+EMBEDDINGS_FILE = "embeddings.f32"
+DOCUMENTS_FILE = "documents.jsonl"
+META_FILE = "meta.json"
+IVF_FILES = ("ivf_centroids.npy", "ivf_order.npy", "ivf_bounds.npy")
+
+
+class HashingEmbedder:
+    """Deterministic, network-free embedding stand-in: hashed word/bigram counts weighted by TF-IDF"""
+
+    def __init__(self, dim=512, idf=None, stop_words="english", token_pattern=r"(?u)\b\w\w+\b"):
+        self.dim = dim
+        self.idf = idf
+        self.stop_words = stop_words
+        self.token_pattern = token_pattern
+        self.vectorizer = HashingVectorizer(
+            n_features=dim, ngram_range=(1, 2), stop_words=stop_words, token_pattern=token_pattern,
+            alternate_sign=False, norm=None, dtype=np.float32,
+        )
+
+    def fit(self, texts, batch_size=1000):
+        """Learn IDF weights from a stream of texts"""
+        doc_freq = np.zeros(self.dim, dtype=np.float64)
+        n_docs = 0
+        batch = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) == batch_size:
+                doc_freq += np.bincount(self.vectorizer.transform(batch).indices, minlength=self.dim)
+                n_docs += len(batch)
+                batch = []
+        if batch:
+            doc_freq += np.bincount(self.vectorizer.transform(batch).indices, minlength=self.dim)
+            n_docs += len(batch)
+        self.idf = (np.log((1 + n_docs) / (1 + doc_freq)) + 1).astype(np.float32)
+        return self
+
+    def embed(self, texts):
+        """L2-normalised float32 embeddings, one row per text"""
+        counts = self.vectorizer.transform(texts)
+        counts.data = 1 + np.log(counts.data)
+        if self.idf is not None:
+            counts = counts.multiply(self.idf).tocsr()
+        return normalize(counts).toarray().astype(np.float32, copy=False)
+
+    def save(self, path):
+        np.save(os.path.join(path, "idf.npy"), self.idf)
+        return {"type": "hashing", "dim": self.dim, "stop_words": self.stop_words, "token_pattern": self.token_pattern}
+
+    @classmethod
+    def load(cls, path, config):
+        return cls(
+            dim=config["dim"], idf=np.load(os.path.join(path, "idf.npy")),
+            stop_words=config.get("stop_words", "english"),
+            token_pattern=config.get("token_pattern", r"(?u)\b\w\w+\b"),
+        )
+
+
+class OpenAIEmbedder:
+    """Hosted embeddings, for building a local index with the same vectors as production"""
+
+    def __init__(self, client, model="text-embedding-3-small", dim=1536):
+        self.client = client
+        self.model = model
+        self.dim = dim
+
+    def fit(self, texts, batch_size=1000):
+        return self
+
+    def embed(self, texts):
+        response = self.client.embeddings.create(model=self.model, input=list(texts))
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        return normalize(vectors).astype(np.float32, copy=False)
+
+    def save(self, path):
+        return {"type": "openai", "model": self.model, "dim": self.dim}
+
+
+class LocalVectorIndex:
+    """Memory-mapped embedding matrix plus the documents it was built from"""
+
+    def __init__(self, path, embedder=None):
+        self.path = path
+        with open(os.path.join(path, META_FILE), "r") as f:
+            self.meta = json.load(f)
+
+        config = self.meta["embedder"]
+        if embedder is None:
+            if config["type"] != "hashing":
+                raise ValueError(f"An embedder is required to query a '{config['type']}' index")
+            embedder = HashingEmbedder.load(path, config)
+        self.embedder = embedder
+
+        self.ids = self.meta["ids"]
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self.embeddings = np.memmap(
+            os.path.join(path, EMBEDDINGS_FILE), dtype=np.float32, mode="r",
+            shape=(len(self.ids), config["dim"]),
+        )
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+
+        self.ivf = None
+        if os.path.exists(os.path.join(path, "ivf_centroids.npy")):
+            self.ivf = {
+                "centroids": np.load(os.path.join(path, "ivf_centroids.npy")),
+                "order": np.load(os.path.join(path, "ivf_order.npy")),
+                "bounds": np.load(os.path.join(path, "ivf_bounds.npy")),
+            }
+
+    @classmethod
+    def build(cls, path, documents, embedder, batch_size=256, ivf_lists=0):
+        """Build an index from a factory returning fresh (doc_id, text) iterators.
+
+        The factory is called twice: once to fit the embedder and once to embed the
+        documents, so memory stays bounded by `batch_size` whatever the corpus size.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in IVF_FILES:
+            if os.path.exists(os.path.join(path, name)):
+                os.remove(os.path.join(path, name))
+        embedder.fit(text for _, text in documents())
+
+        ids = []
+        offsets = []
+        position = 0
+        with open(os.path.join(path, EMBEDDINGS_FILE), "wb") as emb_file, \
+                open(os.path.join(path, DOCUMENTS_FILE), "wb") as doc_file:
+            batch = []
+            for doc in documents():
+                batch.append(doc)
+                if len(batch) == batch_size:
+                    emb_file.write(embedder.embed([text for _, text in batch]).tobytes())
+                    batch = []
+                line = (json.dumps({"id": doc[0], "text": doc[1]}) + "\n").encode("utf-8")
+                doc_file.write(line)
+                ids.append(doc[0])
+                offsets.append(position)
+                position += len(line)
+            if batch:
+                emb_file.write(embedder.embed([text for _, text in batch]).tobytes())
+
+        np.save(os.path.join(path, "offsets.npy"), np.array(offsets, dtype=np.int64))
+        meta = {"embedder": embedder.save(path), "ids": ids}
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump(meta, f)
+
+        index = cls(path, embedder)
+        if ivf_lists:
+            index.build_ivf(ivf_lists)
+        return index
+
+    def build_ivf(self, n_lists, iterations=10, seed=0):
+        """Cluster the embeddings with spherical k-means so queries only scan the nearest lists"""
+        n_lists = min(n_lists, len(self.ids))
+        rng = np.random.default_rng(seed)
+        centroids = np.array(self.embeddings[rng.choice(len(self.ids), n_lists, replace=False)])
+        for _ in range(iterations):
+            assignment = self._nearest_centroids(centroids)
+            for c in range(n_lists):
+                members = self.embeddings[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = normalize(centroids).astype(np.float32)
+        assignment = self._nearest_centroids(centroids)
+
+        order = np.argsort(assignment, kind="stable").astype(np.int64)
+        bounds = np.searchsorted(assignment[order], np.arange(n_lists + 1)).astype(np.int64)
+        np.save(os.path.join(self.path, "ivf_centroids.npy"), centroids)
+        np.save(os.path.join(self.path, "ivf_order.npy"), order)
+        np.save(os.path.join(self.path, "ivf_bounds.npy"), bounds)
+        self.ivf = {"centroids": centroids, "order": order, "bounds": bounds}
+
+    def _nearest_centroids(self, centroids, chunk_size=8192):
+        assignment = np.empty(len(self.ids), dtype=np.int64)
+        for start in range(0, len(self.ids), chunk_size):
+            chunk = self.embeddings[start:start + chunk_size]
+            assignment[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+        return assignment
+
+    def search(self, queries, k=5, n_probe=8):
+        """Top-k (doc_id, score) pairs for each query text, best first"""
+        if isinstance(queries, str):
+            queries = [queries]
+        return [
+            [(self.ids[row], score) for row, score in ranked]
+            for ranked in self.search_vectors(self.embedder.embed(queries), k, n_probe)
+        ]
+
+    def search_vectors(self, query_vectors, k=5, n_probe=8, chunk_size=8192):
+        """Top-k (row, score) pairs for each query vector, best first"""
+        if self.ivf is not None:
+            return [self._search_ivf(vector, k, n_probe) for vector in query_vectors]
+
+        # Keep a running top-k per query while scanning the matrix in row chunks
+        best_scores = np.full((len(query_vectors), 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((len(query_vectors), 0), dtype=np.int64)
+        for start in range(0, len(self.ids), chunk_size):
+            scores = query_vectors @ self.embeddings[start:start + chunk_size].T
+            rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            ranked = np.argsort(-scores)
+            results.append([(int(rows[i]), float(scores[i])) for i in ranked])
+        return results
+
+    def _search_ivf(self, vector, k, n_probe):
+        centroids, order, bounds = self.ivf["centroids"], self.ivf["order"], self.ivf["bounds"]
+        probe = np.argsort(-(centroids @ vector))[:n_probe]
+        # Sorted rows keep the memmap reads sequential
+        rows = np.sort(np.concatenate([order[bounds[c]:bounds[c + 1]] for c in probe]))
+        scores = self.embeddings[rows] @ vector
+        top = np.argsort(-scores)[:k]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def document(self, doc_id):
+        """Text of a document by ID"""
+        with open(os.path.join(self.path, DOCUMENTS_FILE), "rb") as f:
+            f.seek(int(self.offsets[self.rows[doc_id]]))
+            return json.loads(f.readline())["text"]
+
+    def search_listings(self, query, k=5, candidates=50):
+        """Top-k listing IDs for a single query, each with its best matching chunks, best first.
+
+        Returns [(listing_id, [(chunk_id, score), ...]), ...].
+        """
+        groups = {}
+        for chunk_id, score in self.search(query, k=max(k, candidates))[0]:
+            groups.setdefault(chunk_listing_id(chunk_id), []).append((chunk_id, score))
+        return list(groups.items())[:k]
+
+    def search_documents(self, query, k=5, chunks_per_listing=2):
+        """Top-k listings for a single query as {"listing_id", "score", "text"} dicts, where the text
+        is only the listing's best matching chunks"""
+        return [
+            {
+                "listing_id": listing_id,
+                "score": round(chunks[0][1], 4),
+                "text": "\n\n".join(self.document(chunk_id) for chunk_id, _ in chunks[:chunks_per_listing]),
+            }
+            for listing_id, chunks in self.search_listings(query, k)
+        ]
+
+
+@lru_cache(maxsize=None)
+def load_local_index(data_type, index_dir=LOCAL_INDEX_DIR):
+    """Open the local index of a data type once per process"""
+    return LocalVectorIndex(os.path.join(index_dir, data_type))
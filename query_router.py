@@ -0,0 +1,163 @@
+# query_router.py
+"""Deterministic fast-path router run before the LLM triage agent.
+
+Keyword/regex rules handle the obvious cases and a small scikit-learn model trained on
+data/router_examples.jsonl handles the rest; only queries neither is confident about
+fall back to the triage agent.
+
+    python query_router.py    # routing accuracy and latency saved on data/router_benchmark.jsonl
+"""
+import os
+import re
+import json
+import time
+import argparse
+from functools import lru_cache
+
+from sklearn.pipeline import make_pipeline
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+ROUTER_EXAMPLES = os.path.join(os.path.dirname(__file__), "data", "router_examples.jsonl")
+ROUTER_BENCHMARK = os.path.join(os.path.dirname(__file__), "data", "router_benchmark.jsonl")
+
+OFF_TOPIC_REPLY = (
+    "Sorry mate, that one's outside my patch! I'm WanderRoo - I can help you find Airbnb stays around Sydney "
+    "and sum up what guests reckon about them. What kind of place are ya after?"
+)
+
+_LISTING_ID = re.compile(r"\b\d{5,}\b")
+_REVIEW_WORDS = re.compile(
+    r"\b(reviews?|reviewed|feedback|complain\w*|sentiment|recommendation score"
+    r"|(guests?|people|visitors) (say|said|think|thought|rate|rated|recommend|enjoy\w*|complain\w*)"
+    r"|according to (the )?(previous |past )?(guests|reviewers|people))\b",
+    re.IGNORECASE,
+)
+_SEARCH_INTENT = re.compile(
+    r"\b(find|looking for|need|search|book|show me (some|a|places|listings|homes|apartments|houses)"
+    r"|with (good|great|best|high) (reviews|ratings)|highly rated|top rated|best rated)\b",
+    re.IGNORECASE,
+)
+_LISTING_WORDS = re.compile(
+    r"\b(stay|stays|place|places|apartments?|house|houses|homes?|rooms?|studio|cottage|accommodation|listings?"
+    r"|bedrooms?|guests?|nights?|adults|budget|cheap\w*|pet.friendly|pool|wifi|parking|airbnb)\b|\$\d+|under \d+",
+    re.IGNORECASE,
+)
+# Only words that never come up in a guest's questions; "email the host", "can the host cook",
+# "movie theatres near Bondi" and "news about Vivid" are travel questions
+_OFF_TOPIC_WORDS = re.compile(
+    r"\b(football|rugby|cricket|afl|nrl|election|prime minister|president|bitcoin|stocks?|invest\w*"
+    r"|recipe|bake|homework|maths?|python|script|poem|joke|translate"
+    r"|quantum|dating|celebrity)\b",
+    re.IGNORECASE,
+)
+
+
+def load_examples(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def rule_route(query):
+    """(label, confidence) for unambiguous keyword matches, or None"""
+    reviews = bool(_REVIEW_WORDS.search(query))
+    search = bool(_SEARCH_INTENT.search(query))
+    listings = bool(_LISTING_WORDS.search(query))
+    if reviews and _LISTING_ID.search(query) and not search:
+        return "reviews", 1.0
+    if reviews and not search:
+        return "reviews", 0.95
+    if _OFF_TOPIC_WORDS.search(query) and not (reviews or listings):
+        return "off_topic", 0.9
+    if (listings or search) and not reviews:
+        return "listings", 0.9
+    return None
+
+
+class QueryRouter:
+    """Routes a query to "listings", "reviews" or "off_topic", or returns None to defer to the triage agent.
+
+    Examples labelled "triage" are travel questions no specialist answers; they are always deferred.
+    """
+
+    def __init__(self, examples_path=ROUTER_EXAMPLES, threshold=0.6):
+        self.threshold = threshold
+        examples = load_examples(examples_path)
+        self.model = make_pipeline(
+            TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True),
+            LogisticRegression(C=10, max_iter=1000),
+        )
+        self.model.fit([e["query"] for e in examples], [e["label"] for e in examples])
+
+    def route(self, query):
+        """{"label", "confidence", "method"} when confident, otherwise None"""
+        ruled = rule_route(query)
+        if ruled and ruled[0] != "off_topic":
+            return {"label": ruled[0], "confidence": ruled[1], "method": "rule"}
+        probabilities = self.model.predict_proba([query])[0]
+        best = probabilities.argmax()
+        if ruled:
+            # Off-topic words alone never refuse a query: the model must agree, else triage decides
+            if self.model.classes_[best] != "off_topic":
+                return None
+            return {"label": ruled[0], "confidence": ruled[1], "method": "rule"}
+        if probabilities[best] >= self.threshold and self.model.classes_[best] != "triage":
+            return {"label": str(self.model.classes_[best]), "confidence": float(probabilities[best]), "method": "model"}
+        return None
+
+
+def benchmark_router(router, benchmark_path=ROUTER_BENCHMARK, triage_seconds=1.5):
+    """Routing accuracy, coverage and estimated latency saved on a labelled query set.
+
+    Queries the router defers are assumed to be routed correctly by the triage agent;
+    every locally routed query saves one triage round trip of `triage_seconds`. Queries labelled
+    "triage" (travel questions no specialist answers, e.g. Sydney's weather) must be deferred.
+    """
+    examples = load_examples(benchmark_path)
+    routed = correct_routed = 0
+    route_seconds = 0.0
+    mistakes = []
+    for example in examples:
+        started = time.perf_counter()
+        route = router.route(example["query"])
+        route_seconds += time.perf_counter() - started
+        if route is None:
+            continue
+        routed += 1
+        if route["label"] == example["label"]:
+            correct_routed += 1
+        else:
+            mistakes.append({"query": example["query"], "expected": example["label"], "got": route["label"]})
+
+    total = len(examples)
+    return {
+        "queries": total,
+        "routed_locally": routed,
+        "coverage": routed / total if total else 0.0,
+        "accuracy_routed": correct_routed / routed if routed else 0.0,
+        "accuracy_overall": (correct_routed + total - routed) / total if total else 0.0,
+        "mean_route_ms": route_seconds / total * 1000 if total else 0.0,
+        "estimated_seconds_saved": routed * triage_seconds - route_seconds,
+        "mistakes": mistakes,
+    }
+
+
+@lru_cache(maxsize=None)
+def load_query_router(threshold=0.6):
+    """Train the router once per process"""
+    return QueryRouter(threshold=threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fast-path query router")
+    parser.add_argument("--benchmark", default=ROUTER_BENCHMARK, help="Labelled JSON lines query set")
+    parser.add_argument("--threshold", type=float, default=0.6, help="Minimum model confidence to route locally")
+    parser.add_argument("--triage-seconds", type=float, default=1.5, help="Measured p50 of the LLM triage step")
+    args = parser.parse_args()
+
+    report = benchmark_router(QueryRouter(threshold=args.threshold), args.benchmark, args.triage_seconds)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
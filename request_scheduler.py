@@ -0,0 +1,392 @@
+# request_scheduler.py
+"""Process-wide scheduler in front of every OpenAI API call made through the shared async client.
+
+It sits in the client's httpx transport, so the agents runner's model calls, file search and
+the hybrid tool's vector store searches all pass through it:
+
+- identical in-flight requests (same endpoint, body and key) are sent once and share the reply
+- request and token budgets per minute are enforced with token buckets
+- waiting requests are released by priority ("interactive" before "background"), FIFO within one
+- 429s, 5xx replies and connection errors are retried with jittered exponential backoff, and a
+  429 pauses the whole queue for its Retry-After
+"""
+import json
+import time
+import heapq
+import random
+import asyncio
+import hashlib
+import itertools
+import contextlib
+import contextvars
+from collections import deque
+
+import httpx
+import numpy as np
+
+PRIORITIES = {"interactive": 0, "background": 1}
+
+# Replies worth retrying
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+# Endpoints whose identical in-flight requests can share one reply (never uploads or deletes)
+COALESCED_PATHS = ("/embeddings", "/search", "/responses", "/chat/completions")
+# Output tokens reserved for generation requests that do not set a limit
+DEFAULT_OUTPUT_TOKENS = 1024
+GENERATION_PATHS = ("/responses", "/chat/completions", "/completions")
+
+_priority = contextvars.ContextVar("request_priority", default="interactive")
+
+
+@contextlib.contextmanager
+def request_priority(name):
+    """Run the API calls made inside the block (and the tasks it starts) at another priority, e.g. the
+    review summariser's batch calls at "background" """
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority {name!r}; expected one of {', '.join(PRIORITIES)}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """`per_minute` units refilled continuously, holding at most `burst_seconds` worth"""
+
+    def __init__(self, per_minute, burst_seconds=60.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0 when they are now)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def limit(self, remaining, now):
+        """Lower the level to what the API reports is left, e.g. when other processes share the key"""
+        self._refill(now)
+        self.level = min(self.level, float(remaining))
+
+
+def estimate_tokens(request):
+    """Tokens a request counts against the per-minute budget: ~4 bytes per input token plus the
+    output limit of generation requests"""
+    if request.method != "POST" or not request.content:
+        return 0
+    tokens = len(request.content) // 4
+    if request.url.path.endswith(GENERATION_PATHS):
+        try:
+            body = json.loads(request.content)
+        except ValueError:
+            body = {}
+        limit = body.get("max_output_tokens") or body.get("max_completion_tokens") or body.get("max_tokens")
+        tokens += limit or DEFAULT_OUTPUT_TOKENS
+    return tokens
+
+
+def _is_streaming(request):
+    return b'"stream":true' in request.content.replace(b" ", b"")
+
+
+def _retry_after(response):
+    """Seconds the API asked us to wait, if it said"""
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(response.headers[header]) * scale
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+class SingleFlight:
+    """Lets identical concurrent callers wait for the first one's result instead of repeating its work"""
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def lead(self, key):
+        """None when the caller now leads `key` and must finish() it, else the future of the identical
+        call already in flight"""
+        future = self._calls.get(key)
+        if future is not None:
+            self.followers += 1
+            return future
+        self._calls[key] = asyncio.get_running_loop().create_future()
+        self.leaders += 1
+        return None
+
+    def finish(self, key, result=None):
+        """Hand the leader's result (None when it failed) to its followers"""
+        future = self._calls.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def stats(self):
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "followers": self.followers}
+
+
+class RequestScheduler:
+    """Rate-limit-aware priority queue with single-flight deduplication and retries.
+
+    One scheduler is shared by every session (see AgentRegistry.request_scheduler) and only
+    used from the event loop.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, burst_seconds=60.0, max_retries=5,
+                 base_delay=0.5, max_delay=20.0, wait_window=1000):
+        # Budgets left as None are the key's own limits, read from the x-ratelimit-limit-* headers of
+        # the API's replies; configured ones override them. Until a first reply has arrived, a single
+        # request is sent to learn them.
+        # The API may enforce a per-minute limit over shorter windows; lower burst_seconds if bursts get 429s
+        self.burst_seconds = burst_seconds
+        self.buckets = {
+            "requests": TokenBucket(requests_per_minute, burst_seconds) if requests_per_minute else None,
+            "tokens": TokenBucket(tokens_per_minute, burst_seconds) if tokens_per_minute else None,
+        }
+        self._configured = {kind for kind, bucket in self.buckets.items() if bucket is not None}
+        self._probing = False
+        self._replied = False
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._queue = []
+        self._order = itertools.count()
+        self._timer = None
+        self._paused_until = 0.0
+        self._inflight = {}
+
+        # Reported by stats()
+        self.max_queue_depth = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self._waits = {name: deque(maxlen=wait_window) for name in PRIORITIES}
+
+    async def submit(self, request, send):
+        """Reply to `request`, sent with `send(request)` once the budgets allow it"""
+        # Buffer the body so retries and the coalescing key can read it
+        await request.aread()
+        key = self._coalescing_key(request)
+        if key is None:
+            return await self._send_with_retries(request, send)
+
+        if key in self._inflight:
+            self.coalesced += 1
+            leader, ticket = self._inflight[key]
+            # An interactive caller must not wait behind the background request it joined
+            self._promote(ticket, _priority.get())
+            status_code, headers, content = await asyncio.shield(leader)
+            return httpx.Response(status_code, headers=headers, content=content, request=request)
+
+        ticket = {"priority": _priority.get(), "entry": None}
+        leader = asyncio.ensure_future(self._send_and_read(request, send, ticket))
+        self._inflight[key] = (leader, ticket)
+        try:
+            status_code, headers, content = await asyncio.shield(leader)
+        finally:
+            if self._inflight.get(key, (None,))[0] is leader:
+                del self._inflight[key]
+        return httpx.Response(status_code, headers=headers, content=content, request=request)
+
+    async def _send_and_read(self, request, send, ticket):
+        response = await self._send_with_retries(request, send, ticket)
+        try:
+            # Raw bytes, so each copy decodes them with the original headers
+            content = b"".join([chunk async for chunk in response.stream])
+        finally:
+            await response.aclose()
+        return response.status_code, response.headers.multi_items(), content
+
+    def _coalescing_key(self, request):
+        if request.method == "POST":
+            if not request.url.path.endswith(COALESCED_PATHS) or _is_streaming(request):
+                return None
+        elif request.method != "GET":
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (request.method, str(request.url), request.headers.get("authorization", "")):
+            digest.update(part.encode("utf-8") + b"\0")
+        digest.update(request.content)
+        return digest.hexdigest()
+
+    async def _send_with_retries(self, request, send, ticket=None):
+        # Priority and queue entry of this request, shared with the callers coalesced onto it
+        ticket = ticket or {"priority": _priority.get(), "entry": None}
+        tokens = estimate_tokens(request)
+        # Retries keep their place in the queue
+        order = next(self._order)
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(ticket, order, tokens)
+            response = error = None
+            try:
+                response = await send(request)
+            except httpx.TransportError as e:
+                error = e
+            except BaseException:
+                self._observe_limits(None)
+                raise
+            self._observe_limits(response)
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+
+            if attempt == self.max_retries:
+                self.failures += 1
+                if error is not None:
+                    raise error
+                return response
+
+            self.retries += 1
+            delay = self._backoff(attempt, _retry_after(response))
+            if response is not None:
+                if response.status_code == 429:
+                    self.rate_limited += 1
+                    # Every queued request would hit the same limit
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                await response.aclose()
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt, retry_after=None):
+        """Full jitter over an exponentially growing window, never sooner than Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    def _observe_limits(self, response):
+        """Adopt the budgets and remaining allowance the API reports; None when the send failed"""
+        now = time.monotonic()
+        headers = response.headers if response is not None else {}
+        for kind in ("requests", "tokens"):
+            try:
+                limit = float(headers[f"x-ratelimit-limit-{kind}"])
+                if kind not in self._configured and limit > 0:
+                    bucket = self.buckets[kind]
+                    if bucket is None or bucket.rate * 60 != limit:
+                        self.buckets[kind] = TokenBucket(limit, self.burst_seconds)
+            except (KeyError, ValueError):
+                pass
+            try:
+                if self.buckets[kind] is not None:
+                    self.buckets[kind].limit(float(headers[f"x-ratelimit-remaining-{kind}"]), now)
+            except (KeyError, ValueError):
+                pass
+        if response is not None:
+            self._replied = True
+        if self._probing:
+            self._probing = False
+            self._release()
+
+    async def _acquire(self, ticket, order, tokens):
+        """Wait until this request is the most urgent one and both budgets cover it"""
+        waiter = asyncio.get_running_loop().create_future()
+        ticket["entry"] = [PRIORITIES[ticket["priority"]], order, tokens, waiter]
+        heapq.heappush(self._queue, ticket["entry"])
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        started = time.monotonic()
+        self._release()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            self._queue = [entry for entry in self._queue if entry[3] is not waiter]
+            heapq.heapify(self._queue)
+            if waiter.done() and not waiter.cancelled():
+                # Released but never sent: if it was the budget probe, let another request probe
+                self._probing = False
+            self._release()
+            raise
+        finally:
+            ticket["entry"] = None
+        self._waits[ticket["priority"]].append(time.monotonic() - started)
+        self.sent += 1
+
+    def _promote(self, ticket, priority):
+        """Raise a request, queued or not yet, to `priority` if that is more urgent"""
+        if PRIORITIES[priority] >= PRIORITIES[ticket["priority"]]:
+            return
+        ticket["priority"] = priority
+        if ticket["entry"] is not None:
+            ticket["entry"][0] = PRIORITIES[priority]
+            heapq.heapify(self._queue)
+            self._release()
+
+    def _release(self):
+        """Start queued requests in priority order while the budgets allow, else wake up when they will"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue:
+            _, _, tokens, waiter = self._queue[0]
+            if waiter.done():
+                heapq.heappop(self._queue)
+                continue
+            if self._probing:
+                # Woken again by the probe's reply
+                return
+            now = time.monotonic()
+            requests, tokens_bucket = self.buckets["requests"], self.buckets["tokens"]
+            wait = max(self._paused_until - now,
+                       requests.wait_time(1, now) if requests else 0.0,
+                       tokens_bucket.wait_time(tokens, now) if tokens_bucket else 0.0)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._release)
+                return
+            heapq.heappop(self._queue)
+            if requests:
+                requests.take(1)
+            if tokens_bucket:
+                tokens_bucket.take(tokens)
+            if not self._replied and None in self.buckets.values():
+                # Budgets unknown yet: this request probes them, the rest wait for its reply
+                self._probing = True
+            waiter.set_result(None)
+
+    def stats(self):
+        """Queue depth, request counters and queue wait percentiles per priority"""
+        waits = {}
+        for name, values in self._waits.items():
+            if values:
+                p50, p95 = np.percentile(list(values), [50, 95])
+                waits[name] = {"count": len(values), "p50": float(p50), "p95": float(p95), "max": float(max(values))}
+        return {
+            "queue_depth": len(self._queue),
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight_coalescable": len(self._inflight),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+            "budgets_per_minute": {
+                kind: round(bucket.rate * 60) if bucket else None for kind, bucket in self.buckets.items()
+            },
+            "wait_seconds": waits,
+        }
+
+
+class ScheduledTransport(httpx.AsyncBaseTransport):
+    """httpx transport that sends every request through a RequestScheduler"""
+
+    def __init__(self, scheduler, transport=None):
+        self.scheduler = scheduler
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        return await self.scheduler.submit(request, self.transport.handle_async_request)
+
+    async def aclose(self):
+        await self.transport.aclose()
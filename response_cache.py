@@ -0,0 +1,183 @@
+# response_cache.py
+"""Two-layer response cache in front of the agent run: exact match on the normalised
+query, then cosine similarity on query embeddings among entries with the same numbers and
+key terms (places, amenities, negations). Both layers share TTL and LRU eviction."""
+import re
+import time
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from columnar_store import LISTINGS_JSON, load_listings_store
+from local_search import HashingEmbedder
+
+_NUMBERS = re.compile(r"\d+(?:\.\d+)?")
+_PUNCTUATION = re.compile(r"[^\w\s$.]")
+# Words that do not change what is being asked
+_FILLER_WORDS = {"a", "an", "the", "me", "please", "show", "find", "can", "could", "you", "i", "want", "some", "give", "us"}
+# Words that flip the meaning of the word after them
+_NEGATIONS = {"no", "not", "without", "non", "never", "except", "excluding", "dont", "don", "avoid"}
+# Proper nouns in listing names and overviews, e.g. "Bondi", "Tramsheds"
+_CAPITALISED = re.compile(r"\b[A-Z][a-z]+\b")
+
+
+def _singular(word):
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def normalise_query(query):
+    """Lower-case, strip punctuation and filler words, singularise plurals and collapse whitespace"""
+    words = _PUNCTUATION.sub(" ", query.lower()).split()
+    return " ".join(_singular(word) for word in words if word not in _FILLER_WORDS)
+
+
+@lru_cache(maxsize=None)
+def load_key_terms(json_file=LISTINGS_JSON):
+    """Words that change which listings a query is about: neighbourhoods, suburbs and other proper
+    nouns from the listing names and overviews, amenities, property and room types"""
+    store = load_listings_store(json_file)
+    phrases = []
+    for column in ("neighbourhood_cleansed", "property_type", "room_type", "amenities"):
+        phrases.extend(term for term in store[column].vocabulary if term)
+    names, overviews = store["name"], store["neighborhood_overview"]
+    for row in range(len(store)):
+        phrases.extend(_CAPITALISED.findall(f"{names[row] or ''} {overviews[row] or ''}"))
+    words = {word for phrase in phrases for word in normalise_query(phrase).split()}
+    return frozenset(word for word in words if word not in ENGLISH_STOP_WORDS and not _NUMBERS.fullmatch(word))
+
+
+def key_terms(normalised, vocabulary):
+    """Key terms of a normalised query, with negated words marked, e.g. "no pool" -> {"no:pool", "pool"}"""
+    words = normalised.split()
+    terms = set()
+    for i, word in enumerate(words):
+        if word in _NEGATIONS:
+            terms.add("no:" + (words[i + 1] if i + 1 < len(words) else ""))
+        elif word in vocabulary:
+            terms.add(word)
+    return frozenset(terms)
+
+
+class ResponseCache:
+    """LRU + TTL cache of full agent responses keyed by (routing context, normalised query)"""
+
+    def __init__(self, max_entries=512, ttl_seconds=3600, similarity_threshold=0.9, embedder=None, key_vocabulary=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # Keep every token (numbers, "for", "2") so "for 2" and "for 4" never look alike
+        self.embedder = embedder or HashingEmbedder(dim=1024, stop_words=None, token_pattern=r"(?u)\b\w+\b")
+        # A long query differing only in its suburb or "no" still scores above the threshold, so
+        # similar entries must also share every key term; see load_key_terms()
+        if similarity_threshold is not None and key_vocabulary is None:
+            try:
+                key_vocabulary = load_key_terms()
+            except Exception as e:
+                print(f"Key terms unavailable, caching exact matches only: {e}")
+                self.similarity_threshold = None
+        self.key_vocabulary = key_vocabulary or frozenset()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, query, context=""):
+        """Cached response for the query in this context, or None"""
+        normalised = normalise_query(query)
+        key = (context, normalised)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["response"]
+
+            if self.similarity_threshold is not None:
+                match = self._most_similar(normalised, context)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.similar_hits += 1
+                    return self._entries[match]["response"]
+
+            self.misses += 1
+            return None
+
+    def put(self, query, response, context=""):
+        """Cache a full response"""
+        normalised = normalise_query(query)
+        key = (context, normalised)
+        vector = self.embedder.embed([normalised])[0]
+        with self._lock:
+            self._entries[key] = {
+                "response": response,
+                "vector": vector,
+                "numbers": _NUMBERS.findall(normalised),
+                "terms": key_terms(normalised, self.key_vocabulary),
+                "expires": time.monotonic() + self.ttl_seconds,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _most_similar(self, normalised, context):
+        numbers = _NUMBERS.findall(normalised)
+        terms = key_terms(normalised, self.key_vocabulary)
+        # Prices, guest counts, listing IDs, places, amenities and negations must match exactly;
+        # similarity only covers the rest of the wording
+        candidates = [
+            key for key, entry in self._entries.items()
+            if key[0] == context and entry["numbers"] == numbers and entry["terms"] == terms
+        ]
+        if not candidates:
+            return None
+        vector = self.embedder.embed([normalised])[0]
+        scores = np.stack([self._entries[key]["vector"] for key in candidates]) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            return candidates[best]
+        return None
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if entry["expires"] <= now]
+        for key in expired:
+            del self._entries[key]
+        self.expirations += len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters"""
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache(**settings):
+    """Process-wide cache shared by every chat session; settings apply on first use"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache(**settings)
+        return _shared_cache
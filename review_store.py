@@ -0,0 +1,149 @@
+# review_store.py
+"""Keyed access to the reviews through the compiled columnar reviews store,
+and the on-disk table of precomputed review summaries"""
+import os
+import json
+import sqlite3
+import threading
+from functools import lru_cache
+
+from columnar_store import REVIEWS_JSON, open_reviews_store
+SUMMARIES_DB = os.path.join(os.path.dirname(__file__), "data", "review_summaries.sqlite")
+# Stored as the database's user_version; older tables are dropped and rebuilt by summarise_reviews.py
+SUMMARIES_SCHEMA_VERSION = 2
+
+
+class ReviewStore:
+    """Direct lookup of every review comment of a listing by its ID, from the compiled reviews store"""
+
+    def __init__(self, json_file=REVIEWS_JSON):
+        self.json_file = json_file
+        # One row per comment, grouped by listing, with a listing ID -> row range footer index
+        self.store = open_reviews_store(json_file)
+
+    def __contains__(self, listing_id):
+        return listing_id in self.store
+
+    def __len__(self):
+        return len(self.store)
+
+    def listing_ids(self):
+        return self.store.listing_ids()
+
+    def comments(self, listing_id):
+        """Individual review comments of a listing"""
+        return self.store.comments(listing_id)
+
+
+class ReviewSummaryTable:
+    """SQLite table of precomputed review summaries keyed by listing ID.
+
+    Only model-written summaries are `servable` as an answer on their own; keyword summaries are
+    context for the reviews agent and have no score.
+    """
+
+    def __init__(self, path=SUMMARIES_DB):
+        self.path = path
+        # One connection per thread; SQLite connections cannot be shared across threads
+        self._local = threading.local()
+        with self._connect() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SUMMARIES_SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS review_summaries")
+                conn.execute(f"PRAGMA user_version = {SUMMARIES_SCHEMA_VERSION}")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS review_summaries (
+                    listing_id TEXT PRIMARY KEY,
+                    source_hash TEXT NOT NULL,
+                    review_count INTEGER NOT NULL,
+                    score REAL,
+                    sentiment TEXT NOT NULL,
+                    overall TEXT NOT NULL,
+                    strengths TEXT NOT NULL,
+                    weaknesses TEXT NOT NULL,
+                    servable INTEGER NOT NULL
+                )"""
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def get(self, listing_id):
+        """Summary dict of a listing, or None when it has not been precomputed"""
+        row = self._connect().execute(
+            "SELECT listing_id, review_count, score, sentiment, overall, strengths, weaknesses, servable "
+            "FROM review_summaries WHERE listing_id = ?",
+            (str(listing_id),),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "listing_id": row[0],
+            "review_count": row[1],
+            "score": row[2],
+            "sentiment": row[3],
+            "overall": row[4],
+            "strengths": json.loads(row[5]),
+            "weaknesses": json.loads(row[6]),
+            "servable": bool(row[7]),
+        }
+
+    def source_hashes(self):
+        """listing_id -> hash of the reviews each stored summary was built from"""
+        return dict(self._connect().execute("SELECT listing_id, source_hash FROM review_summaries"))
+
+    def put_many(self, summaries):
+        """Insert or replace (source_hash, summary) pairs in one transaction"""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO review_summaries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        str(summary["listing_id"]), source_hash, summary["review_count"], summary.get("score"),
+                        summary["sentiment"], summary["overall"],
+                        json.dumps(summary["strengths"]), json.dumps(summary["weaknesses"]),
+                        int(summary.get("servable", False)),
+                    )
+                    for source_hash, summary in summaries
+                ],
+            )
+
+    def delete_missing(self, listing_ids):
+        """Drop summaries of listings that no longer have reviews"""
+        keep = set(str(listing_id) for listing_id in listing_ids)
+        stale = [listing_id for listing_id in self.source_hashes() if listing_id not in keep]
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM review_summaries WHERE listing_id = ?", [(i,) for i in stale])
+        return len(stale)
+
+
+def format_review_summary(summary):
+    """Render a servable precomputed summary under the headings the reviews agent uses"""
+    strengths = "\n".join(f"- {s}" for s in summary["strengths"]) or "- None stood out"
+    weaknesses = "\n".join(f"- {w}" for w in summary["weaknesses"]) or "- No common complaints"
+    score = f"**Recommendation Score:** {summary['score']:.1f}/10\n\n" if summary.get("score") is not None else ""
+    return (
+        f"**Reviews for listing {summary['listing_id']}** ({summary['review_count']} reviews)\n\n"
+        f"**Overall Satisfaction:** {summary['overall']}\n\n"
+        f"**Strengths:**\n{strengths}\n\n"
+        f"**Weaknesses:**\n{weaknesses}\n\n"
+        f"{score}"
+        f"**Most Reviews:** {summary['sentiment']}"
+    )
+
+
+@lru_cache(maxsize=None)
+def load_review_store(json_file=REVIEWS_JSON):
+    """Open the compiled reviews once per process"""
+    return ReviewStore(json_file)
+
+
+@lru_cache(maxsize=None)
+def load_review_summaries(path=SUMMARIES_DB):
+    """Open the summary table once per process, or None when the batch job has not run"""
+    if not os.path.exists(path):
+        return None
+    return ReviewSummaryTable(path)
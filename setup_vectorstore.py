@@ -1,8 +1,15 @@
 # setup_vectorstore.py
 import os
+import json
+import asyncio
+import argparse
 import toml
-from openai import OpenAI
-from vector import VectorStoreManager
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from openai import OpenAI, AsyncOpenAI
+from bm25_index import build_listings_bm25
+from vector import (VectorStoreManager, DATA_TYPES, DEFAULT_CITY, dataset_paths, vector_store_name, find_vector_stores,
+                    find_vector_stores_async, run_ingestion_job)
 
 def load_api_key_from_secrets():
     """Load OpenAI API key from .streamlit/secrets.toml"""
@@ -13,19 +20,145 @@ def load_api_key_from_secrets():
     secrets = toml.load(secrets_path)
     return secrets.get("openai", {}).get("api_key", None)
 
+def build_local_indexes(ivf_lists=0):
+    """Build the offline listings and reviews indexes (no API key or network needed)"""
+    print("📦 Building local vector indexes...")
+    manager = VectorStoreManager(client=None)
+    for data_type in ("listings", "reviews"):
+        manager.build_local_index(data_type, ivf_lists=ivf_lists)
+    build_listings_bm25()
+    print("✅ Local indexes ready in data/local_index.")
+
+def ingestion_jobs(cities, data_types):
+    """(city, data_type) jobs whose source JSON exists; missing datasets are reported and skipped"""
+    jobs = []
+    for city in cities:
+        for data_type in data_types:
+            source = dataset_paths(city, data_type)["source"]
+            if os.path.exists(source):
+                jobs.append((city, data_type))
+            else:
+                print(f"⚠️ Skipping {city} {data_type}: {source} not found")
+    return jobs
+
+def run_jobs(jobs, workers, client_factory=None, vector_stores=None, dry_run=False, **manager_options):
+    """Run every job in a process pool; returns the checkpoint (or dry-run plan) of each job"""
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as executor:
+        futures = {
+            executor.submit(
+                run_ingestion_job, city, data_type,
+                vector_stores[(city, data_type)].id if vector_stores else None,
+                client_factory, dry_run, **manager_options
+            ): (city, data_type)
+            for city, data_type in jobs
+        }
+        for future in as_completed(futures):
+            city, data_type = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = failed_job(city, data_type, e)
+            results.append(result)
+            report_job(result, dry_run)
+    return sorted(results, key=lambda r: (r["city"], r["data_type"]))
+
+async def run_jobs_async(jobs, client, **manager_options):
+    """Run every job concurrently on one event loop with an AsyncOpenAI client"""
+    names = {job: vector_store_name(*job) for job in jobs}
+    found = await find_vector_stores_async(client, sorted(set(names.values())))
+
+    async def run(city, data_type):
+        manager = VectorStoreManager(client, city=city, **manager_options)
+        try:
+            result = await manager.ingest_async(found[names[(city, data_type)]], data_type)
+        except Exception as e:
+            result = failed_job(city, data_type, e)
+        report_job(result)
+        return result
+
+    results = await asyncio.gather(*(run(city, data_type) for city, data_type in jobs))
+    return sorted(results, key=lambda r: (r["city"], r["data_type"]))
+
+def failed_job(city, data_type, error):
+    print(f"❌ {city} {data_type} failed: {error}")
+    return {"city": city, "data_type": data_type, "stage": "failed", "error": str(error)}
+
+def report_job(result, dry_run=False):
+    if result.get("skipped"):
+        print(f"✅ {result['city']} {result['data_type']}: up to date")
+    elif not dry_run:
+        print(f"{'✅' if result.get('stage') == 'complete' else '❌'} {result['city']} {result['data_type']}: "
+              f"{result.get('stage')}, {result.get('files_uploaded', 0)} files uploaded")
+
+def ingest_in_processes(jobs, api_key, workers, **manager_options):
+    """Look up the vector stores once, then ingest in a process pool"""
+    print("⚙️ Initializing OpenAI client...")
+    client_factory = partial(OpenAI, api_key=api_key)
+
+    # Every store is looked up in one pass here, so the worker processes never list them
+    names = {job: vector_store_name(*job) for job in jobs}
+    found = find_vector_stores(client_factory(), sorted(set(names.values())))
+    vector_stores = {job: found[name] for job, name in names.items()}
+
+    print(f"📦 Running {len(jobs)} ingestion jobs with {workers} workers...")
+    return run_jobs(jobs, workers, client_factory, vector_stores, **manager_options)
+
 def main():
+    parser = argparse.ArgumentParser(description="Populate the WanderRoo vector stores")
+    parser.add_argument("cities", nargs="*", default=[DEFAULT_CITY], help="Cities to ingest, read from data/<city>_{listings,reviews}.json")
+    parser.add_argument("--types", default=",".join(DATA_TYPES), help="Comma-separated data types to ingest")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Jobs run in parallel processes")
+    parser.add_argument("--dry-run", action="store_true", help="Report the documents and bytes to ingest without uploading")
+    parser.add_argument("--batch-size", type=int, default=20, help="Files per vector store file batch")
+    parser.add_argument("--concurrent-batches", type=int, default=4, help="Batches uploaded at once by each job")
+    parser.add_argument("--records-per-shard", type=int, default=50, help="Documents per uploaded text file")
+    parser.add_argument("--asyncio", action="store_true", help="Run every job in this process on one event loop with AsyncOpenAI")
+    parser.add_argument("--local", action="store_true", help="Build the offline vector indexes instead of the hosted vector stores")
+    parser.add_argument("--ivf-lists", type=int, default=0, help="Number of IVF lists for the local index (0 = brute force)")
+    args = parser.parse_args()
+
+    if args.local:
+        build_local_indexes(args.ivf_lists)
+        return
+
+    data_types = [t.strip() for t in args.types.split(",") if t.strip()]
+    unknown = set(data_types) - set(DATA_TYPES)
+    if unknown:
+        parser.error(f"Unknown data types: {', '.join(sorted(unknown))}")
+
+    jobs = ingestion_jobs([city.lower() for city in args.cities], data_types)
+    if not jobs:
+        print("Nothing to ingest.")
+        return
+    manager_options = {
+        "batch_size": args.batch_size,
+        "max_concurrent_batches": args.concurrent_batches,
+        "records_per_shard": args.records_per_shard,
+    }
+
+    if args.dry_run:
+        print(f"🔍 Planning {len(jobs)} ingestion jobs...")
+        plans = run_jobs(jobs, args.workers, dry_run=True, **manager_options)
+        print(json.dumps(plans, indent=2))
+        print(f"Would upload {sum(p.get('files_to_upload', 0) for p in plans)} files, "
+              f"{sum(p.get('bytes_to_upload', 0) for p in plans) / 1e6:.2f} MB in total.")
+        return
+
     print("🔑 Loading OpenAI API key from secrets.toml...")
     api_key = load_api_key_from_secrets()
     if not api_key:
         raise ValueError("Missing OpenAI API key in secrets.toml under [openai] section.")
 
-    print("⚙️ Initializing OpenAI client...")
-    client = OpenAI(api_key=api_key)
-
-    print("📦 Setting up Airbnb vector stores...")
-    manager = VectorStoreManager(client=client)
-    manager.set_airbnb_vector_stores()
+    if args.asyncio:
+        print(f"📦 Running {len(jobs)} ingestion jobs on the event loop...")
+        results = asyncio.run(run_jobs_async(jobs, AsyncOpenAI(api_key=api_key), **manager_options))
+    else:
+        results = ingest_in_processes(jobs, api_key, args.workers, **manager_options)
 
+    failed = [r for r in results if r.get("stage") != "complete"]
+    if failed:
+        raise SystemExit(f"❌ {len(failed)} of {len(results)} jobs failed; re-run to resume them.")
     print("✅ Vector stores setup complete.")
 
 if __name__ == "__main__":
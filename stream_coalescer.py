@@ -0,0 +1,124 @@
+# stream_coalescer.py
+"""Batches streamed answer text into fewer, larger websocket messages"""
+import time
+import asyncio
+
+
+class StreamCoalescer:
+    """Sends text fragments through `send` (e.g. cl.Message.stream_token) in batches.
+
+    The first fragment goes out at once, so time-to-first-token is not delayed. After that a
+    batch is sent when `interval` seconds have passed or `max_chars` are waiting. Sends run one
+    at a time in a background task, and fragments that arrive during a slow send join the next
+    batch. The interval adapts to about twice the recent send time, so a slow client gets fewer,
+    bigger messages. Once `max_buffered_chars` are waiting, `add()` blocks until the sender
+    catches up (backpressure on the model stream).
+    """
+
+    def __init__(self, send, min_interval=0.03, max_interval=0.5, max_chars=512, max_buffered_chars=16384):
+        self.send = send
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.max_chars = max_chars
+        self.max_buffered_chars = max_buffered_chars
+
+        self._parts = []
+        self._chars = 0
+        self._closed = False
+        self._task = None
+        self._error = None
+        self._pending = asyncio.Event()
+        self._full = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._send_seconds = None
+
+        # Reported by stats()
+        self.sends = 0
+        self.fragments = 0
+        self.backpressure_waits = 0
+
+    async def add(self, text):
+        """Queue a fragment; waits only while the buffer is over `max_buffered_chars`"""
+        if not text:
+            return
+        self._raise_error()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+        self._parts.append(text)
+        self._chars += len(text)
+        self.fragments += 1
+        self._pending.set()
+        if self._chars >= self.max_chars:
+            self._full.set()
+        if self._chars >= self.max_buffered_chars:
+            self.backpressure_waits += 1
+            self._drained.clear()
+            await self._drained.wait()
+            self._raise_error()
+
+    async def close(self):
+        """Send whatever is left and wait for the sender to finish"""
+        self._closed = True
+        self._pending.set()
+        self._full.set()
+        if self._task is not None:
+            await self._task
+        self._raise_error()
+
+    def _raise_error(self):
+        """Surface a failed send to the caller instead of buffering forever"""
+        if self._error is not None:
+            raise self._error
+
+    def stats(self):
+        return {
+            "fragments": self.fragments,
+            "sends": self.sends,
+            "interval": self.interval,
+            "backpressure_waits": self.backpressure_waits,
+        }
+
+    async def _run(self):
+        try:
+            await self._send_batches()
+        except Exception as e:
+            # Kept for add() and close(), so the task itself never ends with an unretrieved exception
+            self._error = e
+        finally:
+            # Wake an add() blocked on backpressure, whether the sender finished or failed
+            self._drained.set()
+
+    async def _send_batches(self):
+        first = True
+        while True:
+            await self._pending.wait()
+            if not first and not self._closed:
+                # Let more fragments arrive, unless enough text is already waiting
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            first = False
+
+            text = "".join(self._parts)
+            self._parts = []
+            self._chars = 0
+            self._pending.clear()
+            self._full.clear()
+            self._drained.set()
+
+            if text:
+                started = time.perf_counter()
+                await self.send(text)
+                self._adapt(time.perf_counter() - started)
+                self.sends += 1
+            if self._closed and not self._parts:
+                return
+
+    def _adapt(self, seconds):
+        """Widen the batching interval to about twice the (smoothed) time a send takes"""
+        self._send_seconds = seconds if self._send_seconds is None else 0.8 * self._send_seconds + 0.2 * seconds
+        self.interval = min(self.max_interval, max(self.min_interval, 2 * self._send_seconds))
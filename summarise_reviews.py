@@ -0,0 +1,213 @@
+# summarise_reviews.py
+"""Offline batch job precomputing the structured review summary of every listing.
+
+    python summarise_reviews.py --openai   # gpt-4o-mini, one call per listing with new reviews
+    python summarise_reviews.py            # local keyword summariser, no API calls
+
+Only model-written summaries are served to users as they are. Keyword summaries are rough
+(aspects and polarity per sentence) and only give the reviews agent context next to the comments.
+"""
+import re
+import json
+import asyncio
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from airbnb_data import content_hash
+from review_store import ReviewStore, ReviewSummaryTable, REVIEWS_JSON, SUMMARIES_DB
+from request_scheduler import request_priority
+
+_WORDS = re.compile(r"[a-z']+")
+_SENTENCES = re.compile(r"(?<=[.!?])\s+")
+
+POSITIVE_WORDS = {
+    "great", "good", "lovely", "amazing", "excellent", "perfect", "wonderful", "beautiful", "fantastic",
+    "clean", "comfortable", "comfy", "spacious", "friendly", "helpful", "responsive", "quiet", "easy",
+    "recommend", "awesome", "nice", "enjoyed", "love", "loved", "convenient", "stunning", "cosy", "cozy",
+    "spotless", "welcoming", "best", "pleasant", "peaceful", "gorgeous", "brilliant",
+}
+NEGATIVE_WORDS = {
+    "dirty", "noisy", "noise", "loud", "small", "tiny", "broken", "smell", "smelly", "uncomfortable",
+    "rude", "poor", "bad", "terrible", "awful", "disappointing", "disappointed", "cold", "hot", "issue",
+    "issues", "problem", "problems", "stained", "unclean", "cramped", "expensive", "mould", "mold",
+    "cockroach", "cockroaches", "difficult", "worst", "unresponsive", "leaking",
+}
+NEGATIONS = {"not", "no", "never", "wasn't", "isn't", "didn't", "don't", "hardly"}
+
+# Aspect label -> words that signal it
+ASPECTS = {
+    "Location": {"location", "located", "walk", "walking", "close", "beach", "station", "transport", "shops", "restaurants"},
+    "Cleanliness": {"clean", "spotless", "tidy", "dirty", "unclean", "stained", "dust", "mould", "mold"},
+    "Host": {"host", "hosts", "responsive", "communication", "helpful", "welcoming", "rude", "unresponsive"},
+    "Comfort": {"bed", "beds", "comfortable", "comfy", "cosy", "cozy", "uncomfortable", "pillows"},
+    "Space": {"spacious", "space", "room", "small", "tiny", "cramped"},
+    "Noise": {"quiet", "peaceful", "noise", "noisy", "loud"},
+    "Views": {"view", "views", "outlook"},
+    "Value": {"value", "price", "worth", "expensive", "cheap"},
+    "Amenities": {"kitchen", "wifi", "pool", "parking", "aircon", "air", "washer", "amenities"},
+    "Check-in": {"check", "checkin", "keys", "instructions", "lockbox"},
+}
+
+
+def sentence_polarity(words):
+    """+1/-1 per sentiment word, flipped after a negation"""
+    polarity = 0
+    for i, word in enumerate(words):
+        sign = 1 if word in POSITIVE_WORDS else -1 if word in NEGATIVE_WORDS else 0
+        if sign and i and words[i - 1] in NEGATIONS:
+            sign = -sign
+        polarity += sign
+    return polarity
+
+
+def lexicon_summary(listing_id, comments, max_items=4):
+    """Cheap, deterministic keyword summary from sentiment words and aspect keywords; not servable
+    as an answer and without a recommendation score"""
+    positive = negative = 0
+    strengths, weaknesses = Counter(), Counter()
+    for comment in comments:
+        for sentence in _SENTENCES.split(comment.lower()):
+            words = _WORDS.findall(sentence)
+            polarity = sentence_polarity(words)
+            if not polarity:
+                continue
+            if polarity > 0:
+                positive += 1
+            else:
+                negative += 1
+            mentioned = {aspect for aspect, keywords in ASPECTS.items() if keywords.intersection(words)}
+            (strengths if polarity > 0 else weaknesses).update(mentioned)
+
+    rated = positive + negative
+    positive_share = positive / rated if rated else 0.5
+    sentiment = "Positive" if positive_share >= 0.7 else "Negative" if positive_share <= 0.3 else "Mixed"
+    # Aspects praised and criticised about equally are left out of both lists
+    top_strengths = [a for a, n in strengths.most_common() if n > weaknesses[a]][:max_items]
+    top_weaknesses = [a for a, n in weaknesses.most_common() if n >= strengths[a]][:max_items]
+    overall = (
+        f"{len(comments)} reviews, {round(positive_share * 100)}% of opinionated sentences positive."
+        + (f" Guests mostly praise: {', '.join(top_strengths).lower()}." if top_strengths else "")
+    )
+    return {
+        "listing_id": str(listing_id),
+        "review_count": len(comments),
+        "sentiment": sentiment,
+        "overall": overall,
+        "strengths": top_strengths,
+        "weaknesses": top_weaknesses,
+        "servable": False,
+    }
+
+
+# Stored with every summary's source hash; bump when the lexicon, aspects or output change
+lexicon_summary.version = "lexicon-2"
+
+
+class OpenAISummarizer:
+    """Model-written summaries with the same fields as lexicon_summary.
+
+    `client` is an AsyncOpenAI client, normally the shared scheduled one: its calls run at
+    background priority on one event loop thread, which the batch job's worker threads wait on.
+    """
+
+    # Bump when the prompt or output fields change
+    PROMPT_VERSION = 1
+
+    def __init__(self, client, model="gpt-4o-mini", max_chars=12000):
+        self.client = client
+        self.model = model
+        self.max_chars = max_chars
+        self.version = f"openai-{model}-{self.PROMPT_VERSION}-{max_chars}"
+        # The scheduler and async client belong to a single event loop
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+
+    def __call__(self, listing_id, comments):
+        return asyncio.run_coroutine_threadsafe(self.summarise(listing_id, comments), self._loop).result()
+
+    async def summarise(self, listing_id, comments):
+        reviews = "\n".join(comments)[:self.max_chars]
+        with request_priority("background"):
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                response_format={"type": "json_object"},
+                messages=[
+                    {"role": "system", "content": (
+                        "Summarise Airbnb guest reviews. Reply with JSON: {\"overall\": one sentence, "
+                        "\"strengths\": [short phrases], \"weaknesses\": [short phrases], "
+                        "\"score\": recommendation score 1.0-10, \"sentiment\": \"Positive\"|\"Negative\"|\"Mixed\"}"
+                    )},
+                    {"role": "user", "content": reviews},
+                ],
+            )
+        summary = json.loads(response.choices[0].message.content)
+        return {
+            "listing_id": str(listing_id),
+            "review_count": len(comments),
+            "score": float(summary.get("score", 5.0)),
+            "sentiment": summary.get("sentiment", "Mixed"),
+            "overall": summary.get("overall", ""),
+            "strengths": list(summary.get("strengths", [])),
+            "weaknesses": list(summary.get("weaknesses", [])),
+            "servable": True,
+        }
+
+
+def build_review_summaries(store, table, summarizer=lexicon_summary, workers=8, batch_size=200):
+    """Summarise listings whose reviews or summarizer changed since the last run; returns (updated, unchanged, removed)"""
+    existing = table.source_hashes()
+    # Switching between the lexicon and a model, or changing either, resummarises every listing
+    version = getattr(summarizer, "version", getattr(summarizer, "__name__", type(summarizer).__name__))
+    updated = unchanged = 0
+
+    def summarise(item):
+        listing_id, comments, source_hash = item
+        return source_hash, summarizer(listing_id, comments)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batch = []
+        for listing_id in store.listing_ids():
+            comments = store.comments(listing_id)
+            source_hash = content_hash("\n".join([version, *comments]))
+            if existing.get(listing_id) == source_hash:
+                unchanged += 1
+                continue
+            batch.append((listing_id, comments, source_hash))
+            if len(batch) == batch_size:
+                table.put_many(list(executor.map(summarise, batch)))
+                updated += len(batch)
+                print(f"Summarised {updated} listings")
+                batch = []
+        if batch:
+            table.put_many(list(executor.map(summarise, batch)))
+            updated += len(batch)
+
+    removed = table.delete_missing(store.listing_ids())
+    return updated, unchanged, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute review summaries for every listing")
+    parser.add_argument("--reviews", default=REVIEWS_JSON, help="Reviews JSON lines file")
+    parser.add_argument("--output", default=SUMMARIES_DB, help="SQLite summary table")
+    parser.add_argument("--openai", action="store_true", help="Summarise with gpt-4o-mini instead of the local lexicon")
+    args = parser.parse_args()
+
+    summarizer = lexicon_summary
+    if args.openai:
+        from agent_registry import load_secrets, registry
+        secrets = load_secrets()
+        # Same rate-limited, retrying scheduler and [scheduler] settings as the app, at background priority
+        settings = {key: value for key, value in secrets.get("scheduler", {}).items()
+                    if key not in ("enabled", "coalesce_queries")}
+        client = registry.async_openai_client(secrets.get("openai", {}).get("api_key"), registry.request_scheduler(**settings))
+        summarizer = OpenAISummarizer(client)
+
+    updated, unchanged, removed = build_review_summaries(ReviewStore(args.reviews), ReviewSummaryTable(args.output), summarizer)
+    print(f"✅ Review summaries ready: {updated} updated, {unchanged} unchanged, {removed} removed.")
+
+
+if __name__ == "__main__":
+    main()
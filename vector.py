@@ -1,13 +1,212 @@
+import io
 import os
 import json
 import re
+import time
+import math
+import asyncio
+import threading
 import streamlit as st
-import ast  # for safely parsing stringified lists
+from types import SimpleNamespace
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from airbnb_data import (parse_amenities, iter_json_lines, index_review_offsets, content_hash, split_comments,
+                         CHUNK_ID_SEPARATOR)
+
+# Separates the documents (and the chunks of a document) written into the same shard file
+DOCUMENT_SEPARATOR = "\n\n---\n\n"
+
+# Hosted vector stores split files into chunks of this size; our chunks are shorter, so a
+# file_search result holds one or two of them instead of several whole listings
+HOSTED_CHUNKING = {"type": "static", "static": {"max_chunk_size_tokens": 400, "chunk_overlap_tokens": 100}}
+
+DATA_TYPES = ("listings", "reviews")
+DEFAULT_CITY = "sydney"
+
+
+def dataset_paths(city, data_type, data_dir="data"):
+    """Source JSON and ingestion state files of one city's listings or reviews"""
+    # Sydney's state files predate multi-city support and keep their original names
+    prefix = "" if city == DEFAULT_CITY else f"{city}_"
+    return {
+        "source": os.path.join(data_dir, f"{city}_{data_type}.json"),
+        "text_dir": os.path.join(data_dir, f"{prefix}{data_type}_files"),
+        "manifest": os.path.join(data_dir, f"{prefix}{data_type}_manifest.json"),
+        "upload_log": os.path.join(data_dir, f"{prefix}{data_type}_uploaded_files.json"),
+        "checkpoint": os.path.join(data_dir, f"{prefix}{data_type}_checkpoint.json"),
+    }
+
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _batch_failure(file_batch):
+    """Why a polled file batch did not index all of its files, or None when it did"""
+    failed = getattr(getattr(file_batch, "file_counts", None), "failed", 0) or 0
+    if file_batch.status != "completed" or failed:
+        return f"file batch {file_batch.status} with {failed} failed files"
+    return None
+
+
+def vector_store_name(city, data_type):
+    """Name of the vector store holding a city's listings or reviews"""
+    label = "Airbnb Listings" if data_type == "listings" else "Airbnb Reviews"
+    return label if city == DEFAULT_CITY else f"{label} ({city.replace('_', ' ').title()})"
+
+
+# (api_key, vector store name) -> vector store, shared by every manager in the process
+_vector_store_cache = {}
+_vector_store_cache_lock = threading.Lock()
+
+
+def find_vector_stores(client, names, create=True):
+    """Map each name to its vector store, listing the account's stores at most once per process.
+
+    Missing stores are created unless `create` is False.
+    """
+    api_key = getattr(client, "api_key", None)
+    with _vector_store_cache_lock:
+        missing = [name for name in names if (api_key, name) not in _vector_store_cache]
+        if missing:
+            print(f"Looking up vector stores: {', '.join(missing)}")
+            # Iterating the cursor page follows every page, not just the first 20 stores
+            for vs in client.vector_stores.list(limit=100):
+                if vs.name in missing:
+                    _vector_store_cache.setdefault((api_key, vs.name), vs)
+            for name in missing:
+                if (api_key, name) not in _vector_store_cache and create:
+                    vs = client.vector_stores.create(name=name)
+                    print(f"Created {name} vector store with ID: {vs.id}")
+                    _vector_store_cache[(api_key, name)] = vs
+        return {name: _vector_store_cache[(api_key, name)] for name in names if (api_key, name) in _vector_store_cache}
+
+
+async def find_vector_stores_async(client, names, create=True):
+    """find_vector_stores() for an AsyncOpenAI client, sharing the same process-wide cache"""
+    api_key = getattr(client, "api_key", None)
+    missing = [name for name in names if (api_key, name) not in _vector_store_cache]
+    if missing:
+        print(f"Looking up vector stores: {', '.join(missing)}")
+        async for vs in client.vector_stores.list(limit=100):
+            if vs.name in missing:
+                _vector_store_cache.setdefault((api_key, vs.name), vs)
+        for name in missing:
+            if (api_key, name) not in _vector_store_cache and create:
+                vs = await client.vector_stores.create(name=name)
+                print(f"Created {name} vector store with ID: {vs.id}")
+                _vector_store_cache.setdefault((api_key, name), vs)
+    return {name: _vector_store_cache[(api_key, name)] for name in names if (api_key, name) in _vector_store_cache}
+
+
+def chunk_listing(entry, idx=0):
+    """Split a listing record into facts, description, neighbourhood and amenities chunks.
+
+    Returns (listing_id, [(chunk_id, text), ...]); every chunk starts with the listing ID and name
+    so it can be retrieved, and attributed, on its own.
+    """
+    entry_id = str(entry.get("id", f"unknown_{idx}"))
+    name = entry.get("name", "No Title")
+    url = entry.get("listing_url", f"https://www.airbnb.com/rooms/{entry_id}")
+    neighborhood = entry.get("neighbourhood_cleansed", "Unknown neighborhood")
+    amenities_str = ", ".join(str(a) for a in parse_amenities(entry.get("amenities", "[]")))
+    header = f"Listing ID: {entry_id}\nName: {name}"
+
+    facts = f"""Listing ID: {entry_id}
+Airbnb URL: {url}
+Name: {name}
+Room Type: {entry.get("room_type", "Unknown room type")}
+Property Type: {entry.get("property_type", "Unknown property type")}
+Accommodates: {entry.get("accommodates", "Unknown")}
+Bedrooms: {entry.get("bedrooms", "N/A")}
+Beds: {entry.get("beds", "N/A")}
+Bathrooms: {entry.get("bathrooms_text", "N/A")}
+Price: {entry.get("price", "No price provided")}
+Location: {neighborhood}
+Minimum Nights: {entry.get("minimum_nights", "N/A")}
+Maximum Nights: {entry.get("maximum_nights", "N/A")}
+Reviews: {entry.get("number_of_reviews", 0)}
+Availability: Available for {entry.get("availability_365", 0)} days per year"""
+
+    chunks = [(f"{entry_id}{CHUNK_ID_SEPARATOR}facts", facts)]
+    sections = (
+        ("description", "Description", entry.get("description")),
+        ("neighbourhood", f"Neighborhood Overview ({neighborhood})", entry.get("neighborhood_overview")),
+        ("amenities", "Amenities", amenities_str),
+    )
+    for section, title, body in sections:
+        if body:
+            chunks.append((f"{entry_id}{CHUNK_ID_SEPARATOR}{section}", f"{header}\n\n{title}\n{body}"))
+    return entry_id, chunks
+
+
+def chunk_reviews(listing_id, comments):
+    """Split the review rows of a listing into one chunk per comment, returning (listing_id, [(chunk_id, text), ...])"""
+    listing_id = str(listing_id)
+    texts = [comment for row in comments for comment in split_comments(row)]
+    return listing_id, [
+        (f"{listing_id}{CHUNK_ID_SEPARATOR}review-{n}", f"Listing ID: {listing_id}\nReview: {text}")
+        for n, text in enumerate(texts, start=1)
+    ]
+
+
+def render_chunks(chunks):
+    """Text of a whole document: its chunks, separated like documents so they never run together"""
+    return DOCUMENT_SEPARATOR.join(text for _, text in chunks)
+
+
+def iter_listing_chunks(json_file):
+    """Stream (listing_id, chunks) for every listing"""
+    for idx, entry in enumerate(iter_json_lines(json_file)):
+        yield chunk_listing(entry, idx)
+
+
+def iter_review_chunks(json_file):
+    """Stream (listing_id, chunks) for every listing with at least one review comment"""
+    offsets = index_review_offsets(json_file)
+    with open(json_file, 'rb') as f:
+        for listing_id, positions in offsets.items():
+            comments = []
+            for position in positions:
+                f.seek(position)
+                comments.append(json.loads(f.readline()).get("comments"))
+            listing_id, chunks = chunk_reviews(listing_id, comments)
+            if chunks:
+                yield listing_id, chunks
+
+
+def iter_shards(documents, records_per_shard):
+    """Group a stream of documents into lists of at most `records_per_shard` documents"""
+    documents = iter(documents)
+    while True:
+        shard = list(islice(documents, records_per_shard))
+        if not shard:
+            return
+        yield shard
+
+
+def run_ingestion_job(city, data_type, vector_store_id=None, client_factory=None, dry_run=False, **manager_options):
+    """Process pool entry point: ingest one city's listings or reviews, or only plan it for a dry run"""
+    client = client_factory() if client_factory and not dry_run else None
+    manager = VectorStoreManager(client, city=city, **manager_options)
+    if dry_run:
+        return manager.plan(data_type)
+    return manager.ingest(SimpleNamespace(id=vector_store_id), data_type)
+
 
 class VectorStoreManager:
     
-    def __init__(self, client):
+    def __init__(self, client, batch_size=20, max_concurrent_batches=4, records_per_shard=50, city=DEFAULT_CITY):
         self.client = client
+        # Every path and vector store name is derived from the city, e.g. data/melbourne_listings.json
+        self.city = city
+        # Files are grouped into batches of `batch_size` and up to
+        # `max_concurrent_batches` batches are uploaded at the same time.
+        self.batch_size = max(1, batch_size)
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        # Number of listing/review documents written into each text shard
+        self.records_per_shard = max(1, records_per_shard)
 
     def set_airbnb_vector_stores(self):
         """Setting Airbnb Listings and Reviews knowledge base"""
@@ -16,196 +215,549 @@ class VectorStoreManager:
         if not self._ensure_client():
             return None
 
-        listing_vector_store = None
-        review_vector_store = None
-
         try:
-            # Listings
-            listing_vector_store = st.session_state.get("airbnb_listing_vector_store", None)
-            if not listing_vector_store:
-                print("Checking Listing Vector Store...")
-                listing_vector_stores = self.client.vector_stores.list()
-                if listing_vector_stores and listing_vector_stores.data:
-                    for vs in listing_vector_stores.data:
-                        if vs.name == 'Airbnb Listings':
-                            listing_vector_store = vs
-                            st.session_state["airbnb_listing_vector_store"] = listing_vector_store
-                            break
-                if not listing_vector_store:
-                    print("Creating new Airbnb Listings vector store...")
-                    listing_vector_store = self.client.vector_stores.create(name="Airbnb Listings")
-                    st.session_state["airbnb_listing_vector_store"] = listing_vector_store
-                    print(f"Created Airbnb Listings vector store with ID: {listing_vector_store.id}")
-
-            # Reviews
-            review_vector_store = st.session_state.get("airbnb_review_vector_store", None)
-            if not review_vector_store:
-                print("Checking Review Vector Store...")
-                review_vector_stores = self.client.vector_stores.list()
-                if review_vector_stores and review_vector_stores.data:
-                    for vs in review_vector_stores.data:
-                        if vs.name == 'Airbnb Reviews':
-                            review_vector_store = vs
-                            st.session_state["airbnb_review_vector_store"] = review_vector_store
-                            break
-                if not review_vector_store:
-                    print("Creating new Airbnb Reviews vector store...")
-                    review_vector_store = self.client.vector_stores.create(name="Airbnb Reviews")
-                    st.session_state["airbnb_review_vector_store"] = review_vector_store
-                    print(f"Created Airbnb Reviews vector store with ID: {review_vector_store.id}")
+            suffix = "" if self.city == DEFAULT_CITY else f"_{self.city}"
+            session_keys = {
+                "listings": f"airbnb_listing_vector_store{suffix}",
+                "reviews": f"airbnb_review_vector_store{suffix}",
+            }
+            vector_stores = {data_type: st.session_state.get(key, None) for data_type, key in session_keys.items()}
+
+            # One lookup for both stores, cached for the rest of the process
+            missing = [data_type for data_type, vs in vector_stores.items() if not vs]
+            if missing:
+                print("Checking vector stores...")
+                found = find_vector_stores(self.client, [vector_store_name(self.city, t) for t in missing])
+                for data_type in missing:
+                    vector_stores[data_type] = found[vector_store_name(self.city, data_type)]
+                    st.session_state[session_keys[data_type]] = vector_stores[data_type]
 
             # Upload Files
-            self._upload_files(listing_vector_store, "listings")
-            self._upload_files(review_vector_store, "reviews")
+            for data_type in DATA_TYPES:
+                self.ingest(vector_stores[data_type], data_type)
 
         except Exception as e:
             print(f"Error creating/checking vector stores: {e}")
             st.error(f"Failed to setup Airbnb vector stores: {str(e)}")
             return None
 
+    def ingest(self, vector_store, data_type):
+        """Convert and upload one data type, tracking progress in a checkpoint file.
+
+        A run whose source file is unchanged since the last complete run is skipped; an interrupted
+        run resumes from the manifest and upload log, which are saved after every batch.
+        """
+        checkpoint = self._start_checkpoint(vector_store, data_type)
+        if checkpoint.get("skipped"):
+            return checkpoint
+        started = time.perf_counter()
+        results = self._upload_files(vector_store, data_type)
+        return self._finish_checkpoint(checkpoint, results, started)
+
+    async def ingest_async(self, vector_store, data_type):
+        """ingest() with an AsyncOpenAI client: file work runs in worker threads and API calls are awaited"""
+        checkpoint = await asyncio.to_thread(self._start_checkpoint, vector_store, data_type)
+        if checkpoint.get("skipped"):
+            return checkpoint
+        started = time.perf_counter()
+        results = await self._upload_files_async(vector_store, data_type)
+        return await asyncio.to_thread(self._finish_checkpoint, checkpoint, results, started)
+
+    def _start_checkpoint(self, vector_store, data_type):
+        """The new "uploading" checkpoint of a run, or the last one marked skipped when nothing changed"""
+        paths = self._paths(data_type)
+        checkpoint = self._load_checkpoint(paths["checkpoint"])
+        source = self._source_fingerprint(paths["source"])
+        job = f"{self.city} {data_type}"
+
+        # Replaced shards whose deletion failed are retried even when the source is unchanged
+        stale_shards = self._load_manifest(paths["manifest"])["stale_shards"]
+        if (checkpoint.get("stage") == "complete" and checkpoint.get("source") == source
+                and checkpoint.get("vector_store_id") == vector_store.id and not stale_shards):
+            print(f"{job}: source unchanged since {checkpoint['updated']}, skipping")
+            return dict(checkpoint, skipped=True)
+        if checkpoint.get("stage") == "uploading":
+            print(f"{job}: resuming interrupted run started {checkpoint['started']}")
+        elif stale_shards:
+            print(f"{job}: {len(stale_shards)} replaced files still to delete")
+
+        checkpoint = {
+            "city": self.city,
+            "data_type": data_type,
+            "stage": "uploading",
+            "source": source,
+            "vector_store_id": vector_store.id,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self._write_json(paths["checkpoint"], checkpoint)
+        return checkpoint
+
+    def _finish_checkpoint(self, checkpoint, results, started):
+        failed = None if results is None else [r for r in results if r["status"] == "error"]
+        paths = self._paths(checkpoint["data_type"])
+        # A run is only complete once the shards it replaced are gone from the vector store too
+        stale_shards = self._load_manifest(paths["manifest"])["stale_shards"]
+        checkpoint.update({
+            "stage": "complete" if results is not None and not failed and not stale_shards else "failed",
+            "stale_shards": len(stale_shards),
+            "batches": len(results or []),
+            "failed_batches": len(failed) if failed is not None else None,
+            "files_uploaded": sum(r["files"] for r in results or [] if r["status"] != "error"),
+            "seconds": round(time.perf_counter() - started, 3),
+            "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+        self._write_json(paths["checkpoint"], checkpoint)
+        return checkpoint
+
+    def plan(self, data_type):
+        """Dry run: the documents and bytes the next run would render and upload, without writing anything"""
+        paths = self._paths(data_type)
+        manifest = self._load_manifest(paths["manifest"])
+        uploaded_files = self._load_upload_log(paths["upload_log"])
+
+        current, sizes, chunk_count = {}, {}, 0
+        for listing_id, chunks in self._iter_chunks(data_type):
+            text = render_chunks(chunks)
+            current[listing_id] = content_hash(text)
+            sizes[listing_id] = len(text.encode("utf-8"))
+            chunk_count += len(chunks)
+        changed, removed, affected_shards, untracked_shards, to_render = self._diff_documents(
+            manifest, current, paths["text_dir"])
+
+        # Shards rendered by an interrupted run but not uploaded yet
+        stale = affected_shards | untracked_shards
+        existing = sorted(os.listdir(paths["text_dir"])) if os.path.isdir(paths["text_dir"]) else []
+        pending = [f for f in existing if f not in uploaded_files and f not in stale]
+        pending_bytes = sum(os.path.getsize(os.path.join(paths["text_dir"], f)) for f in pending)
+
+        shards = math.ceil(len(to_render) / self.records_per_shard)
+        render_bytes = sum(sizes[i] for i in to_render) + len(DOCUMENT_SEPARATOR.encode()) * max(0, len(to_render) - shards)
+        checkpoint = self._load_checkpoint(paths["checkpoint"])
+        return {
+            "city": self.city,
+            "data_type": data_type,
+            "source": paths["source"],
+            "vector_store": vector_store_name(self.city, data_type),
+            "documents": len(current),
+            "chunks": chunk_count,
+            "source_bytes": sum(sizes.values()),
+            "new_or_changed": len(changed),
+            "removed": len(removed),
+            "documents_to_render": len(to_render),
+            "files_to_upload": shards + len(pending),
+            "bytes_to_upload": render_bytes + pending_bytes,
+            "files_to_delete": len(stale | set(manifest["stale_shards"])),
+            "checkpoint_stage": checkpoint.get("stage"),
+        }
+
+    def _paths(self, data_type):
+        if data_type not in DATA_TYPES:
+            raise ValueError(f"Invalid data type specified: {data_type}")
+        return dataset_paths(self.city, data_type)
+
+    def _source_fingerprint(self, source_path):
+        """Size and modification time of a source JSON file"""
+        stat = os.stat(source_path)
+        return {"bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _load_checkpoint(self, checkpoint_path):
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, 'r') as f:
+                return json.load(f)
+        return {}
+
     def _upload_files(self, vector_store, data_type):
-        """Upload files to a specific vector store (listings or reviews) and skip already uploaded ones."""
-        print(f"Uploading files for {data_type}...")
+        """Upload files to a specific vector store (listings or reviews) in concurrent batches and skip already uploaded ones."""
+        upload = self._prepare_upload(data_type)
+        if upload is None:
+            return None
 
-        kb_text_path = f'data/{data_type}_files'
-        os.makedirs(kb_text_path, exist_ok=True)
+        batches = upload["batches"]
+        batch_results = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_batches) as executor:
+            futures = {
+                executor.submit(self._upload_batch, vector_store, upload["text_dir"], batch): batch_no
+                for batch_no, batch in enumerate(batches, start=1)
+            }
+            # Results are collected on this thread only, so the log is never written concurrently
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = e
+                self._record_batch(upload, futures[future], result, batch_results)
 
-        if not os.path.exists(kb_text_path) or not any(os.path.isfile(os.path.join(kb_text_path, f)) for f in os.listdir(kb_text_path)):
-            print(f"Converting {data_type} JSON to text files...")
-            self._convert_json_to_text_airbnb(data_type)
-
-        uploaded_log_path = f'data/{data_type}_uploaded_files.json'
-        if os.path.exists(uploaded_log_path):
-            with open(uploaded_log_path, 'r') as f:
-                uploaded_files = set(json.load(f))
-        else:
-            uploaded_files = set()
-
-        file_count = 0
-        for filename in os.listdir(kb_text_path):
-            if filename in uploaded_files:
-                print(f"Skipping already uploaded file: {filename}")
-                continue
+        if self._finish_upload(upload, batch_results):
+            self._delete_stale_files(vector_store, upload)
+        return sorted(batch_results, key=lambda r: r["batch"])
 
-            file_path = os.path.join(kb_text_path, filename)
-            if os.path.exists(file_path):
+    async def _upload_files_async(self, vector_store, data_type):
+        """_upload_files() with an AsyncOpenAI client; at most `max_concurrent_batches` batches are in flight"""
+        upload = await asyncio.to_thread(self._prepare_upload, data_type)
+        if upload is None:
+            return None
+
+        semaphore = asyncio.Semaphore(self.max_concurrent_batches)
+
+        async def upload_batch(batch_no, batch):
+            async with semaphore:
                 try:
-                    with open(file_path, "rb") as file:
-                        print(f"Uploading file: {filename}")
-                        file_batch = self.client.vector_stores.file_batches.upload_and_poll(
-                            vector_store_id=vector_store.id,
-                            files=[file]
-                        )
-                        uploaded_files.add(filename)
-                        file_count += 1
-                        print(f"Uploaded {filename} - Status: {file_batch.status}")
+                    return batch_no, await self._upload_batch_async(vector_store, upload["text_dir"], batch)
                 except Exception as e:
-                    print(f"Error uploading {filename}: {e}")
+                    return batch_no, e
 
-        with open(uploaded_log_path, 'w') as f:
-            json.dump(list(uploaded_files), f)
+        batch_results = []
+        pending = [upload_batch(batch_no, batch) for batch_no, batch in enumerate(upload["batches"], start=1)]
+        for next_done in asyncio.as_completed(pending):
+            batch_no, result = await next_done
+            await asyncio.to_thread(self._record_batch, upload, batch_no, result, batch_results)
 
-        print(f"Upload complete for {data_type}. Total new files uploaded: {file_count}")
+        if await asyncio.to_thread(self._finish_upload, upload, batch_results):
+            await self._delete_stale_files_async(vector_store, upload)
+        return sorted(batch_results, key=lambda r: r["batch"])
 
-    def _convert_json_to_text_airbnb(self, data_type):
-        """Convert Airbnb Listings or Reviews JSON to individual text files with metadata"""
-        try:
-            if data_type == "listings":
-                json_file = 'data/sydney_listings.json'
-                kb_text_path = 'data/listings_files'
-            elif data_type == "reviews":
-                json_file = 'data/sydney_reviews.json'
-                kb_text_path = 'data/reviews_files'
-            else:
-                print("Invalid data type specified.")
-                return
-
-            with open(json_file, 'r') as f:
-                data = [json.loads(line) for line in f]
+    def _prepare_upload(self, data_type):
+        """Re-render changed shards and work out the batches still to upload; None when rendering failed"""
+        print(f"Uploading files for {data_type}...")
 
-            os.makedirs(kb_text_path, exist_ok=True)
+        paths = self._paths(data_type)
+        kb_text_path = paths["text_dir"]
+        os.makedirs(kb_text_path, exist_ok=True)
 
-            for idx, entry in enumerate(data):
-                if data_type == "listings":
-                    metadata = entry.get("metadata", {})
-                    entry_id = str(entry.get("id", f"unknown_{idx}"))
-                    name = entry.get("name", "No Title")
-                    url = entry.get("listing_url", f"https://www.airbnb.com/rooms/{entry_id}")
-                    description = entry.get("description", "No description")
-                    neighborhood = entry.get("neighbourhood_cleansed", "Unknown neighborhood")
-                    property_type = entry.get("property_type", "Unknown property type")
-                    room_type = entry.get("room_type", "Unknown room type")
-                    accommodates = entry.get("accommodates", "Unknown")
-                    price = entry.get("price", "No price provided")
-                    amenities_raw = entry.get("amenities", "[]")
-                    try:
-                        amenities_list = ast.literal_eval(amenities_raw)
-                    except Exception:
-                        amenities_list = [amenities_raw]
-                    amenities_str = ", ".join(amenities_list)
-
-                    num_reviews = entry.get("number_of_reviews", 0)
-                    availability = entry.get("availability_365", 0)
-                    bedrooms = entry.get("bedrooms", "N/A")
-                    beds = entry.get("beds", "N/A")
-                    bathrooms = entry.get("bathrooms_text", "N/A")
-                    min_nights = entry.get("minimum_nights", "N/A")
-                    max_nights = entry.get("maximum_nights", "N/A")
-                    neighborhood_overview = entry.get("neighborhood_overview", "No neighborhood overview")
-
-                    text = f"""
-Listing ID: {entry_id}
-Airbnb URL: {url}
-Name: {name}
-Room Type: {room_type}
-Property Type: {property_type}
-Accommodates: {accommodates}
-Bedrooms: {bedrooms}
-Beds: {beds}
-Bathrooms: {bathrooms}
-Price: {price}
-Location: {neighborhood}
-Minimum Nights: {min_nights}
-Maximum Nights: {max_nights}
+        manifest = self._sync_documents(data_type, paths["manifest"])
+        if manifest is None:
+            return None
 
-Description
-{description}
+        uploaded_files = self._load_upload_log(paths["upload_log"])
+        pending = [
+            filename for filename in sorted(os.listdir(kb_text_path))
+            if filename not in uploaded_files and os.path.isfile(os.path.join(kb_text_path, filename))
+        ]
+        print(f"Skipping {len(uploaded_files)} already uploaded files, {len(pending)} files to upload.")
+
+        return {
+            "data_type": data_type,
+            "text_dir": kb_text_path,
+            "manifest": manifest,
+            "manifest_path": paths["manifest"],
+            "uploaded_files": uploaded_files,
+            "upload_log": paths["upload_log"],
+            "batches": [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)],
+        }
+
+    def _record_batch(self, upload, batch_no, result, batch_results):
+        """Add a finished batch (its result dict or the exception it raised) to the results and the upload log"""
+        batches = upload["batches"]
+        if isinstance(result, Exception):
+            print(f"Error uploading batch {batch_no}/{len(batches)}: {result}")
+            batch_results.append({"batch": batch_no, "files": len(batches[batch_no - 1]), "status": "error", "error": str(result)})
+            return
+
+        upload["uploaded_files"].update(result.pop("file_ids"))
+        self._write_json(upload["upload_log"], upload["uploaded_files"])
+
+        result["batch"] = batch_no
+        batch_results.append(result)
+        print(f"Uploaded batch {batch_no}/{len(batches)} ({result['files']} files) - "
+              f"Status: {result['status']} in {result['seconds']:.2f}s")
+
+    def _finish_upload(self, upload, batch_results):
+        """Save the upload log; True when every batch succeeded and the replaced shards can be deleted"""
+        self._write_json(upload["upload_log"], upload["uploaded_files"])
+        file_count = sum(result["files"] for result in batch_results if result["status"] != "error")
+        print(f"Upload complete for {upload['data_type']}. Total new files uploaded: {file_count}")
+
+        # Replaced shards are only removed once every new shard is in the vector store
+        if any(result["status"] == "error" for result in batch_results):
+            print(f"Keeping {len(upload['manifest']['stale_shards'])} stale {upload['data_type']} files until all uploads succeed")
+            return False
+        return True
 
-Neighborhood Overview
-{neighborhood_overview}
+    def _upload_batch(self, vector_store, kb_text_path, filenames):
+        """Upload one batch of files and attach them to the vector store in a single file batch."""
+        started = time.perf_counter()
+        file_ids = {}
+        for filename in filenames:
+            with open(os.path.join(kb_text_path, filename), "rb") as file:
+                uploaded = self.client.files.create(file=file, purpose="assistants")
+            file_ids[filename] = uploaded.id
+
+        file_batch = self.client.vector_stores.file_batches.create_and_poll(
+            vector_store_id=vector_store.id,
+            file_ids=list(file_ids.values()),
+            chunking_strategy=HOSTED_CHUNKING,
+        )
+        failure = _batch_failure(file_batch)
+        if failure:
+            # Detach the whole batch, so the retry on the next run does not index its files twice
+            for file_id in file_ids.values():
+                try:
+                    self.client.vector_stores.files.delete(file_id, vector_store_id=vector_store.id)
+                    self.client.files.delete(file_id)
+                except Exception as e:
+                    print(f"Error discarding file {file_id} of a failed batch: {e}")
+            raise RuntimeError(failure)
+        return {
+            "files": len(filenames),
+            "status": file_batch.status,
+            "seconds": time.perf_counter() - started,
+            "file_ids": file_ids,
+        }
+
+    async def _upload_batch_async(self, vector_store, kb_text_path, filenames):
+        """_upload_batch() with an AsyncOpenAI client; the files of a batch are uploaded concurrently"""
+        started = time.perf_counter()
+
+        async def upload_file(filename):
+            file = io.BytesIO(await asyncio.to_thread(_read_bytes, os.path.join(kb_text_path, filename)))
+            file.name = filename
+            uploaded = await self.client.files.create(file=file, purpose="assistants")
+            return filename, uploaded.id
+
+        file_ids = dict(await asyncio.gather(*(upload_file(filename) for filename in filenames)))
+        file_batch = await self.client.vector_stores.file_batches.create_and_poll(
+            vector_store_id=vector_store.id,
+            file_ids=list(file_ids.values()),
+            chunking_strategy=HOSTED_CHUNKING,
+        )
+        failure = _batch_failure(file_batch)
+        if failure:
+            async def discard(file_id):
+                try:
+                    await self.client.vector_stores.files.delete(file_id, vector_store_id=vector_store.id)
+                    await self.client.files.delete(file_id)
+                except Exception as e:
+                    print(f"Error discarding file {file_id} of a failed batch: {e}")
+            await asyncio.gather(*(discard(file_id) for file_id in file_ids.values()))
+            raise RuntimeError(failure)
+        return {
+            "files": len(filenames),
+            "status": file_batch.status,
+            "seconds": time.perf_counter() - started,
+            "file_ids": file_ids,
+        }
+
+    def _load_upload_log(self, uploaded_log_path):
+        """Load the upload log as a filename -> vector store file ID mapping."""
+        if not os.path.exists(uploaded_log_path):
+            return {}
+        with open(uploaded_log_path, 'r') as f:
+            uploaded = json.load(f)
+        # Older logs are a plain list of filenames without file IDs
+        if isinstance(uploaded, list):
+            return {filename: None for filename in uploaded}
+        return uploaded
+
+    def _write_json(self, path, data):
+        """Write a JSON state file atomically so an interrupted run never leaves it half written."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _load_manifest(self, manifest_path):
+        """Load the listing ID -> {hash, shard} manifest of the rendered documents."""
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                return json.load(f)
+        return {"next_shard": 0, "records": {}, "stale_shards": []}
+
+    def _sync_documents(self, data_type, manifest_path):
+        """Re-render only the shards holding new, changed or removed records and mark the replaced shards as stale."""
+        kb_text_path = self._paths(data_type)["text_dir"]
+        manifest = self._load_manifest(manifest_path)
+        records = manifest["records"]
 
-Amenities
-{amenities_str}
+        try:
+            current = {listing_id: content_hash(text) for listing_id, text in self._iter_documents(data_type)}
+        except Exception as e:
+            print(f"Error hashing {data_type} records: {e}")
+            return None
 
-Reviews: {num_reviews}
-Availability: Available for {availability} days per year
-""".strip()
+        changed, removed, affected_shards, untracked_shards, to_render = self._diff_documents(manifest, current, kb_text_path)
 
-                    file_path = os.path.join(kb_text_path, f"{entry_id}.txt")
+        if not changed and not removed and not untracked_shards:
+            print(f"No {data_type} changes detected, {len(current)} records up to date")
+            return manifest
 
-                elif data_type == "reviews":
-                    metadata = entry.get("metadata", {})
-                    entry_id = str(entry.get("listing_id", f"unknown_{idx}"))
-                    review_text = entry.get("comments", "No comment provided.")
+        written = self._convert_json_to_text_airbnb(data_type, only_ids=to_render, first_shard=manifest["next_shard"])
+        if written is None:
+            return None
 
-                    text = f"""Listing ID: {entry_id}
+        for listing_id in removed:
+            del records[listing_id]
+        for listing_id, shard in written.items():
+            records[listing_id] = {"hash": current[listing_id], "shard": shard}
+        manifest["next_shard"] += len(set(written.values()))
 
-Review
-{review_text}
-""".strip()
+        stale_shards = affected_shards | untracked_shards
+        for filename in stale_shards:
+            file_path = os.path.join(kb_text_path, filename)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        manifest["stale_shards"] = sorted(set(manifest["stale_shards"]) | stale_shards)
+        self._write_json(manifest_path, manifest)
+
+        print(f"{data_type}: {len(changed)} new or changed, {len(removed)} removed; "
+              f"re-rendered {len(to_render)} records, {len(stale_shards)} shards replaced")
+        return manifest
+
+    def _diff_documents(self, manifest, current, kb_text_path):
+        """Compare listing ID -> hash of the source with the manifest.
+
+        Returns (changed, removed, affected_shards, untracked_shards, to_render).
+        """
+        records = manifest["records"]
+        changed = {listing_id for listing_id, digest in current.items() if records.get(listing_id, {}).get("hash") != digest}
+        removed = set(records) - set(current)
+        affected_shards = {records[listing_id]["shard"] for listing_id in changed | removed if listing_id in records}
+        # Files left by older runs that the manifest does not track are replaced as well
+        tracked_shards = {record["shard"] for record in records.values()}
+        existing = os.listdir(kb_text_path) if os.path.isdir(kb_text_path) else []
+        untracked_shards = {f for f in existing if f not in tracked_shards}
+        to_render = {
+            listing_id for listing_id in current
+            if listing_id in changed or records[listing_id]["shard"] in affected_shards
+        }
+        return changed, removed, affected_shards, untracked_shards, to_render
+
+    def _delete_stale_files(self, vector_store, upload):
+        """Remove replaced shards from the vector store and drop them from the upload log and manifest."""
+        stale_shards = upload["manifest"]["stale_shards"]
+        if not stale_shards:
+            return
+
+        uploaded_files = upload["uploaded_files"]
+        missing_ids = [f for f in stale_shards if f in uploaded_files and not uploaded_files[f]]
+        if missing_ids:
+            uploaded_files.update(self._lookup_file_ids(vector_store, missing_ids))
+
+        remaining = []
+        for filename in stale_shards:
+            file_id = uploaded_files.get(filename)
+            if file_id:
+                try:
+                    self.client.vector_stores.files.delete(file_id, vector_store_id=vector_store.id)
+                    self.client.files.delete(file_id)
+                except Exception as e:
+                    print(f"Error deleting stale file {filename}: {e}")
+                    remaining.append(filename)
+        self._forget_stale_files(upload, remaining)
+
+    async def _delete_stale_files_async(self, vector_store, upload):
+        """_delete_stale_files() with an AsyncOpenAI client, deleting the replaced shards concurrently"""
+        stale_shards = upload["manifest"]["stale_shards"]
+        if not stale_shards:
+            return
+
+        uploaded_files = upload["uploaded_files"]
+        missing_ids = [f for f in stale_shards if f in uploaded_files and not uploaded_files[f]]
+        if missing_ids:
+            uploaded_files.update(await self._lookup_file_ids_async(vector_store, missing_ids))
+
+        async def delete(filename):
+            file_id = uploaded_files.get(filename)
+            if not file_id:
+                return None
+            try:
+                await self.client.vector_stores.files.delete(file_id, vector_store_id=vector_store.id)
+                await self.client.files.delete(file_id)
+            except Exception as e:
+                print(f"Error deleting stale file {filename}: {e}")
+                return filename
+            return None
 
-                    file_path = os.path.join(kb_text_path, f"{entry_id}.txt")
+        remaining = [f for f in await asyncio.gather(*(delete(f) for f in stale_shards)) if f]
+        await asyncio.to_thread(self._forget_stale_files, upload, remaining)
 
-                if os.path.exists(file_path):
-                    print(f"File already exists: {file_path}")
-                    continue
+    def _forget_stale_files(self, upload, remaining):
+        """Drop the deleted shards from the upload log and keep only the `remaining` ones as stale"""
+        manifest, uploaded_files = upload["manifest"], upload["uploaded_files"]
+        stale_shards = manifest["stale_shards"]
+        for filename in stale_shards:
+            if filename in remaining:
+                continue
+            if filename in uploaded_files and not uploaded_files[filename]:
+                print(f"Could not find the vector store file for {filename}, leaving it in place")
+            uploaded_files.pop(filename, None)
+
+        manifest["stale_shards"] = list(remaining)
+        self._write_json(upload["upload_log"], uploaded_files)
+        self._write_json(upload["manifest_path"], manifest)
+        print(f"Deleted {len(stale_shards) - len(remaining)} stale files from the vector store")
+
+    def _lookup_file_ids(self, vector_store, filenames):
+        """Resolve vector store file IDs by filename for upload logs written before IDs were recorded."""
+        wanted = set(filenames)
+        found = {}
+        for vs_file in self.client.vector_stores.files.list(vector_store_id=vector_store.id):
+            filename = self.client.files.retrieve(vs_file.id).filename
+            if filename in wanted:
+                found[filename] = vs_file.id
+        return found
+
+    async def _lookup_file_ids_async(self, vector_store, filenames):
+        wanted = set(filenames)
+        found = {}
+        async for vs_file in self.client.vector_stores.files.list(vector_store_id=vector_store.id):
+            filename = (await self.client.files.retrieve(vs_file.id)).filename
+            if filename in wanted:
+                found[filename] = vs_file.id
+        return found
+
+    def build_local_index(self, data_type, index_dir=None, dim=512, ivf_lists=0):
+        """Build the offline vector index of a data type from the same documents uploaded to the vector store"""
+        from local_search import LOCAL_INDEX_DIR, HashingEmbedder, LocalVectorIndex
+
+        prefix = "" if self.city == DEFAULT_CITY else f"{self.city}_"
+        path = os.path.join(index_dir or LOCAL_INDEX_DIR, prefix + data_type)
+        started = time.perf_counter()
+        # Chunks are indexed individually; searches group them back by listing
+        index = LocalVectorIndex.build(
+            path, lambda: (chunk for _, chunks in self._iter_chunks(data_type) for chunk in chunks),
+            HashingEmbedder(dim=dim), ivf_lists=ivf_lists
+        )
+        print(f"Built local {data_type} index with {len(index.ids)} chunks in {time.perf_counter() - started:.2f}s")
+        return index
+
+    def _iter_chunks(self, data_type):
+        """Stream the (listing_id, [(chunk_id, text), ...]) chunked documents of a data type"""
+        source = self._paths(data_type)["source"]
+        if data_type == "listings":
+            return iter_listing_chunks(source)
+        return iter_review_chunks(source)
+
+    def _iter_documents(self, data_type):
+        """Stream the (listing_id, text) documents of a data type, each the rendered chunks of one listing"""
+        return ((listing_id, render_chunks(chunks)) for listing_id, chunks in self._iter_chunks(data_type))
+
+    def _convert_json_to_text_airbnb(self, data_type, only_ids=None, first_shard=0):
+        """Stream Airbnb Listings or Reviews JSON into text shard files of `records_per_shard` documents each.
+
+        Only records in `only_ids` are written when given. Returns a listing ID -> shard filename mapping.
+        """
+        try:
+            kb_text_path = self._paths(data_type)["text_dir"]
+            documents = self._iter_documents(data_type)
+            if only_ids is not None:
+                documents = (doc for doc in documents if doc[0] in only_ids)
+
+            os.makedirs(kb_text_path, exist_ok=True)
 
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(text)
-                print(f"Created text file: {file_path}")
+            written = {}
+            for shard_no, shard in enumerate(iter_shards(documents, self.records_per_shard), start=first_shard):
+                filename = f"{data_type}_{shard_no:05d}.txt"
+                with open(os.path.join(kb_text_path, filename), 'w', encoding='utf-8') as f:
+                    f.write(DOCUMENT_SEPARATOR.join(text for _, text in shard))
+                written.update((listing_id, filename) for listing_id, _ in shard)
+                print(f"Created shard file: {filename} ({len(shard)} records)")
+
+            print(f"Converted {len(written)} {data_type} records")
+            return written
 
         except Exception as e:
             print(f"Error converting JSON to text for {data_type}: {e}")
+            return None
 
     def _ensure_client(self):
         """Ensure client is valid (placeholder)"""